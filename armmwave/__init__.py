@@ -1,3 +1,9 @@
+from armmwave import cache
 from armmwave import core
+from armmwave import jit
 from armmwave import layer
 from armmwave import model
+from armmwave import optimize
+from armmwave import profiling
+from armmwave import stack
+from armmwave import store
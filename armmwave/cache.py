@@ -0,0 +1,223 @@
+"""
+This module contains the ``ResultCache`` class, an opt-in cache for the
+results of ``Model.run()``.
+
+Results are keyed by a hash of the model's calculation parameters (see
+`hash_params`), so two models with the same layers, frequencies, incident
+angle, and polarization share a cache entry, however they were built. The
+cache keeps the most recently used results in memory and, optionally, on
+disk as `.npz` files, evicting the least recently used results when either
+tier is full.
+
+Example
+-------
+>>> cache = ResultCache(maxsize=64)
+>>> results = model.run(cache=cache)  # calculated
+>>> results = model.run(cache=cache)  # read from the cache
+>>> cache.stats()['hits']
+1
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+# The entries of `Model._sim_params` that define the calculation. The
+# others (Snell angles, interface amplitudes) are derived from these.
+HASHED_PARAMS = ['rind', 'thick', 'tand', 'freq', 'theta0', 'pol',
+                 'halpern_layers']
+
+
+def hash_params(params):
+    """Hash the parameters of a calculation.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+
+    Returns
+    -------
+    key : str
+        A hex digest that is the same for any two sets of parameters that
+        give the same results.
+    """
+    digest = hashlib.sha256()
+    for name in HASHED_PARAMS:
+        val = params[name]
+        digest.update(name.encode())
+        if name == 'halpern_layers':
+            val = json.dumps({str(k):v for k, v in val.items()},
+                             sort_keys=True)
+            digest.update(val.encode())
+        elif name == 'pol':
+            digest.update(val.encode())
+        else:
+            val = np.ascontiguousarray(val, dtype=float)
+            digest.update(str(val.shape).encode())
+            digest.update(val.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """A least-recently-used cache of calculation results.
+
+    The cache is safe to share between threads.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The number of results to keep in memory. Default is 128.
+    path : str, optional
+        A directory for the on-disk tier. If not given, results are only
+        kept in memory.
+    max_disk_bytes : int, optional
+        The most space the on-disk tier may use, in bytes. If not given,
+        the on-disk tier is not limited. A result bigger than this on its
+        own is only kept in memory.
+    """
+    def __init__(self, maxsize=128, path=None, max_disk_bytes=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits':0, 'misses':0, 'memory_hits':0, 'disk_hits':0,
+                       'evictions':0}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'ResultCache(maxsize={}, path={!r})'.format(self.maxsize,
+                                                           self.path)
+
+    def __len__(self):
+        return len(self._memory)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or (
+                self.path is not None and os.path.exists(self._file(key)))
+
+    def get(self, key):
+        """Look up a result.
+
+        Parameters
+        ----------
+        key : str
+            The key, from `hash_params`.
+
+        Returns
+        -------
+        results : dict or None
+            A copy of the cached results, or None if they aren't cached.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['hits'] += 1
+                self._stats['memory_hits'] += 1
+                return _copy(self._memory[key])
+            results = self._read_disk(key)
+            if results is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            self._put_memory(key, results)
+            return _copy(results)
+
+    def put(self, key, results):
+        """Add a result to the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key, from `hash_params`.
+        results : dict
+            The results, as returned by ``Model.run()``.
+        """
+        results = _copy(results)
+        with self._lock:
+            self._put_memory(key, results)
+            if self.path is not None:
+                self._write_disk(key, results)
+
+    def stats(self):
+        """Return the hit and miss counts, and the number of results held
+        in memory."""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._memory))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.
+        return stats
+
+    def clear(self):
+        """Empty both tiers of the cache and reset the statistics."""
+        with self._lock:
+            self._memory.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+            for filename in self._disk_files():
+                os.remove(filename)
+
+    def _put_memory(self, key, results):
+        self._memory[key] = results
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def _disk_files(self):
+        if self.path is None:
+            return []
+        return [os.path.join(self.path, f) for f in os.listdir(self.path)
+                if f.endswith('.npz')]
+
+    def _read_disk(self, key):
+        if self.path is None:
+            return None
+        filename = self._file(key)
+        try:
+            with np.load(filename) as data:
+                results = {name:data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        # Mark the file as recently used, for eviction
+        os.utime(filename)
+        return results
+
+    def _write_disk(self, key, results):
+        filename = self._file(key)
+        tmp_name = filename + '.tmp.npz'
+        np.savez(tmp_name, **results)
+        if self.max_disk_bytes is not None and \
+                os.path.getsize(tmp_name) > self.max_disk_bytes:
+            # It would push everything else out, and then itself
+            os.remove(tmp_name)
+            return
+        os.replace(tmp_name, filename)
+        if self.max_disk_bytes is None:
+            return
+        files = sorted(self._disk_files(), key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        # The new result is never evicted, so it can be read back
+        files = [f for f in files if f != filename]
+        while files and total > self.max_disk_bytes:
+            oldest = files.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+
+def _copy(results):
+    """Copy a results dictionary, so the cached arrays can't be changed
+    through it."""
+    return {name:np.array(val) for name, val in results.items()}
@@ -6,9 +6,17 @@ Users can run the calculations through `model.Model()` and avoid
 accessing `core` directly.
 """
 
+import functools
+import warnings
 import numpy as np
-import scipy as sp
+import armmwave.jit
+import armmwave.profiling
 
+# The number of (indices, incident angle) pairs whose Snell angles are kept
+# by `snell_geometry`
+SNELL_CACHE_SIZE = 1024
+
+@armmwave.profiling.profiled
 def rt_amp(index, delta, theta, pol):
     """Calculate the reflected and transmitted amplitudes through the
     system.
@@ -35,9 +43,10 @@ def rt_amp(index, delta, theta, pol):
     t_amp, r_amp = make_rt_amp_matrix(index, theta, pol)
     m_mat = make_m_matrix(index, t_amp, r_amp, delta)
 
-    m_prime = make_2x2(1., 0., 0., 1., dtype=complex)
-    for i in range(1, len(index)-1):
-        m_prime = np.dot(m_prime, m_mat[i])
+    with armmwave.profiling.stage('core.rt_amp.chain'):
+        m_prime = make_2x2(1., 0., 0., 1., dtype=complex)
+        for i in range(1, len(index)-1):
+            m_prime = np.dot(m_prime, m_mat[i])
 
     C_m = make_2x2(1., r_amp[0, 1], r_amp[0, 1], 1., dtype=complex)
     m_prime = np.dot(C_m / t_amp[0, 1], m_prime)
@@ -45,6 +54,7 @@ def rt_amp(index, delta, theta, pol):
     ref_amp = m_prime[1, 0] / m_prime[0, 0]
     return ref_amp, trans_amp
 
+@armmwave.profiling.profiled
 def make_rt_amp_matrix(index, theta, pol):
     """Construct reflection and transmission amplitude matrices.
 
@@ -65,11 +75,104 @@ def make_rt_amp_matrix(index, theta, pol):
     """
     t_mat = np.zeros((len(index), len(index)), dtype=complex)
     r_mat = np.zeros((len(index), len(index)), dtype=complex)
-    for i in range(len(index) - 1):
-        t_mat[i, i+1] = t_interface(index[i], index[i+1], theta[i], theta[i+1], pol)
-        r_mat[i, i+1] = r_interface(index[i], index[i+1], theta[i], theta[i+1], pol)
+    t_amp, r_amp = make_rt_interfaces(index, theta, pol)
+    i = np.arange(len(index) - 1)
+    t_mat[i, i+1] = t_amp
+    r_mat[i, i+1] = r_amp
     return t_mat, r_mat
 
+@armmwave.profiling.profiled
+def make_rt_interfaces(index, theta, pol):
+    """Calculate the reflection and transmission amplitudes of each
+    interface in the model.
+
+    This is the compact form of `make_rt_amp_matrix`: only the N-1
+    interface terms are kept, rather than an NxN matrix that is mostly
+    zeros. The amplitudes do not depend on frequency, so they can be
+    calculated once and reused for every frequency.
+
+    Parameters
+    ----------
+    index : numpy array
+        An array of refractive indices, ordered from source layer to
+        terminator layer.
+    theta : numpy array
+        An array of angles in radians.
+    pol : string
+        The polarization of the source wave: 's' or 'p', or 'u' for both.
+
+    Returns
+    -------
+    t_amp, r_amp : tuple
+        The t- and r-amplitudes. Element `i` belongs to the interface
+        between layers `i` and `i+1`. If `pol` is 'u', the amplitudes have
+        an extra leading axis of length two holding the 's' and 'p'
+        amplitudes, in that order.
+    """
+    if pol == 'u':
+        amps = [make_rt_interfaces(index, theta, p) for p in ['s', 'p']]
+        return (np.stack([amps[0][0], amps[1][0]]),
+                np.stack([amps[0][1], amps[1][1]]))
+    index = np.asarray(index)
+    theta = np.asarray(theta)
+    t_amp = t_interface(index[..., :-1], index[..., 1:], theta[..., :-1],
+                        theta[..., 1:], pol)
+    r_amp = r_interface(index[..., :-1], index[..., 1:], theta[..., :-1],
+                        theta[..., 1:], pol)
+    return np.asarray(t_amp, dtype=complex), np.asarray(r_amp, dtype=complex)
+
+@armmwave.profiling.profiled
+def interface_derivatives(index, theta, pol):
+    """Calculate the derivatives of the interface amplitudes with respect
+    to the refractive indices on either side of each interface.
+
+    The Snell angle in each layer changes with its index (the invariant
+    `n sin(theta)` is fixed by the source), and this is included:
+    d(cos(theta))/dn = sin(theta)**2 / (n cos(theta)).
+
+    Parameters
+    ----------
+    index : numpy array
+        An array of refractive indices, ordered from source layer to
+        terminator layer.
+    theta : numpy array
+        The Snell angles in each layer, from `refract`.
+    pol : string
+        The polarization of the source wave: 's' or 'p'.
+
+    Returns
+    -------
+    dt_a, dr_a, dt_b, dr_b : tuple
+        The derivatives of the t- and r-amplitudes of each of the N-1
+        interfaces with respect to the index of the layer before the
+        interface (`_a`) and the layer after it (`_b`).
+    """
+    index = np.asarray(index)
+    cos = np.cos(theta)
+    dcos = np.sin(theta)**2 / (index * cos)
+    n_a, n_b = index[..., :-1], index[..., 1:]
+    c_a, c_b = cos[..., :-1], cos[..., 1:]
+    dc_a, dc_b = dcos[..., :-1], dcos[..., 1:]
+    # Both polarizations have the form r = (u - w) / (u + w) and
+    # t = 2 g / (u + w). d(n cos(theta))/dn is 1 / cos(theta).
+    if pol == 's':
+        u, w, g = n_a * c_a, n_b * c_b, n_a * c_a
+        du_a, dw_a, dg_a = 1 / c_a, 0., 1 / c_a
+        du_b, dw_b, dg_b = 0., 1 / c_b, 0.
+    elif pol == 'p':
+        u, w, g = n_b * c_a, n_a * c_b, n_a * c_a
+        du_a, dw_a, dg_a = n_b * dc_a, c_b, 1 / c_a
+        du_b, dw_b, dg_b = c_a, n_a * dc_b, 0.
+    else:
+        raise ValueError("Polarization must be 's' or 'p'")
+    total = u + w
+    derivs = []
+    for du, dw, dg in [(du_a, dw_a, dg_a), (du_b, dw_b, dg_b)]:
+        derivs.append(2 * (dg * total - g * (du + dw)) / total**2)
+        derivs.append(2 * (w * du - u * dw) / total**2)
+    return tuple(np.asarray(d, dtype=complex) for d in derivs)
+
+@armmwave.profiling.profiled
 def make_m_matrix(index, t_matrix, r_matrix, delta):
     """Construct the characteristic matrix of the model.
 
@@ -98,6 +201,250 @@ def make_m_matrix(index, t_matrix, r_matrix, delta):
         m_mat[i] = (1 / t_matrix[i, i+1]) * np.dot(C_m, r_m)
     return m_mat
 
+@armmwave.profiling.profiled
+def rt_amp_vec(delta, t_amp, r_amp):
+    """Calculate the reflected and transmitted amplitudes through the
+    system for many wavenumber offsets at once.
+
+    This is the batched counterpart of `rt_amp`. Any leading axes of
+    `delta` (e.g., frequency) are carried through the matrix product by
+    `chain_2x2`, so the only Python loop is over the layers.
+
+    Parameters
+    ----------
+    delta : numpy array
+        An array of wavenumber offsets with shape (..., N), where N is the
+        number of layers, ordered from source layer to terminator layer.
+    t_amp : numpy array
+        The t-amplitudes of the N-1 interfaces, with shape (..., N-1).
+        Interface `i` lies between layers `i` and `i+1`.
+    r_amp : numpy array
+        The r-amplitudes of the N-1 interfaces, with shape (..., N-1).
+
+    Returns
+    -------
+    r, t : tuple
+        A tuple where 'r' is the reflected amplitude, and 't' is the
+        transmitted amplitude. Both have the leading shape of `delta`.
+    """
+    delta = np.asarray(delta)
+    t_amp = np.asarray(t_amp)
+    r_amp = np.asarray(r_amp)
+
+    # Only the material layers contribute a characteristic matrix; the
+    # source layer contributes the interface matrix C_m below
+    with armmwave.profiling.stage('core.rt_amp_vec.assembly'):
+        phase = np.exp(-1j * delta[..., 1:-1])
+        alpha = 1 / t_amp[..., 1:]
+        beta = r_amp[..., 1:] * alpha
+    m00, m01, m10, m11 = chain_2x2(phase, alpha, beta)
+
+    # Left-multiply by C_m / t, where C_m = [[1, r], [r, 1]], keeping only
+    # the first column since that's all we need for r and t
+    m_prime00 = (m00 + r_amp[..., 0] * m10) / t_amp[..., 0]
+    m_prime10 = (r_amp[..., 0] * m00 + m10) / t_amp[..., 0]
+    trans_amp = 1 / m_prime00
+    ref_amp = m_prime10 / m_prime00
+    return ref_amp, trans_amp
+
+@armmwave.profiling.profiled
+def chain_2x2(phase, alpha, beta):
+    """Multiply out a chain of characteristic matrices, working on the four
+    matrix elements as separate arrays.
+
+    The characteristic matrix of layer `i` is
+
+        [[alpha * E, beta * E], [beta / E, alpha / E]]
+
+    with `E = exp(-1j * delta)`, `alpha = 1 / t`, and `beta = r / t`
+    (compare `layer_matrix`). Rather than building each 2x2 matrix and
+    calling `np.matmul`, the product is written out in closed form and
+    updated in place, so there is no allocation inside the layer loop.
+
+    Parameters
+    ----------
+    phase : numpy array
+        The phase factors, `E`, with shape (..., L) for L layers.
+    alpha : numpy array
+        The inverse t-amplitudes of the interface leaving each layer, with
+        shape (..., L).
+    beta : numpy array
+        The r-amplitudes divided by the t-amplitudes of the interface
+        leaving each layer, with shape (..., L).
+
+    Returns
+    -------
+    m00, m01, m10, m11 : tuple
+        The four elements of the matrix product. Each has the broadcast
+        leading shape of the inputs.
+    """
+    # Put the layer axis first so that each layer's elements are contiguous
+    phase = np.ascontiguousarray(np.moveaxis(np.asarray(phase), -1, 0))
+    alpha = np.moveaxis(np.asarray(alpha), -1, 0)
+    beta = np.moveaxis(np.asarray(beta), -1, 0)
+    inv_phase = 1 / phase
+    shape = np.broadcast(phase[0], alpha[0], beta[0]).shape
+
+    m00 = np.ones(shape, dtype=complex)
+    m01 = np.zeros(shape, dtype=complex)
+    m10 = np.zeros(shape, dtype=complex)
+    m11 = np.ones(shape, dtype=complex)
+    u = np.empty(shape, dtype=complex)
+    v = np.empty(shape, dtype=complex)
+    tmp = np.empty(shape, dtype=complex)
+    for i in range(phase.shape[0]):
+        # [x, y] is a row of the product. Its new value is
+        # [alpha*x*E + beta*y/E, beta*x*E + alpha*y/E]
+        for x, y in ((m00, m01), (m10, m11)):
+            np.multiply(x, phase[i], out=u)
+            np.multiply(y, inv_phase[i], out=v)
+            np.multiply(u, alpha[i], out=x)
+            np.multiply(v, beta[i], out=tmp)
+            x += tmp
+            np.multiply(u, beta[i], out=y)
+            np.multiply(v, alpha[i], out=tmp)
+            y += tmp
+    return m00, m01, m10, m11
+
+def layer_matrix(delta, t_amp, r_amp):
+    """Construct the characteristic matrix of a single layer for many
+    wavenumber offsets at once.
+
+    Parameters
+    ----------
+    delta : numpy array
+        The wavenumber offset(s) of the layer.
+    t_amp : numpy array or complex
+        The t-amplitude of the interface leaving the layer.
+    r_amp : numpy array or complex
+        The r-amplitude of the interface leaving the layer.
+
+    Returns
+    -------
+    m_mat : numpy array
+        The characteristic matrix of the layer, with shape
+        (..., 2, 2), where the leading axes are those of the broadcast
+        inputs.
+    """
+    shape = np.broadcast(delta, t_amp, r_amp).shape
+    phase = np.exp(-1j * delta)
+    inv_phase = np.exp(1j * delta)
+    m_mat = np.empty(shape + (2, 2), dtype=complex)
+    m_mat[..., 0, 0] = phase
+    m_mat[..., 0, 1] = r_amp * phase
+    m_mat[..., 1, 0] = r_amp * inv_phase
+    m_mat[..., 1, 1] = inv_phase
+    m_mat /= np.asarray(t_amp)[..., np.newaxis, np.newaxis]
+    return m_mat
+
+@armmwave.profiling.profiled
+def rt_amp_grad(delta, t_amp, r_amp, d_amp):
+    """Calculate the reflected and transmitted amplitudes, and their
+    derivatives with respect to the phase and index of every material
+    layer.
+
+    The product of characteristic matrices is P = (C_0 / t_0) M_1 ... M_L,
+    with M_j = D_j K_j, where D_j = diag(E_j, 1/E_j) holds the phase and
+    K_j = [[1, r_j], [r_j, 1]] / t_j the interface leaving layer j. A
+    backward sweep stores the first column of every suffix product
+    (M_j ... M_L), and a forward sweep carries the prefix product
+    (C_0 / t_0) M_1 ... M_j-1, so the derivative with respect to each layer
+    takes a few 2x2 products rather than a fresh sweep through the model.
+
+    Parameters
+    ----------
+    delta : numpy array
+        An array of wavenumber offsets with shape (..., N).
+    t_amp : numpy array
+        The t-amplitudes of the N-1 interfaces, with shape (..., N-1).
+    r_amp : numpy array
+        The r-amplitudes of the N-1 interfaces, with shape (..., N-1).
+    d_amp : tuple
+        The interface derivatives `(dt_a, dr_a, dt_b, dr_b)` from
+        `interface_derivatives`, each shaped like `t_amp`.
+
+    Returns
+    -------
+    r, t : numpy arrays
+        The reflected and transmitted amplitudes, with the leading shape
+        of `delta`.
+    dr_ddelta, dt_ddelta : numpy arrays
+        The derivatives of `r` and `t` with respect to the phase offset,
+        `delta`, of each of the N-2 material layers, with shape (..., N-2).
+    dr_dindex, dt_dindex : numpy arrays
+        The derivatives of `r` and `t` with respect to the index of each
+        material layer through the two interfaces that bound it, with
+        shape (..., N-2). The index also changes `delta`; combine this
+        with `dr_ddelta` to get the full derivative.
+    """
+    # Put the layer axis first, as in `chain_2x2`
+    shape = np.broadcast(np.asarray(delta)[..., 0],
+                         np.asarray(t_amp)[..., 0]).shape
+    phase = np.exp(-1j * np.moveaxis(np.asarray(delta), -1, 0))
+    t_amp, r_amp = [np.moveaxis(np.asarray(a), -1, 0) for a in (t_amp, r_amp)]
+    dt_a, dr_a, dt_b, dr_b = [np.moveaxis(np.asarray(d), -1, 0)
+                              for d in d_amp]
+    n_mat = phase.shape[0] - 2
+
+    def apply_k(i, v0, v1):
+        """K_i applied to the vector [v0, v1]."""
+        return (v0 + r_amp[i] * v1) / t_amp[i], (r_amp[i] * v0 + v1) / t_amp[i]
+
+    def apply_dk(i, dt, dr, v0, v1):
+        """dK_i applied to the vector [v0, v1], for amplitude changes
+        dt and dr."""
+        k0, k1 = apply_k(i, v0, v1)
+        return ((dr[i] * v1 - dt[i] * k0) / t_amp[i],
+                (dr[i] * v0 - dt[i] * k1) / t_amp[i])
+
+    # Backward sweep: b[j] is the first column of M_j ... M_L, with
+    # b[L+1] = [1, 0]
+    b0 = np.empty((n_mat + 2,) + shape, dtype=complex)
+    b1 = np.empty((n_mat + 2,) + shape, dtype=complex)
+    b0[-1] = 1.
+    b1[-1] = 0.
+    for j in range(n_mat, 0, -1):
+        k0, k1 = apply_k(j, b0[j+1], b1[j+1])
+        b0[j] = phase[j] * k0
+        b1[j] = k1 / phase[j]
+
+    # Forward sweep. `a` is the prefix product A_j-1 and `g` is the prefix
+    # before the last interface, G_j-1 (so A_j = G_j K_j). A_0 = K_0 and
+    # G_0 is the identity.
+    eye = np.ones(shape, dtype=complex), np.zeros(shape, dtype=complex)
+    g = (eye[0], eye[1], eye[1], eye[0])
+    # K_0 is symmetric, so its rows are its columns
+    a = apply_k(0, eye[0], eye[1]) + apply_k(0, eye[1], eye[0])
+    dp_ddelta = np.empty((2, n_mat) + shape, dtype=complex)
+    dp_dindex = np.empty((2, n_mat) + shape, dtype=complex)
+    for j in range(1, n_mat + 1):
+        a00, a01, a10, a11 = a
+        # dM_j / d(delta_j) = -1j * diag(1, -1) M_j
+        dp_ddelta[0, j-1] = -1j * (a00 * b0[j] - a01 * b1[j])
+        dp_ddelta[1, j-1] = -1j * (a10 * b0[j] - a11 * b1[j])
+        # The interface before layer j sits in K_j-1, after G_j-1
+        v0, v1 = apply_dk(j-1, dt_b, dr_b, b0[j], b1[j])
+        dp_dindex[0, j-1] = g[0] * v0 + g[1] * v1
+        dp_dindex[1, j-1] = g[2] * v0 + g[3] * v1
+        # ... and the interface after it sits in K_j, after G_j = A_j-1 D_j
+        g = (a00 * phase[j], a01 / phase[j], a10 * phase[j], a11 / phase[j])
+        v0, v1 = apply_dk(j, dt_a, dr_a, b0[j+1], b1[j+1])
+        dp_dindex[0, j-1] += g[0] * v0 + g[1] * v1
+        dp_dindex[1, j-1] += g[2] * v0 + g[3] * v1
+        # Each row of A_j is a row of G_j times the symmetric K_j
+        a = apply_k(j, g[0], g[1]) + apply_k(j, g[2], g[3])
+
+    # The product is now P = A_L, so r = P10 / P00 and t = 1 / P00
+    trans_amp = 1 / a[0]
+    ref_amp = a[2] * trans_amp
+    derivs = []
+    for dp in (dp_ddelta, dp_dindex):
+        dr = trans_amp * (dp[1] - ref_amp * dp[0])
+        dt = -trans_amp**2 * dp[0]
+        derivs += [np.moveaxis(dr, 0, -1), np.moveaxis(dt, 0, -1)]
+    return (ref_amp, trans_amp) + tuple(derivs)
+
+@armmwave.profiling.profiled
 def r_power(r_amp):
     """Return the fraction of reflected power.
 
@@ -114,6 +461,7 @@ def r_power(r_amp):
     """
     return np.abs(r_amp)**2
 
+@armmwave.profiling.profiled
 def t_power(t_amp, index_i, index_f, theta_i, theta_f):
     """Return the fraction of transmitted power.
 
@@ -136,8 +484,10 @@ def t_power(t_amp, index_i, index_f, theta_i, theta_f):
     T : numpy array
         The model transmittance
     """
+    # Only the real part of the ratio carries power. It is zero if the wave
+    # in the terminator is evanescent (past the critical angle).
     return np.abs(t_amp**2) * \
-           ( (index_f * np.cos(theta_f)) / (index_i * np.cos(theta_i) ) )
+           np.real( (index_f * np.cos(theta_f)) / (index_i * np.cos(theta_i) ) )
 
 def r_interface(index1, index2, theta1, theta2, pol):
     """Calculate the reflected amplitude at an interface.
@@ -201,6 +551,7 @@ def t_interface(index1, index2, theta1, theta2, pol):
         raise ValueError("Polarization must be 's' or 'p'")
     return numerator / denominator
 
+@armmwave.profiling.profiled
 def wavenumber(freq, index, tand):
     """Calculate the wavenumber in a material.
 
@@ -297,6 +648,33 @@ def alpha2tand(freq, a, b, n):
     return tand
 
 
+def alpha2tand_deriv(freq, a, b, n):
+    """Calculate the derivative of the Halpern loss tangent (see
+    `alpha2tand`) with respect to the real part of the refractive index.
+
+    Parameters
+    ----------
+    freq : numpy array or float
+        The frequency (Hz) (or frequencies) at which to calculate the
+        derivative.
+    a : float
+        Halpern's 'a' coefficient
+    b : float
+        Halpern's 'b' coefficient
+    n : float
+        The real part of the material's refractive index
+
+    Returns
+    -------
+    dtand_dn : numpy array
+        The derivative of the loss tangent with respect to `n`.
+    """
+    # n * imagn doesn't depend on n, so with A = n * imagn,
+    #   tand = 2A / (n^2 - A^2/n^2)
+    n_imagn = n * alpha2imagn(freq, a, b, n)
+    ep = n**2 - n_imagn**2 / n**2
+    return -2 * n_imagn * (2 * n + 2 * n_imagn**2 / n**3) / ep**2
+
 def make_2x2(a11, a12, a21, a22, dtype=float):
     """Return a 2x2 array quickly.
 
@@ -344,38 +722,118 @@ def prop_wavenumber(k, d, theta):
     delta : array
         The phase difference
     """
-    # Turn off 'invalid multiplication' error; it's just the 'inf' boundaries
-    olderr = sp.seterr(invalid='ignore')
-    delta = k * d * np.cos(theta)
-    # Now turn the error back on
-    sp.seterr(**olderr)
+    # Ignore 'invalid multiplication' errors; it's just the 'inf' boundaries
+    with np.errstate(invalid='ignore'):
+        delta = k * d * np.cos(theta)
+    return delta
+
+@armmwave.profiling.profiled
+def layer_phase(k, d, cos_theta):
+    """Calculate the phase, delta, that the wave picks up crossing each
+    material layer.
+
+    This is `prop_wavenumber` for the calculation hot path. The source and
+    terminator are infinitely thick, and the transfer-matrix recursion
+    never uses their phase, so rather than multiplying through the `inf`
+    thicknesses (and hiding the invalid-value warnings), their phase is
+    set to zero.
+
+    Parameters
+    ----------
+    k : numpy array
+        The wavenumber in each layer, with shape (..., N).
+    d : numpy array
+        The thickness of each layer, with shape (N,) or (..., N).
+    cos_theta : numpy array
+        The cosine of the Snell angle in each layer, with shape (..., N).
+
+    Returns
+    -------
+    delta : numpy array
+        The phase of each layer, with the broadcast shape of the inputs.
+        The first and last entries along the layer axis are zero.
+    """
+    k = np.asarray(k)
+    d = np.asarray(d)
+    cos_theta = np.asarray(cos_theta)
+    inner = k[..., 1:-1] * d[..., 1:-1] * cos_theta[..., 1:-1]
+    delta = np.zeros(inner.shape[:-1] + (inner.shape[-1] + 2,),
+                     dtype=inner.dtype)
+    delta[..., 1:-1] = inner
     return delta
 
 def refract(n, theta0):
     """Calculate the angle by which an incident ray is refracted
 
+    The angles are memoized; see `snell_geometry`.
+
     Parameters
     ----------
     n : numpy array
         An array of refractive indices, ordered from source layer to
         terminator layer.
-    theta0 : float
-        The initial angle of incidence (radians)
+    theta0 : float or numpy array
+        The initial angle of incidence (radians), or an array of initial
+        angles.
 
     Returns
     -------
     thetas : numpy array
-        The Snell angles at each interface
+        The Snell angles at each interface. If `theta0` is an array, the
+        angles have shape (n_angle, n_layer). The array is read-only.
+    """
+    return snell_geometry(n, theta0)[0]
+
+@armmwave.profiling.profiled
+def snell_geometry(n, theta0):
+    """Calculate the Snell angle, and its cosine, in every layer.
+
+    The angles depend only on the refractive indices and the incident
+    angle, which many models in a crunch or an optimization share, so the
+    results are memoized on (indices, incident angle). Up to
+    `SNELL_CACHE_SIZE` of them are kept; call `clear_snell_cache` to drop
+    them.
+
+    Parameters
+    ----------
+    n : numpy array
+        An array of refractive indices, ordered from source layer to
+        terminator layer.
+    theta0 : float or numpy array
+        The initial angle of incidence (radians), or an array of initial
+        angles.
+
+    Returns
+    -------
+    theta, cos_theta : numpy arrays
+        The Snell angle and its cosine in each layer. If `theta0` is an
+        array, both have shape (n_angle, n_layer). They are shared with the
+        cache, so they are read-only.
     """
-    # Make a nice pairwise generator so we can avoid playing games with
-    # index counting
-    thetas = [theta0]
-    ngen = zip(n, n[1:])
-    for i, rind in enumerate(ngen):
-        theta = np.arcsin(np.real_if_close( rind[0] * np.sin(thetas[i]) / rind[1] ))
-        thetas.append(theta)
-    return np.asarray(thetas)
+    # The raw bytes are a much cheaper key to build and hash than a tuple
+    # of floats, which matters for deep stacks
+    n = np.asarray(n)
+    theta0 = np.asarray(theta0, dtype=float)
+    return _snell_geometry(n.tobytes(), n.dtype.str, n.shape,
+                           theta0.tobytes(), theta0.shape)
 
+@functools.lru_cache(maxsize=SNELL_CACHE_SIZE)
+def _snell_geometry(n, n_dtype, n_shape, theta0, theta0_shape):
+    """Calculate `snell_geometry` from the bytes of the indices and
+    angles."""
+    n = np.frombuffer(n, dtype=n_dtype).reshape(n_shape)
+    theta0 = np.frombuffer(theta0).reshape(theta0_shape)
+    theta = snell_angle(n, n[0], theta0[..., np.newaxis])
+    cos_theta = np.cos(theta)
+    theta.flags.writeable = False
+    cos_theta.flags.writeable = False
+    return theta, cos_theta
+
+def clear_snell_cache():
+    """Drop the Snell angles memoized by `snell_geometry`."""
+    _snell_geometry.cache_clear()
+
+@armmwave.profiling.profiled
 def replace_tand(freq, tand_array, halpern_dict):
     """Calculate a frequency-dependent loss tangent from a material's
     Halpern coefficiencts if they exist.
@@ -393,15 +851,58 @@ def replace_tand(freq, tand_array, halpern_dict):
     Returns
     -------
     tand_array : numpy array
-        The loss tangents of the materials, ordered from Source to
-        Terminator. Where possible, the Halpern coefficients have been
-        applied to make the terms frequency-dependent.
+        A new array of the loss tangents of the materials, ordered from
+        Source to Terminator. Where possible, the Halpern coefficients have
+        been applied to make the terms frequency-dependent. The input is
+        left alone, so it can be shared between threads.
     """
+    tand_array = np.array(tand_array, dtype=float)
     for k, v in halpern_dict.items():
         tand_array[k] = alpha2tand(freq, v['a'], v['b'], v['n'])
     return tand_array
 
-def main(params):
+@armmwave.profiling.profiled
+def halpern_tand(freq, tand, halpern_dict):
+    """Calculate the loss tangents of every layer at every frequency,
+    applying Halpern coefficients where they exist.
+
+    This is the vectorized version of `replace_tand`: the loss tangents of
+    all the Halpern layers are calculated for the whole frequency grid in
+    one call to `alpha2tand`. Unlike `replace_tand`, `tand` is not
+    modified.
+
+    Parameters
+    ----------
+    freq : numpy array
+        The frequencies at which to calculate the loss tangents
+    tand : numpy array
+        The loss tangents of the materials, ordered from Source to
+        Terminator
+    halpern_dict : dict
+        A dictionary keyed by layer index, containing Halpern coefficients
+
+    Returns
+    -------
+    tand_array : numpy array
+        The loss tangents, with shape (n_freq, n_layer). If there are no
+        Halpern layers this is `tand` broadcast (read-only) against the
+        frequency axis, so it costs no extra memory.
+    """
+    freq = np.asarray(freq, dtype=float)
+    tand = np.asarray(tand, dtype=float)
+    shape = freq.shape + tand.shape
+    if len(halpern_dict) == 0:
+        return np.broadcast_to(tand, shape)
+    index = np.array(list(halpern_dict.keys()))
+    coeffs = np.array([[v['a'], v['b'], v['n']]
+                       for v in halpern_dict.values()], dtype=float).T
+    tand_array = np.empty(shape)
+    tand_array[...] = tand
+    tand_array[..., index] = alpha2tand(freq[..., np.newaxis], *coeffs)
+    return tand_array
+
+@armmwave.profiling.profiled
+def main(params, backend='numpy'):
     """Run a transmittance/reflectance calculation for the given parameters.
 
     This function is the primary entry-point to the calculation, and should
@@ -415,6 +916,14 @@ def main(params):
     params : dict
         The dictionary contructed by `Model.set_up`. See that function
         documentation for details.
+    backend : str, optional
+        How to run the transfer-matrix recursion: 'numpy' (the default)
+        uses `rt_amp_vec`, and 'numba' uses the compiled kernel in
+        `armmwave.jit`. If Numba isn't installed, 'numba' falls back to
+        'numpy' with a warning. The third backend, 'loop', is the
+        unvectorized reference calculation, `main_loop`; `band_average`,
+        `adaptive_sample`, and ``Model.run()`` accept it and call
+        `main_loop`, but `main` does not.
 
     Returns
     -------
@@ -423,34 +932,1033 @@ def main(params):
          * `frequency`: the frequency (in Hz) at which T and R were calculated
          * `transmittance`: the output transmittance (T) of the model
          * `reflectance`: the output reflectance (R) of the model
+
+        If `params['theta0']` is an array of angles, T and R have shape
+        (n_angle, n_freq). If `params['pol']` is 'u', both polarizations
+        are calculated in the same pass; see `pack_results` for the extra
+        keys.
     """
+    rt_func = select_backend(backend)
     rind = params['rind']
     thick = params['thick']
     tand = params['tand']
     pol = params['pol']
     theta0 = params['theta0']
-    theta = refract(rind, theta0)
     freq = params['freq']
     halps = params['halpern_layers']
 
-    # Create containers for the reflection/transmission values we calculate
-    # at each frequency
+    # The Snell angles and interface amplitudes don't depend on frequency.
+    # `Model.set_up` calculates them once and stores them with the other
+    # parameters, but we'll work them out here if they're missing. Halpern
+    # coefficients only change the loss tangent, which enters through the
+    # propagation phase, so the amplitudes hold at every frequency.
+    if 'theta' in params:
+        theta = params['theta']
+        cos_theta = np.cos(theta)
+    else:
+        theta, cos_theta = snell_geometry(rind, theta0)
+    if 't_amp' in params and 'r_amp' in params:
+        t_amp = params['t_amp']
+        r_amp = params['r_amp']
+    else:
+        t_amp, r_amp = make_rt_interfaces(rind, theta, pol)
+
+    # Build the loss tangents for every frequency up front, as a
+    # (n_freq, n_layer) array. The input `params['tand']` is left
+    # untouched, so the model can be run again.
+    if len(halps) > 0:
+        tand = halpern_tand(freq, tand, halps)
+
+    # Everything below carries a frequency axis. If we're sweeping the
+    # incident angle as well, the angle axis goes in front of it, so the
+    # Snell angles and interface amplitudes get an extra axis for
+    # frequency.
+    ks = wavenumber(np.asarray(freq)[:, np.newaxis], rind, tand)
+    delta = layer_phase(ks, thick, cos_theta[..., np.newaxis, :])
+    armmwave.profiling.record('tand', tand)
+    armmwave.profiling.record('delta', delta)
+    r_amps, t_amps = rt_func(delta, t_amp[..., np.newaxis, :],
+                             r_amp[..., np.newaxis, :])
+    ts = t_power(t_amps, rind[0], rind[-1], theta[..., :1], theta[..., -1:])
+    rs = r_power(r_amps)
+
+    return pack_results(freq, ts, rs, pol)
+
+@armmwave.profiling.profiled
+def main_gradient(params):
+    """Run a transmittance/reflectance calculation, and calculate the
+    derivatives of T and R with respect to the thickness, refractive index,
+    and loss tangent of every material layer.
+
+    The derivatives are analytic (see `rt_amp_grad`). Together with T and R
+    they cost about four to seven runs of `main` (more for unpolarized
+    light), however many layers there are. Call this with
+    ``Model.run(gradient=True)``.
+
+    The indices of the source and terminator are held fixed. When a
+    ``Terminator`` with `vac` False takes the index of the last material,
+    the derivative with respect to that material's index leaves out the
+    change at the terminating interface.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+
+    Returns
+    -------
+    result : dict
+        The dictionary returned by `main`, with six more keys:
+        `transmittance_grad_thick`, `transmittance_grad_rind`,
+        `transmittance_grad_tand`, and the same for `reflectance`. Each
+        has the shape of `transmittance` plus a last axis for the N-2
+        material layers (everything but the Source and Terminator), in
+        order. For layers with Halpern coefficients the loss tangent is
+        not a free parameter, so its derivative is zero, and the index
+        derivative includes the change in the Halpern loss tangent.
+    """
+    pol = params['pol']
+    freq = params['freq']
+    if pol == 'u':
+        sub_params = {key:val for key, val in params.items()
+                      if key not in ('t_amp', 'r_amp')}
+        results = [main_gradient(dict(sub_params, pol=p)) for p in ['s', 'p']]
+        packed = pack_results(freq,
+                              np.array([r['transmittance'] for r in results]),
+                              np.array([r['reflectance'] for r in results]),
+                              pol)
+        for key in results[0]:
+            if '_grad_' in key:
+                packed[key] = 0.5 * (results[0][key] + results[1][key])
+        return packed
+
+    rind = np.asarray(params['rind'])
+    thick = np.asarray(params['thick'])
+    halps = params['halpern_layers']
+    if 'theta' in params:
+        theta = params['theta']
+        cos_theta = np.cos(theta)
+    else:
+        theta, cos_theta = snell_geometry(rind, params['theta0'])
+    t_amp, r_amp = make_rt_interfaces(rind, theta, pol)
+    d_amp = interface_derivatives(rind, theta, pol)
+    tand = halpern_tand(freq, params['tand'], halps)
+
+    ks = wavenumber(np.asarray(freq)[:, np.newaxis], rind, tand)
+    delta = layer_phase(ks, thick, cos_theta[..., np.newaxis, :])
+    armmwave.profiling.record('tand', tand)
+    armmwave.profiling.record('delta', delta)
+    (r_amps, t_amps, dr_ddelta, dt_ddelta,
+     dr_dindex, dt_dindex) = rt_amp_grad(
+         delta, t_amp[..., np.newaxis, :], r_amp[..., np.newaxis, :],
+         tuple(d[..., np.newaxis, :] for d in d_amp))
+
+    # The phase of material layer j is delta = k * d * cos(theta), with
+    # k = 2 pi f n sqrt(1 + i tand) / c and d(n cos(theta))/dn = 1/cos(theta)
+    mat = slice(1, -1)
+    cos = cos_theta[..., np.newaxis, mat]
+    ddelta = {'thick':ks[..., mat] * cos,
+              'rind':ks[..., mat] * thick[mat] / (rind[mat] * cos),
+              'tand':delta[..., mat] * 0.5j / (1 + 1j * tand[..., mat])}
+    for k, v in halps.items():
+        ddelta['rind'][..., k-1] += ddelta['tand'][..., k-1] * \
+            alpha2tand_deriv(freq, v['a'], v['b'], v['n'])
+        ddelta['tand'][..., k-1] = 0.
+
+    results = pack_results(freq, t_power(t_amps, rind[0], rind[-1],
+                                         theta[..., :1], theta[..., -1:]),
+                           r_power(r_amps), pol)
+    # dT = 2 Re(t* dt) times the index/angle factor of `t_power`
+    t_factor = np.real((rind[-1] * np.cos(theta[..., -1:])) /
+                       (rind[0] * np.cos(theta[..., :1])))[..., np.newaxis]
+    for name, d_delta in ddelta.items():
+        dr = dr_ddelta * d_delta
+        dt = dt_ddelta * d_delta
+        if name == 'rind':
+            dr = dr + dr_dindex
+            dt = dt + dt_dindex
+        results['transmittance_grad_' + name] = \
+            2 * t_factor * np.real(np.conj(t_amps)[..., np.newaxis] * dt)
+        results['reflectance_grad_' + name] = \
+            2 * np.real(np.conj(r_amps)[..., np.newaxis] * dr)
+    return results
+
+def estimate_chunk_size(params, max_memory):
+    """Estimate how many frequencies `main` can handle at once within a
+    memory budget.
+
+    The estimate counts the arrays that scale with the number of
+    frequencies: the loss tangents, wavenumbers, phase offsets, and phase
+    factors (one of each per layer), and the running 2x2 product and its
+    temporaries in `chain_2x2`. It is approximate, but errs on the side of
+    smaller chunks.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+    max_memory : int
+        The memory budget, in bytes.
+
+    Returns
+    -------
+    n_freq : int
+        The number of frequencies per chunk.
+
+    Raises
+    ------
+    ValueError
+        Raised if the budget is too small for even one frequency.
+    """
+    n_layer = len(params['rind'])
+    n_rows = np.size(params['theta0'])
+    if params['pol'] == 'u':
+        n_rows *= 2
+    # 8 bytes of tand and 3 x 16 bytes of complex ks, delta and phase per
+    # layer, plus 8 complex 2x2 entries and temporaries per row
+    bytes_per_freq = n_rows * (56 * n_layer + 8 * 16) + 3 * 8
+    n_freq = int(max_memory // bytes_per_freq)
+    if n_freq < 1:
+        raise ValueError('max_memory must be at least {} bytes for this '
+                         'model'.format(bytes_per_freq))
+    return n_freq
+
+def iter_chunks(params, chunk_size, backend='numpy', gradient=False):
+    """Run `main` over the frequency grid in blocks of `chunk_size`
+    frequencies.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+    chunk_size : int
+        The number of frequencies in each block.
+    backend : str, optional
+        Either 'numpy' or 'numba'. See `main`.
+    gradient : bool, optional
+        Calculate the derivatives of T and R as well, with
+        `main_gradient`. Default is False.
+
+    Yields
+    ------
+    block : slice
+        The slice of `params['freq']` covered by this chunk.
+    result : dict
+        The results for those frequencies, as returned by `main`.
+
+    Raises
+    ------
+    ValueError
+        Raised if `chunk_size` is less than 1.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+    freq = np.asarray(params['freq'])
+    for start in range(0, len(freq), chunk_size):
+        block = slice(start, min(start + chunk_size, len(freq)))
+        block_params = dict(params, freq=freq[block])
+        if gradient:
+            yield block, main_gradient(block_params)
+        else:
+            yield block, main(block_params, backend=backend)
+
+@armmwave.profiling.profiled
+def main_chunked(params, chunk_size=None, max_memory=None, backend='numpy',
+                 gradient=False):
+    """Run `main` over the frequency grid in blocks, writing the results
+    into preallocated arrays.
+
+    Peak memory is set by the chunk size rather than the length of the
+    frequency grid, so very dense grids (millions of samples) can be
+    calculated without building the full set of temporaries.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+    chunk_size : int, optional
+        The number of frequencies in each block.
+    max_memory : int, optional
+        A memory budget, in bytes, used to pick the chunk size (see
+        `estimate_chunk_size`) if `chunk_size` is not given. If neither
+        is given, the whole grid is calculated in one block.
+    backend : str, optional
+        Either 'numpy' or 'numba'. See `main`.
+    gradient : bool, optional
+        Calculate the derivatives of T and R as well. See `main_gradient`.
+        Default is False.
+
+    Returns
+    -------
+    result : dict
+        The same dictionary returned by `main` (or `main_gradient`).
+    """
+    freq = np.asarray(params['freq'])
+    if chunk_size is None:
+        if max_memory is None:
+            chunk_size = max(len(freq), 1)
+        else:
+            chunk_size = estimate_chunk_size(params, max_memory)
+    results = None
+    for block, result in iter_chunks(params, chunk_size, backend, gradient):
+        if results is None:
+            # The frequency axis is last, except in the derivatives, where
+            # the layer axis comes after it
+            results = {}
+            for key, val in result.items():
+                if key == 'frequency':
+                    continue
+                axis = -2 if '_grad_' in key else -1
+                shape = list(val.shape)
+                shape[axis] = len(freq)
+                results[key] = np.empty(shape, val.dtype)
+        for key, val in results.items():
+            if '_grad_' in key:
+                val[..., block, :] = result[key]
+            else:
+                val[..., block] = result[key]
+    if results is None:
+        if gradient:
+            return main_gradient(params)
+        return main(params, backend=backend)
+    return dict(frequency=freq, **results)
+
+@armmwave.profiling.profiled
+def band_average(params, low, high, weight=None, tol=1e-5, n_nodes=8,
+                 max_evals=4000, backend='numpy'):
+    """Calculate the transmittance and reflectance averaged over a band,
+    with adaptive Gauss-Legendre quadrature.
+
+    The response of a stack is smooth in frequency, so a few Gauss-Legendre
+    panels reach a tight tolerance with tens of frequencies, rather than
+    the thousands of an evenly spaced grid. Each panel is checked against
+    its two halves; panels that disagree by more than their share of `tol`
+    are split, and every round of panels is calculated in one call to
+    `main`.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`. Its frequencies are
+        ignored.
+    low, high : float
+        The edges of the band (in Hz).
+    weight : callable or tuple, optional
+        A spectral response to weight the average by. Either a function of
+        frequency (in Hz) that takes an array, or a tuple of (frequencies,
+        response) arrays to interpolate. Default is a flat response.
+    tol : float, optional
+        The tolerance on the band averages. Default is 1e-5.
+    n_nodes : int, optional
+        The number of Gauss-Legendre nodes in each panel. Default is 8.
+    max_evals : int, optional
+        The most frequencies to calculate. If the tolerance isn't reached
+        by then, the best estimate is returned with a warning. Default is
+        4000.
+    backend : str, optional
+        Either 'numpy' (the default), 'numba', or 'loop'. See `main`.
+
+    Returns
+    -------
+    result : dict
+        A dictionary with the keys of `main` other than `frequency`, each
+        averaged over the band (so a scalar, or one value per incident
+        angle), and:
+         * `band`: the (low, high) edges of the band
+         * `error`: the estimated error of the averages
+         * `n_evaluations`: the number of frequencies calculated
+
+    Raises
+    ------
+    ValueError
+        Raised if the band is empty, or if the weights integrate to zero.
+    """
+    low, high = float(min(low, high)), float(max(low, high))
+    if not high > low:
+        raise ValueError('The band must have a nonzero width')
+    if weight is not None and not callable(weight):
+        weight_freq, response = (np.asarray(w, dtype=float) for w in weight)
+        weight = lambda f: np.interp(f, weight_freq, response)
+    nodes, node_weights = np.polynomial.legendre.leggauss(n_nodes)
+    run = main_loop if backend == 'loop' else \
+        lambda p: main(p, backend=backend)
+
+    def integrate(panels):
+        # The quadrature sums of each output over each (lo, hi) panel, with
+        # the integral of the weight itself under '_weight'
+        mid = 0.5 * (panels[:, 0] + panels[:, 1])
+        half = 0.5 * (panels[:, 1] - panels[:, 0])
+        freq = (mid[:, np.newaxis] + half[:, np.newaxis] * nodes).ravel()
+        quad = half[:, np.newaxis] * node_weights
+        if weight is not None:
+            quad = quad * np.reshape(weight(freq), quad.shape)
+        results = run(dict(params, freq=freq))
+        sums = {'_weight':quad.sum(axis=-1)}
+        for key, val in results.items():
+            if key != 'frequency':
+                val = val.reshape(val.shape[:-1] + quad.shape)
+                sums[key] = (val * quad).sum(axis=-1)
+        return sums
+
+    def panel_error(coarse, fine):
+        # The disagreement of each panel with its halves, for the worst
+        # output (and incident angle)
+        error = np.abs(fine['_weight'] - coarse['_weight'])
+        for key in coarse:
+            diff = np.abs(fine[key] - coarse[key])
+            error = np.maximum(error, diff.reshape((-1, len(error))).max(0))
+        return error
+
+    panels = np.array([[low, high]])
+    coarse = integrate(panels)
+    n_evals = n_nodes
+    accepted = {key:np.zeros(val.shape[:-1]) for key, val in coarse.items()}
+    error_sum = 0.
+    total = None
+    while len(panels) > 0:
+        mid = 0.5 * (panels[:, 0] + panels[:, 1])
+        halves = np.stack([np.column_stack([panels[:, 0], mid]),
+                           np.column_stack([mid, panels[:, 1]])],
+                          axis=1).reshape((-1, 2))
+        halves_sums = integrate(halves)
+        n_evals += len(halves) * n_nodes
+        fine = {key:val[..., 0::2] + val[..., 1::2]
+                for key, val in halves_sums.items()}
+        if total is None:
+            total = abs(fine['_weight'].sum())
+            if total == 0:
+                raise ValueError('The weights integrate to zero over the '
+                                 'band')
+        error = panel_error(coarse, fine) / total
+        # Each panel may use its share of the tolerance, by width
+        done = error <= tol * (panels[:, 1] - panels[:, 0]) / (high - low)
+        # Each panel left over is split in two, and both halves are checked
+        # against their own halves next round
+        if n_evals + 4 * np.count_nonzero(~done) * n_nodes > max_evals:
+            if not np.all(done):
+                warnings.warn('The band average did not reach the tolerance '
+                              'within {} evaluations'.format(max_evals),
+                              RuntimeWarning)
+            done[:] = True
+        for key, val in fine.items():
+            accepted[key] += val[..., done].sum(axis=-1)
+        error_sum += error[done].sum()
+        keep = np.repeat(~done, 2)
+        panels = halves[keep]
+        coarse = {key:val[..., keep] for key, val in halves_sums.items()}
+
+    norm = accepted.pop('_weight')
+    result = {key:val / norm for key, val in accepted.items()}
+    result.update(band=np.array([low, high]), error=error_sum,
+                  n_evaluations=n_evals)
+    return result
+
+@armmwave.profiling.profiled
+def fringe_spacing(params, max_phase=np.pi/2):
+    """Return the widest frequency step over which the round-trip phase of
+    the stack changes by no more than `max_phase`.
+
+    The phase across a layer, Re(delta) = 2 pi f n d cos(theta) / c, grows
+    linearly with frequency. A Fabry-Perot fringe repeats each time the
+    round-trip phase between two reflecting interfaces grows by 2 pi. The
+    finest fringe therefore comes from the outermost pair of interfaces
+    with an index step. Layers outside that pair, e.g. a substrate that is
+    index-matched to the ``Terminator``, don't add fringes.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+    max_phase : float, optional
+        The largest round-trip phase change to allow (radians). Default is
+        pi/2, or four steps per fringe.
+
+    Returns
+    -------
+    step : float
+        The frequency step (in Hz), or `inf` if fewer than two interfaces
+        reflect.
+    """
+    rind = np.asarray(params['rind'])
+    steps = np.flatnonzero(rind[1:] != rind[:-1])
+    if len(steps) < 2:
+        return np.inf
+    cavity = slice(steps[0] + 1, steps[-1] + 1)
+    cos_theta = snell_geometry(rind, params['theta0'])[1]
+    path = np.real(rind[cavity] * np.asarray(params['thick'])[cavity] *
+                   cos_theta[..., cavity]).sum(axis=-1)
+    if np.max(path) <= 0:
+        return np.inf
+    return max_phase * 3e8 / (4 * np.pi * np.max(path))
+
+@armmwave.profiling.profiled
+def adaptive_sample(params, low, high, tol=1e-3, n_initial=33,
+                    max_phase=np.pi/2, max_evals=20000, backend='numpy'):
+    """Calculate the transmittance and reflectance on a frequency grid that
+    is refined only where the response changes quickly.
+
+    The grid starts with `n_initial` evenly spaced frequencies, made finer
+    where needed so that no layer's round-trip phase changes by more than
+    `max_phase` between samples (see `fringe_spacing`); this keeps sharp
+    fringes from falling between samples. Then the curvature of T and R
+    at each sample is estimated from its neighbours, and each interval
+    where a straight line between the ends would be off by more than `tol`
+    is split at its midpoint, until none are left. Every round of
+    midpoints is calculated in one call to `main`.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`. Its frequencies are
+        ignored.
+    low, high : float
+        The frequency range (in Hz).
+    tol : float, optional
+        The largest error allowed when linearly interpolating T or R
+        between neighbouring samples. Default is 1e-3.
+    n_initial : int, optional
+        The number of evenly spaced frequencies to start from. Default is
+        33.
+    max_phase : float, optional
+        See `fringe_spacing`. Set it to `inf` to start from exactly
+        `n_initial` frequencies. Default is pi/2.
+    max_evals : int, optional
+        The most frequencies to calculate. If the tolerance isn't reached
+        by then, the grid is returned as it is, with a warning. Default is
+        20000.
+    backend : str, optional
+        Either 'numpy' (the default), 'numba', or 'loop'. See `main`.
+
+    Returns
+    -------
+    result : dict
+        The dictionary returned by `main`, with the (unevenly spaced)
+        frequencies in increasing order.
+
+    Raises
+    ------
+    ValueError
+        Raised if the range is empty, if `n_initial` is less than 2, or if
+        the starting grid alone needs more than `max_evals` frequencies.
+    """
+    low, high = float(min(low, high)), float(max(low, high))
+    if not high > low:
+        raise ValueError('The frequency range must have a nonzero width')
+    if n_initial < 2:
+        raise ValueError('n_initial must be at least 2')
+    n_start = max(n_initial,
+                  int(np.ceil((high - low) /
+                              fringe_spacing(params, max_phase))) + 1)
+    if n_start > max_evals:
+        raise ValueError('Resolving the fringes needs {} frequencies, more '
+                         'than max_evals'.format(n_start))
+    run = main_loop if backend == 'loop' else \
+        lambda p: main(p, backend=backend)
+
+    def flatten(results):
+        # Stack every output as rows of a (n_output, n_freq) array
+        n_freq = len(results['frequency'])
+        return np.concatenate([np.reshape(results[key], (-1, n_freq))
+                               for key, shape in layout])
+
+    freq = np.linspace(low, high, n_start)
+    results = run(dict(params, freq=freq))
+    layout = [(key, np.shape(val)[:-1]) for key, val in sorted(results.items())
+              if key != 'frequency']
+    values = flatten(results)
+    while len(freq) > 2:
+        # The curvature at each sample, from the second divided difference
+        # with its neighbours, for the worst output
+        step = np.diff(freq)
+        slope = np.diff(values, axis=1) / step
+        curve = np.abs(2 * np.diff(slope, axis=1) /
+                       (step[1:] + step[:-1])).max(axis=0)
+        curve = np.concatenate([curve[:1], curve, curve[-1:]])
+        # The error of a straight line across each interval is about
+        # f'' h^2 / 8. Both ends are used so that an interval centred on
+        # an inflection point isn't mistaken for a straight one.
+        error = np.maximum(curve[:-1], curve[1:]) * step**2 / 8
+        refine = np.flatnonzero(error > tol)
+        if len(refine) == 0:
+            break
+        if len(freq) + len(refine) > max_evals:
+            warnings.warn('The frequency grid did not reach the tolerance '
+                          'within {} evaluations'.format(max_evals),
+                          RuntimeWarning)
+            break
+        mid = 0.5 * (freq[refine] + freq[refine + 1])
+        freq = np.insert(freq, refine + 1, mid)
+        values = np.insert(values, refine + 1,
+                           flatten(run(dict(params, freq=mid))), axis=1)
+
+    results = {'frequency':freq}
+    start = 0
+    for key, shape in layout:
+        n_rows = int(np.prod(shape))
+        results[key] = values[start:start+n_rows].reshape(shape + (len(freq),))
+        start += n_rows
+    return results
+
+def band_grids(bands, nsample=1000):
+    """Build the frequency grid of each named band.
+
+    Parameters
+    ----------
+    bands : dict
+        The bands, keyed by name. Each value is either a (low, high) tuple
+        of frequencies (in Hz), sampled at `nsample` evenly spaced
+        frequencies, or an array of frequencies, used as it is.
+    nsample : int, optional
+        The number of frequencies in each (low, high) band. Default is
+        1000.
+
+    Returns
+    -------
+    grids : dict
+        The frequencies of each band, keyed by name.
+    """
+    grids = {}
+    for name, band in bands.items():
+        if isinstance(band, tuple) and len(band) == 2:
+            low, high = band
+            grids[name] = np.linspace(low, high, nsample) if low != high \
+                else np.array([float(low)])
+        else:
+            grids[name] = np.atleast_1d(np.asarray(band, dtype=float))
+    return grids
+
+def union_grid(grids):
+    """Merge the frequency grids of several bands.
+
+    Parameters
+    ----------
+    grids : dict
+        The frequencies of each band, keyed by name (see `band_grids`).
+
+    Returns
+    -------
+    freq : numpy array
+        The sorted frequencies of every band, each only once, so bands that
+        overlap share their calculations.
+    index : dict
+        For each band, the position of its frequencies in `freq`.
+    """
+    names = list(grids)
+    freq, inverse = np.unique(np.concatenate([grids[n] for n in names]),
+                              return_inverse=True)
+    index = {}
+    start = 0
+    for name in names:
+        index[name] = inverse[start:start+len(grids[name])]
+        start += len(grids[name])
+    return freq, index
+
+def band_stats(results):
+    """Summarize the results in a band.
+
+    Parameters
+    ----------
+    results : dict
+        The results of a calculation, with frequency as the last axis.
+
+    Returns
+    -------
+    stats : dict
+        The `mean_transmittance`, `std_transmittance`,
+        `min_transmittance`, `max_transmittance`, and `mean_reflectance`
+        over frequency. Each has the shape of the results without the
+        frequency axis.
+    """
+    trans = results['transmittance']
+    return {'mean_transmittance':np.mean(trans, axis=-1),
+            'std_transmittance':np.std(trans, axis=-1),
+            'min_transmittance':np.min(trans, axis=-1),
+            'max_transmittance':np.max(trans, axis=-1),
+            'mean_reflectance':np.mean(results['reflectance'], axis=-1)}
+
+def split_bands(results, freq, index):
+    """Split the results of a calculation on the union grid into bands.
+
+    Parameters
+    ----------
+    results : dict
+        The results on the union grid, as returned by `main` or
+        `main_batch`.
+    freq : numpy array
+        The union grid, from `union_grid`.
+    index : dict
+        The position of each band's frequencies in `freq`, from
+        `union_grid`.
+
+    Returns
+    -------
+    bands : dict
+        For each band, a dictionary with the keys of `results`, in that
+        band's own frequency order, and `stats` (see `band_stats`).
+    """
+    bands = {}
+    for name, idx in index.items():
+        band = {key:val[..., idx] for key, val in results.items()
+                if key != 'frequency'}
+        band['frequency'] = freq[idx]
+        band['stats'] = band_stats(band)
+        bands[name] = band
+    return bands
+
+def select_backend(backend):
+    """Return the function that runs the transfer-matrix recursion for the
+    given backend.
+
+    Parameters
+    ----------
+    backend : str
+        Either 'numpy' or 'numba'. See `main`. The 'loop' backend has no
+        recursion to select; it is the whole calculation in `main_loop`.
+
+    Returns
+    -------
+    rt_func : function
+        A function with the same signature as `rt_amp_vec`.
+
+    Raises
+    ------
+    ValueError
+        Raised if `backend` is not recognized.
+    """
+    if backend == 'numpy':
+        return rt_amp_vec
+    if backend == 'numba':
+        if armmwave.jit.numba is None:
+            warnings.warn('Numba is not installed; falling back to the numpy '
+                          'backend.', RuntimeWarning)
+            return rt_amp_vec
+        return armmwave.jit.rt_amp_vec
+    raise ValueError("Backend must be 'numpy' or 'numba' (the 'loop' "
+                     "backend is `main_loop`)")
+
+@armmwave.profiling.profiled
+def main_loop(params):
+    """Run a transmittance/reflectance calculation one frequency at a time.
+
+    This is the original, unvectorized calculation: `rt_amp` is called for
+    each frequency (and each incident angle, and each polarization). It is
+    much slower than `main`, but is kept as a reference to check the other
+    backends against. Call it with `Model.run(backend='loop')`.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+
+    Returns
+    -------
+    result : dict
+        The same dictionary returned by `main`.
+    """
+    pol = params['pol']
+    theta0 = params['theta0']
+    freq = params['freq']
+    if pol == 'u':
+        results = [main_loop(dict(params, pol=p)) for p in ['s', 'p']]
+        return pack_results(freq,
+                            np.array([r['transmittance'] for r in results]),
+                            np.array([r['reflectance'] for r in results]),
+                            pol)
+    if np.ndim(theta0) > 0:
+        results = [main_loop(dict(params, theta0=angle)) for angle in theta0]
+        return pack_results(freq,
+                            np.array([r['transmittance'] for r in results]),
+                            np.array([r['reflectance'] for r in results]),
+                            pol)
+
+    rind = params['rind']
+    tand = np.array(params['tand'], dtype=float)
+    theta, cos_theta = snell_geometry(rind, theta0)
     ts = []
     rs = []
-
     for f in freq:
-        if len(halps.keys()) > 0:
-            tand = replace_tand(f, tand, halps)
+        tand = replace_tand(f, tand, params['halpern_layers'])
         ks = wavenumber(f, rind, tand)
-        delta = prop_wavenumber(ks, thick, theta)
+        delta = layer_phase(ks, params['thick'], cos_theta)
         r_amp, t_amp = rt_amp(rind, delta, theta, pol)
-        t_pow = t_power(t_amp, rind[0], rind[-1], theta[0], theta[-1])
-        r_pow = r_power(r_amp)
-        ts.append(t_pow)
-        rs.append(r_pow)
+        ts.append(t_power(t_amp, rind[0], rind[-1], theta[0], theta[-1]))
+        rs.append(r_power(r_amp))
+    return pack_results(freq, np.asarray(ts), np.asarray(rs), pol)
 
-    ts = np.asarray(ts)
-    rs = np.asarray(rs)
+def pack_results(freq, ts, rs, pol):
+    """Collect the calculated transmittance and reflectance into the
+    results dictionary.
 
-    results = {'frequency':freq, 'transmittance':ts, 'reflectance':rs}
-    return results
+    Parameters
+    ----------
+    freq : numpy array
+        The frequencies (Hz) at which T and R were calculated.
+    ts : numpy array
+        The transmittance. If `pol` is 'u', the first axis holds the 's'
+        and 'p' transmittances, in that order.
+    rs : numpy array
+        The reflectance, laid out like `ts`.
+    pol : string
+        The polarization of the source wave: 's', 'p', or 'u'.
+
+    Returns
+    -------
+    result : dict
+        A dictionary with the keys `frequency`, `transmittance`, and
+        `reflectance`. If `pol` is 'u', T and R are the average of the two
+        polarizations (i.e., unpolarized light), and the individual
+        polarizations are kept under `transmittance_s`, `transmittance_p`,
+        `reflectance_s`, and `reflectance_p`.
+    """
+    if pol != 'u':
+        return {'frequency':freq, 'transmittance':ts, 'reflectance':rs}
+    return {'frequency':freq,
+            'transmittance':0.5 * (ts[0] + ts[1]),
+            'reflectance':0.5 * (rs[0] + rs[1]),
+            'transmittance_s':ts[0], 'transmittance_p':ts[1],
+            'reflectance_s':rs[0], 'reflectance_p':rs[1]}
+
+def pad_stack(params, n_layer):
+    """Pad a model out to `n_layer` layers with identity layers.
+
+    The padding layers are inserted just before the terminator layer. Each
+    one has zero thickness, no loss, and the same refractive index as the
+    last material layer, so its characteristic matrix is the identity and
+    the model's response is unchanged.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by `Model.set_up`.
+    n_layer : int
+        The number of layers (including the source and terminator) the
+        padded model should have.
+
+    Returns
+    -------
+    rind, thick, tand : tuple
+        The padded refractive indices, thicknesses, and loss tangents.
+
+    Raises
+    ------
+    ValueError
+        Raised if the model already has more than `n_layer` layers.
+    """
+    rind = np.asarray(params['rind'])
+    thick = np.asarray(params['thick'])
+    tand = np.asarray(params['tand'])
+    n_pad = n_layer - len(rind)
+    if n_pad < 0:
+        raise ValueError('Cannot pad a model with {} layers to {} '
+                         'layers'.format(len(rind), n_layer))
+    rind = np.concatenate((rind[:-1], np.full(n_pad, rind[-2]), rind[-1:]))
+    thick = np.concatenate((thick[:-1], np.zeros(n_pad), thick[-1:]))
+    tand = np.concatenate((tand[:-1], np.zeros(n_pad), tand[-1:]))
+    return rind, thick, tand
+
+@armmwave.profiling.profiled
+def main_batch(params_list, backend='numpy'):
+    """Run a transmittance/reflectance calculation for many models at once.
+
+    All of the models must share the same frequencies, incident angle, and
+    polarization. Models with fewer layers than the deepest one are padded
+    with identity layers (see `pad_stack`) so that every model can be
+    carried through the same (n_model, n_freq, 2, 2) matrix product.
+
+    As with `core.main()`, call `Model.set_up()` on each model first, or use
+    `model.run_many()` instead of calling this directly.
+
+    Parameters
+    ----------
+    params_list : list
+        A list of dictionaries contructed by `Model.set_up`.
+    backend : str, optional
+        Either 'numpy' (the default) or 'numba'. See `main`.
+
+    Returns
+    -------
+    result : dict
+        A dictionary with three keys:
+         * `frequency`: the frequency (in Hz) at which T and R were calculated
+         * `transmittance`: the output transmittance (T) of each model,
+           with shape (n_model, n_freq)
+         * `reflectance`: the output reflectance (R) of each model, with
+           shape (n_model, n_freq)
+
+        If the models sweep the incident angle, T and R have shape
+        (n_model, n_angle, n_freq). If the polarization is 'u', there are
+        extra keys for each polarization; see `pack_results`.
+
+    Raises
+    ------
+    ValueError
+        Raised if `params_list` is empty, or if the models do not share the
+        same frequencies, incident angle, and polarization.
+    """
+    rt_func = select_backend(backend)
+    if len(params_list) == 0:
+        raise ValueError('Must pass at least one set of model parameters.')
+    freq = np.asarray(params_list[0]['freq'])
+    theta0 = params_list[0]['theta0']
+    pol = params_list[0]['pol']
+    for params in params_list[1:]:
+        if not np.array_equal(params['freq'], freq):
+            raise ValueError('All models must share the same frequencies.')
+        if (not np.array_equal(params['theta0'], theta0)
+                or params['pol'] != pol):
+            raise ValueError('All models must share the same incident angle '
+                             'and polarization.')
+
+    n_layer = max(len(params['rind']) for params in params_list)
+    padded = [pad_stack(params, n_layer) for params in params_list]
+    rind = np.array([p[0] for p in padded])
+    thick = np.array([p[1] for p in padded])
+    tand = np.array([p[2] for p in padded], dtype=float)
+    # Models that share their indices (e.g. differing only in thickness)
+    # share their memoized Snell angles
+    geometry = [snell_geometry(n, theta0) for n in rind]
+    theta = np.array([g[0] for g in geometry])
+    cos_theta = np.array([g[1] for g in geometry])
+    t_amp, r_amp = make_rt_interfaces(
+        rind.reshape(rind.shape[:1] + (1,) * np.ndim(theta0) + rind.shape[1:]),
+        theta, pol)
+
+    # Expand the loss tangents to (n_model, n_freq, n_layer) only if some
+    # model needs a frequency-dependent loss term. Padding goes in after the
+    # material layers, so the Halpern layer positions are still valid.
+    tand = tand[:, np.newaxis, :]
+    if any(len(params['halpern_layers']) > 0 for params in params_list):
+        tand = np.array([halpern_tand(freq, t[0], params['halpern_layers'])
+                         for t, params in zip(tand, params_list)])
+
+    # Line everything up as (n_model, [n_angle,] n_freq, n_layer)
+    n_angle_axes = np.ndim(theta0)
+    expand = (slice(None),) + (np.newaxis,) * (n_angle_axes + 1)
+    tand = tand.reshape(tand.shape[:1] + (1,) * n_angle_axes + tand.shape[1:])
+    ks = wavenumber(freq[:, np.newaxis], rind[expand], tand)
+    delta = layer_phase(ks, thick[expand], cos_theta[..., np.newaxis, :])
+    armmwave.profiling.record('tand', tand)
+    armmwave.profiling.record('delta', delta)
+    r_amps, t_amps = rt_func(delta, t_amp[..., np.newaxis, :],
+                             r_amp[..., np.newaxis, :])
+    ts = t_power(t_amps, rind[expand][..., 0], rind[expand][..., -1],
+                 theta[..., :1], theta[..., -1:])
+    rs = r_power(r_amps)
+
+    return pack_results(freq, ts, rs, pol)
+
+def snell_angle(index, index0, theta0):
+    """Calculate the Snell angle in a layer directly from the source.
+
+    Because `n * sin(theta)` is the same in every layer, the angle in a
+    layer depends only on its own refractive index and on the source
+    layer, not on the layers in between. This lets us build up a model
+    one layer at a time.
+
+    Past the critical angle the angle is complex, which gives the
+    evanescent (exponentially decaying) wave in that layer rather than a
+    NaN.
+
+    Parameters
+    ----------
+    index : numpy array or float
+        The refractive index (or indices) of the layer(s).
+    index0 : float
+        The refractive index of the source layer.
+    theta0 : numpy array or float
+        The initial angle of incidence (radians)
+
+    Returns
+    -------
+    theta : numpy array or float
+        The Snell angle(s) in the layer(s). The result is only complex if
+        some layer is past the critical angle.
+    """
+    sin_theta = np.asarray(index0 * np.sin(theta0) / index, dtype=complex)
+    return np.real_if_close(np.arcsin(sin_theta))
+
+def char_matrix(freq, index, thick, tand, next_index, index0, theta0, pol):
+    """Construct the characteristic matrix of a single material layer at
+    every frequency.
+
+    The matrix includes the phase accumulated crossing the layer and the
+    interface leaving it, so it depends on the index of the next layer
+    but on nothing else in the model. Multiplying these matrices together
+    (from the source side) gives the product built by `rt_amp_vec`.
+
+    Parameters
+    ----------
+    freq : numpy array
+        The frequencies (Hz) at which to construct the matrix.
+    index : float
+        The refractive index of the layer.
+    thick : float
+        The thickness of the layer (in meters).
+    tand : numpy array or float
+        The loss tangent of the layer, either constant or one per
+        frequency.
+    next_index : float
+        The refractive index of the next layer toward the terminator.
+    index0 : float
+        The refractive index of the source layer.
+    theta0 : float
+        The initial angle of incidence (radians)
+    pol : string
+        The polarization of the source wave: 's' or 'p'.
+
+    Returns
+    -------
+    m_mat : numpy array
+        The characteristic matrix, with shape (n_freq, 2, 2).
+    """
+    theta = snell_angle(index, index0, theta0)
+    next_theta = snell_angle(next_index, index0, theta0)
+    delta = wavenumber(np.asarray(freq), index, tand) * thick * np.cos(theta)
+    t_amp = t_interface(index, next_index, theta, next_theta, pol)
+    r_amp = r_interface(index, next_index, theta, next_theta, pol)
+    return layer_matrix(delta, t_amp, r_amp)
+
+def interface_matrix(index0, next_index, theta0, pol):
+    """Construct the matrix of the interface between the source layer and
+    the first material layer.
+
+    Parameters
+    ----------
+    index0 : float
+        The refractive index of the source layer.
+    next_index : float
+        The refractive index of the first material layer.
+    theta0 : float
+        The initial angle of incidence (radians)
+    pol : string
+        The polarization of the source wave: 's' or 'p'.
+
+    Returns
+    -------
+    C_m : numpy array
+        The 2x2 interface matrix.
+    """
+    next_theta = snell_angle(next_index, index0, theta0)
+    t_amp = t_interface(index0, next_index, theta0, next_theta, pol)
+    r_amp = r_interface(index0, next_index, theta0, next_theta, pol)
+    return make_2x2(1., r_amp, r_amp, 1., dtype=complex) / t_amp
+
+def product_rt(m_prime):
+    """Calculate the reflected and transmitted amplitudes from the full
+    matrix product of a model.
+
+    Parameters
+    ----------
+    m_prime : numpy array
+        The product of the source interface matrix and the characteristic
+        matrices of every material layer, with shape (..., 2, 2).
+
+    Returns
+    -------
+    r, t : tuple
+        A tuple where 'r' is the reflected amplitude, and 't' is the
+        transmitted amplitude.
+    """
+    trans_amp = 1 / m_prime[..., 0, 0]
+    ref_amp = m_prime[..., 1, 0] / m_prime[..., 0, 0]
+    return ref_amp, trans_amp
@@ -0,0 +1,127 @@
+"""
+This module contains an optional JIT-compiled version of the
+transfer-matrix recursion, for use with ``Model.run(backend='numba')``.
+
+It needs Numba. If Numba isn't installed the module still imports, but
+`numba` is `None` and ``Model.run()`` falls back to the NumPy backend.
+
+The compiled kernel is cached to disk (in the usual Numba cache location,
+e.g. `__pycache__` next to this file, or `NUMBA_CACHE_DIR` if set), so it
+is only compiled once; later processes, such as the workers of a parallel
+crunch, load it from the cache.
+"""
+
+import numpy as np
+import armmwave.profiling
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _rt_kernel(delta, t_amp, r_amp):
+    """Run the transfer-matrix recursion for every row of `delta`.
+
+    Parameters
+    ----------
+    delta : numpy array
+        Wavenumber offsets with shape (n_group, n_freq, N).
+    t_amp : numpy array
+        Interface t-amplitudes with shape (n_group, N-1).
+    r_amp : numpy array
+        Interface r-amplitudes with shape (n_group, N-1).
+
+    Returns
+    -------
+    r, t : tuple
+        The reflected and transmitted amplitudes, each with shape
+        (n_group, n_freq).
+    """
+    n_group, n_freq, n_layer = delta.shape
+    ref_amp = np.empty((n_group, n_freq), dtype=np.complex128)
+    trans_amp = np.empty((n_group, n_freq), dtype=np.complex128)
+    for g in range(n_group):
+        r0 = r_amp[g, 0]
+        t0 = t_amp[g, 0]
+        for f in range(n_freq):
+            m00 = 1. + 0j
+            m01 = 0. + 0j
+            m10 = 0. + 0j
+            m11 = 1. + 0j
+            for i in range(1, n_layer-1):
+                phase = np.exp(-1j * delta[g, f, i])
+                inv_phase = 1 / phase
+                alpha = 1 / t_amp[g, i]
+                beta = r_amp[g, i] * alpha
+                u = m00 * phase
+                v = m01 * inv_phase
+                m00 = alpha * u + beta * v
+                m01 = beta * u + alpha * v
+                u = m10 * phase
+                v = m11 * inv_phase
+                m10 = alpha * u + beta * v
+                m11 = beta * u + alpha * v
+            m_prime00 = (m00 + r0 * m10) / t0
+            m_prime10 = (r0 * m00 + m10) / t0
+            trans_amp[g, f] = 1 / m_prime00
+            ref_amp[g, f] = m_prime10 / m_prime00
+    return ref_amp, trans_amp
+
+
+if numba is not None:
+    _rt_kernel = numba.njit(cache=True, nogil=True)(_rt_kernel)
+
+
+@armmwave.profiling.profiled
+def rt_amp_vec(delta, t_amp, r_amp):
+    """Calculate the reflected and transmitted amplitudes through the
+    system with the compiled kernel.
+
+    Takes the same arguments, with the same broadcasting rules, as
+    `core.rt_amp_vec`. The second-to-last axis of `delta` is taken to be
+    the frequency axis, which `t_amp` and `r_amp` don't vary along.
+
+    Parameters
+    ----------
+    delta : numpy array
+        An array of wavenumber offsets with shape (..., n_freq, N).
+    t_amp : numpy array
+        The t-amplitudes of the N-1 interfaces, with shape (..., 1, N-1)
+        or (N-1,).
+    r_amp : numpy array
+        The r-amplitudes of the N-1 interfaces, shaped like `t_amp`.
+
+    Returns
+    -------
+    r, t : tuple
+        A tuple where 'r' is the reflected amplitude, and 't' is the
+        transmitted amplitude. Both have the leading shape of `delta`.
+
+    Raises
+    ------
+    ImportError
+        Raised if Numba is not installed.
+    """
+    if numba is None:
+        raise ImportError('The numba backend needs Numba to be installed.')
+    delta = np.asarray(delta, dtype=complex)
+    t_amp = np.asarray(t_amp, dtype=complex)
+    r_amp = np.asarray(r_amp, dtype=complex)
+    if t_amp.ndim == 1:
+        t_amp = t_amp[np.newaxis, :]
+        r_amp = r_amp[np.newaxis, :]
+
+    # Everything in front of the frequency axis gets flattened into one
+    # "group" axis for the kernel
+    group_shape = np.broadcast(delta[..., 0, 0], t_amp[..., 0, 0]).shape
+    n_freq, n_layer = delta.shape[-2:]
+    delta = np.broadcast_to(delta, group_shape + (n_freq, n_layer))
+    t_amp = np.broadcast_to(t_amp[..., 0, :], group_shape + (n_layer-1,))
+    r_amp = np.broadcast_to(r_amp[..., 0, :], group_shape + (n_layer-1,))
+    ref_amp, trans_amp = _rt_kernel(
+        np.ascontiguousarray(delta.reshape((-1, n_freq, n_layer))),
+        np.ascontiguousarray(t_amp.reshape((-1, n_layer-1))),
+        np.ascontiguousarray(r_amp.reshape((-1, n_layer-1))))
+    return (ref_amp.reshape(group_shape + (n_freq,)),
+            trans_amp.reshape(group_shape + (n_freq,)))
@@ -5,6 +5,7 @@ some physical properties that we need to access (and possibly update)
 throughout our calculations.
 """
 
+import numbers
 import numpy as np
 
 
@@ -35,6 +36,13 @@ class BaseLayer:
     def __repr__(self):
         return '{} (Basic layer)'.format(self.desc)
 
+    def __add__(self, other):
+        """Join this layer and `other` (a layer or ``stack.Stack``) into a
+        ``stack.Stack``."""
+        # Imported here because `armmwave.stack` imports this module
+        import armmwave.stack
+        return armmwave.stack.Stack([self]) + other
+
     def get_rind(self):
         """Return the layer refractive index."""
         return self.rind
@@ -143,3 +151,25 @@ class _Void(BaseLayer):
 
     def __repr__(self):
         return 'There is nothing but {}'.format(self.desc)
+
+
+def has_halpern(layer):
+    """Return True if a layer has a frequency-dependent (Halpern) loss
+    tangent, i.e. both its `halperna` and `halpernb` are numbers (not None
+    or NaN). Layers without the coefficients, like ``Source`` and
+    ``Terminator``, never do.
+
+    Parameters
+    ----------
+    layer : BaseLayer or LayerView
+        The layer.
+
+    Returns
+    -------
+    halpern : bool
+        Whether the layer's loss tangent comes from its Halpern
+        coefficients.
+    """
+    return all(isinstance(val, numbers.Real) and not np.isnan(val)
+               for val in (getattr(layer, 'halperna', None),
+                           getattr(layer, 'halpernb', None)))
@@ -1,10 +1,29 @@
 """
 Contains the methods and attributes of a ``Model``.
 """
+import asyncio
+import concurrent.futures
+import copy
+import functools
+import os
 import sys
+import threading
+import weakref
 import numpy as np
+import armmwave.cache
 import armmwave.layer
 import armmwave.core
+import armmwave.profiling
+import armmwave.stack
+
+# The thread pool shared by `Model.run_async()` and `run_threaded()`,
+# created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+# The calculations started by `Model.arun()` that haven't finished yet,
+# for each event loop, keyed by their parameters (see `_flight_key`)
+_in_flight = weakref.WeakKeyDictionary()
 
 class Model:
     """The ``Model`` class is the framework used to assemble the simulation
@@ -28,12 +47,19 @@ class Model:
         [500e6, 500e9] with 1000 evenly-spaced samples if not set before
         ``Model.run()`` is called.
     pol : str
-        The target polarization, either `s` or `p`. Defaults to `s` if not
-        set before ``Model.run()`` is called.
-    incident_angle : float
+        The target polarization, either `s` or `p`, or `u` for both at once
+        (unpolarized). Defaults to `s` if not set before ``Model.run()`` is
+        called.
+    incident_angle : float or array_like
         The initial angle (in radians; with respect to normal) at which the
         wave should strike the model. Defaults to 0 if not set before
-        ``Model.run()`` is called.
+        ``Model.run()`` is called. If ``Model.angle_range`` is set, this is
+        the same array of angles.
+    angle_range : array_like
+        The initial angles (in radians) at which to run the calculation. May
+        be set through the ``Model.set_angle_range()`` class method. If set
+        before ``Model.set_up()`` is called, it overrides `theta0` and the
+        results gain an angle axis.
     rinds : array_like
         A collection of refractive indices for each ``Layer`` in the model,
         ordered from ``Layer.Source`` to ``Layer.Terminator``.
@@ -58,6 +84,7 @@ class Model:
         self.freq_range = None
         self.pol = None
         self.incident_angle = None
+        self.angle_range = None
         self.rinds = None
         self.tands = None
         self.halpern_layers = None
@@ -100,17 +127,47 @@ class Model:
         return self.freq_range
 
     def set_angle_range(self, angle1, angle2, nsample=50):
-        """Not implemented.
+        """Set ``Model.angle_range``, the incident angles over which the
+        model's response will be calculated.
+
+        The angles are evaluated together with the frequencies in a single
+        pass, and ``Model.run()`` returns `T` and `R` with shape
+        (number of angles, number of frequencies). Call this before
+        ``Model.set_up()``.
+
+        Parameters
+        ----------
+        angle1 : float
+            The lower angle bound (in radians; with respect to normal).
+        angle2 : float
+            The upper angle bound (in radians; with respect to normal).
+        nsample : int, optional
+            The number of evenly-spaced samples between `angle1` and
+            `angle2`. Default is 50.
 
-        Will implement once pi/2 is handled more carefully.
+        Returns
+        -------
+        angle_range : numpy array
 
         Raises
         ------
-        NotImplementedError
-            This function is not implemented.
+        ValueError
+            Raised if `nsample` < 0, or if either angle is outside
+            [0, pi/2].
+
         """
-        raise NotImplementedError('Coming soon! Maybe!')
+        if nsample <= 0:
+            raise ValueError('nsample must be a positive number')
+        for angle in [angle1, angle2]:
+            if angle < 0 or angle > np.pi/2:
+                raise ValueError('Incident angles must be between 0 and pi/2.')
+        if angle1 == angle2:
+            self.angle_range = np.array([angle1])
+        else:
+            self.angle_range = np.linspace(angle1, angle2, num=nsample)
+        return self.angle_range
 
+    @armmwave.profiling.profiled
     def set_up(self, layers, low_freq=500e6, high_freq=500e9, theta0=0., pol='s'):
         """Assemble the necessary model components.
 
@@ -119,21 +176,25 @@ class Model:
 
         Parameters
         ----------
-        layers : list
+        layers : list or Stack
             A list containing ``Layer`` objects ordered from ``Layer.Source``
             to ``Layer.Terminator``. Note that the ``Layer.Source`` and
             ``Layer.Terminator`` layers should be the first and last entries of
-            the list, respectively.
+            the list, respectively. May also be a ``stack.Stack``, which is
+            faster to set up when there are many layers or many models.
         low_freq : float, optional
             The lower frequency bound (in Hz). Default is 500e6 (500 MHz).
         high_freq : float, optional
             The upper frequency bound (in Hz). Default is 500e9 (500 GHz).
         theta0 : float, optional
             The initial angle (radians; with respect to normal) at which the
-            wave should strike the model. Default is 0.
+            wave should strike the model. Default is 0. Ignored if
+            ``Model.angle_range`` has been set.
         pol : str, optional
             The target polarization for the calculation. Must be either `s`,
-            or `p`. Default is `s`.
+            `p`, or `u`. `u` calculates both polarizations in one pass and
+            returns their average (i.e., unpolarized light) along with each
+            polarization. Default is `s`.
 
         Raises
         ------
@@ -151,6 +212,18 @@ class Model:
         if len(layers) < 3:
             raise IndexError('Must pass a Source layer, at least one material '
                              'layer, and a Terminator layer.')
+        if isinstance(layers, armmwave.stack.Stack):
+            if layers.data['kind'][0] != armmwave.stack.SOURCE:
+                raise TypeError('The first layer must be a Source layer.')
+            if layers.data['kind'][-1] != armmwave.stack.TERMINATOR:
+                raise TypeError('The last layer must be a Terminator layer.')
+            # A Stack already holds its properties as arrays, so we can skip
+            # walking the layers
+            self.struct = layers
+            (self.rinds, self.tands, self.thicks,
+             self.halpern_layers) = layers.model_arrays()
+            self._finish_set_up(low_freq, high_freq, theta0, pol)
+            return
         if not isinstance(layers[0], armmwave.layer.Source):
             raise TypeError('The first layer must be a Source layer.')
         if not isinstance(layers[-1], armmwave.layer.Terminator):
@@ -159,13 +232,6 @@ class Model:
         self.struct = layers
         term_layer = self.struct[-1]
         last_material = self.struct[-2]
-        # It could be that we want to use a terminating layer with a refractive
-        # index != 1, so we'll check for that here. If the user has set a n
-        # to be something other than 1, then we don't really care what they
-        # set 'vac' to be, so we short circuit that logic.
-        if term_layer.rind == 1.0:
-            if not term_layer.vac:
-                term_layer.rind = last_material.rind
         # We need to check whether any of the layers will use a frequency-
         # dependent loss tangent based on Halpern's 'a' and 'b' coefficients.
         # If so, we need to pass the position of that layer to the core code
@@ -177,16 +243,38 @@ class Model:
         self.halpern_layers = {}
         for index, l in enumerate(self.struct):
             if l.desc != 'Source layer' and l.desc != 'Terminator layer':
-                if isinstance(l.halperna, float) and isinstance(l.halpernb, float):
-                    self.halpern_layers[index] = {'a':l.halperna, 'b':l.halpernb,
+                if armmwave.layer.has_halpern(l):
+                    self.halpern_layers[index] = {'a':float(l.halperna),
+                                                  'b':float(l.halpernb),
                                                   'n':l.rind}
 
         self.rinds = [l.rind for l in self.struct]
+        # It could be that we want to use a terminating layer with a refractive
+        # index != 1, so we'll check for that here. If the user has set a n
+        # to be something other than 1, then we don't really care what they
+        # set 'vac' to be, so we short circuit that logic. The layer itself
+        # is left alone, so layers can be shared between models (and
+        # threads).
+        if term_layer.rind == 1.0:
+            if not term_layer.vac:
+                self.rinds[-1] = last_material.rind
         self.tands = [l.tand for l in self.struct]
         self.thicks = [l.thick for l in self.struct]
+        self._finish_set_up(low_freq, high_freq, theta0, pol)
+        return
+
+    def _finish_set_up(self, low_freq, high_freq, theta0, pol):
+        """Set the frequencies, angle, and polarization, and build the
+        calculation parameters. Called by ``Model.set_up()`` once the layer
+        properties are known."""
         if self.freq_range is None:
             self.set_freq_range(freq1=low_freq, freq2=high_freq)
-        if np.isclose(theta0, np.pi/2):
+        # An angle sweep may run all the way to grazing incidence, where the
+        # transmittance goes smoothly to zero. A single angle is expected to
+        # be a usable operating point, so we still reject it there.
+        if self.angle_range is not None:
+            theta0 = self.angle_range
+        elif np.isclose(theta0, np.pi/2):
             raise ValueError('Incident angle is too close to pi/2. '\
                              'Maximum allowed angle is '\
                              '89.999 degrees ~= 1.5707788735023767 radians.')
@@ -235,6 +323,16 @@ class Model:
         sim_args['theta0'] = theta0
         sim_args['pol'] = pol
         sim_args['halpern_layers'] = halpern_layers
+
+        # The Snell angles and the interface amplitudes are the same at every
+        # frequency, so work them out once here rather than in the core loop.
+        # The amplitudes are stored per interface (N-1 of them), ordered from
+        # the Source/first-layer interface to the last-layer/Terminator one.
+        sim_args['theta'] = armmwave.core.refract(sim_args['rind'], theta0)
+        t_amp, r_amp = armmwave.core.make_rt_interfaces(sim_args['rind'],
+                                                        sim_args['theta'], pol)
+        sim_args['t_amp'] = t_amp
+        sim_args['r_amp'] = r_amp
         return sim_args
 
     def reset_model(self):
@@ -243,11 +341,66 @@ class Model:
             self.__dict__[key] = None
         return
 
-    def run(self):
+    @armmwave.profiling.profiled
+    def run(self, backend='numpy', chunk_size=None, max_memory=None,
+            cache=None, gradient=False, profile=False, band=None,
+            weight=None, tol=1e-5):
         """Calculate transmittance and reflectance for the given model.
 
         This function is the primary entry-point to the main calculations.
 
+        Parameters
+        ----------
+        backend : str, optional
+            The calculation engine to use:
+             * `numpy` : the vectorized NumPy engine, ``core.main()``.
+               This is the default.
+             * `numba` : the vectorized engine, with the transfer-matrix
+               recursion compiled by Numba (see ``armmwave.jit``). Falls
+               back to `numpy`, with a warning, if Numba isn't installed.
+             * `loop` : the original frequency-by-frequency calculation,
+               ``core.main_loop()``. Much slower; useful as a reference.
+        chunk_size : int, optional
+            Calculate the frequencies in blocks of this many samples, to
+            bound peak memory on very dense frequency grids. Ignored by the
+            `loop` backend, which already works one frequency at a time.
+        max_memory : int, optional
+            A rough memory budget, in bytes, for the calculation. Used to
+            pick `chunk_size` if that isn't given.
+        cache : ResultCache, optional
+            A ``cache.ResultCache`` to look the results up in before
+            calculating them, and to store them in afterwards. Models with
+            the same parameters share results, whichever backend
+            calculated them.
+        gradient : bool, optional
+            Also calculate the derivatives of `T` and `R` with respect to
+            the thickness, refractive index, and loss tangent of each layer
+            between the Source and Terminator (see
+            ``core.main_gradient()``). These are analytic, and the run
+            costs about four to seven times as much. The terminator's
+            index is held fixed, even when it was taken from the last
+            material. `backend` is ignored. Default is False.
+        profile : bool, optional
+            Record the time and calls of each stage of the calculation,
+            the sizes of the largest arrays, and the peak memory, with a
+            ``profiling.Profiler``. This slows the calculation down.
+            Default is False.
+        band : tuple, optional
+            A (low, high) frequency band (in Hz). If given, return `T` and
+            `R` averaged over the band instead of at each frequency of
+            ``Model.freq_range``, using adaptive quadrature (see
+            ``core.band_average()``). This takes tens of frequencies for a
+            smooth response, rather than a dense grid. `chunk_size` and
+            `max_memory` are ignored, and the results aren't kept for
+            ``Model.save()``.
+        weight : callable or tuple, optional
+            A spectral response to weight the band average by: a function
+            of frequency (in Hz), or a tuple of (frequencies, response)
+            arrays. Only used with `band`. Default is a flat response.
+        tol : float, optional
+            The tolerance on the band averages. Only used with `band`.
+            Default is 1e-5.
+
         Returns
         -------
         results : dict
@@ -259,21 +412,375 @@ class Model:
              * `reflectance` : numpy array of reflectances (`R`) for each
                frequency
 
+            If ``Model.angle_range`` was set, `T` and `R` have shape
+            (number of angles, number of frequencies).
+
+            If ``Model.pol`` is `u`, `T` and `R` are the average of the two
+            polarizations, and there are four more keys:
+            `transmittance_s`, `transmittance_p`, `reflectance_s`, and
+            `reflectance_p`.
+
+            If `gradient` is True, there are six more keys:
+            `transmittance_grad_thick`, `transmittance_grad_rind`,
+            `transmittance_grad_tand`, and the same for `reflectance`. Each
+            has the shape of `T` plus a last axis for the layers.
+
+            If `profile` is True, there is one more key, `profile`, with
+            the ``Profiler.report()`` dictionary.
+
+            If `band` is given, `T` and `R` are band averages (a scalar, or
+            one value per angle), there is no `frequency`, and there are
+            three more keys: `band`, `error` (the estimated error of the
+            averages), and `n_evaluations`.
+
+        Raises
+        ------
+        KeyError
+            Raised if ``Model.set_up()`` hasn't been called.
+        ValueError
+            Raised if both `band` and `gradient` are given.
+
         """
         try:
             assert bool(self._sim_params)
         except AssertionError:
             raise KeyError('Did not find calculation-ready parameters. '
                            'Must call `set_up()` before calling `run()`')
-        results = armmwave.core.main(self._sim_params)
+        if profile:
+            with armmwave.profiling.Profiler() as prof:
+                results = self.run(backend, chunk_size, max_memory, cache,
+                                   gradient, band=band, weight=weight,
+                                   tol=tol)
+            results = dict(results, profile=prof.report())
+            if band is None:
+                self._sim_results = results
+            return results
+        if band is not None:
+            if gradient:
+                raise ValueError('Band averages do not support `gradient`')
+            # A weight function can't be hashed, so weighted averages are
+            # always calculated
+            if weight is not None:
+                cache = None
+            if cache is not None:
+                key = '{}-band-{!r}-{!r}-{!r}'.format(
+                    armmwave.cache.hash_params(self._sim_params),
+                    float(band[0]), float(band[1]), tol)
+                results = cache.get(key)
+                if results is not None:
+                    return results
+            results = armmwave.core.band_average(self._sim_params, band[0],
+                                                 band[1], weight=weight,
+                                                 tol=tol, backend=backend)
+            if cache is not None:
+                cache.put(key, results)
+            return results
+        if cache is not None:
+            key = armmwave.cache.hash_params(self._sim_params)
+            if gradient:
+                key += '-gradient'
+            results = cache.get(key)
+            if results is not None:
+                self._sim_results = results
+                return results
+        if backend == 'loop' and not gradient:
+            results = armmwave.core.main_loop(self._sim_params)
+        elif chunk_size is not None or max_memory is not None:
+            results = armmwave.core.main_chunked(self._sim_params, chunk_size,
+                                                 max_memory, backend=backend,
+                                                 gradient=gradient)
+        elif gradient:
+            results = armmwave.core.main_gradient(self._sim_params)
+        else:
+            results = armmwave.core.main(self._sim_params, backend=backend)
+        if cache is not None:
+            cache.put(key, results)
         self._sim_results = results
         return results
 
+    def run_async(self, executor=None, **kwargs):
+        """Start ``Model.run()`` in a thread pool, and return at once.
+
+        The calculation is thread-safe and does its heavy work in large
+        NumPy (or, with `backend='numba'`, compiled) calls that release
+        the GIL, so several models can run at the same time in one
+        process. This suits threaded servers, where starting processes is
+        expensive.
+
+        The model is copied when this is called, so calling
+        ``Model.set_up()`` again while the calculation runs doesn't change
+        its results. When it finishes, the results are stored on the
+        model as if ``Model.run()`` had been called, unless the model has
+        been set up again in the meantime; then they no longer match its
+        parameters, and are only returned through the future.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            The executor to run in. Default is the shared thread pool from
+            `get_executor`.
+        **kwargs
+            Passed on to ``Model.run()``.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            A future whose result is the dictionary returned by
+            ``Model.run()``.
+
+        Raises
+        ------
+        KeyError
+            Raised if ``Model.set_up()`` hasn't been called.
+
+        """
+        try:
+            assert bool(self._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` before calling '
+                           '`run_async()`')
+        if executor is None:
+            executor = get_executor()
+        snapshot = copy.copy(self)
+
+        def run_and_store():
+            results = snapshot.run(**kwargs)
+            # Results for parameters the model no longer has are dropped
+            if self._sim_params is snapshot._sim_params:
+                self._sim_results = snapshot._sim_results
+            return results
+        return executor.submit(run_and_store)
+
+    async def arun(self, executor=None, **kwargs):
+        """Calculate transmittance and reflectance without blocking the
+        event loop.
+
+        This is the `asyncio` version of ``Model.run()``: the calculation
+        runs in `executor` (see ``Model.run_async()``) while the event loop
+        carries on. Calls for models with the same parameters (by
+        ``cache.hash_params()``) and the same options, made while one of
+        them is still running, share that one calculation.
+
+        Cancelling the call stops waiting for the results. The shared
+        calculation is only cancelled once every call waiting on it has
+        been; a calculation that has already started in a thread runs to
+        the end, but its results are dropped.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            The executor to run in. Default is the shared thread pool from
+            `get_executor`.
+        **kwargs
+            Passed on to ``Model.run()``.
+
+        Returns
+        -------
+        results : dict
+            The dictionary returned by ``Model.run()``. Calls that share a
+            calculation each get their own (deep) copy. The results are
+            also stored on the model, unless it has been set up again
+            since the call (see ``Model.run_async()``).
+
+        Raises
+        ------
+        KeyError
+            Raised if ``Model.set_up()`` hasn't been called.
+
+        """
+        try:
+            assert bool(self._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` before calling `arun()`')
+        params = self._sim_params
+        loop = asyncio.get_running_loop()
+        flights = _in_flight.setdefault(loop, {})
+        key = _flight_key(self._sim_params, kwargs)
+        flight = flights.get(key) if key is not None else None
+        if flight is None:
+            if executor is None:
+                executor = get_executor()
+            # Copy the model, so setting it up again doesn't change a
+            # calculation in progress
+            snapshot = copy.copy(self)
+            flight = {'future':loop.run_in_executor(
+                executor, functools.partial(snapshot.run, **kwargs)),
+                      'waiters':0}
+            if key is not None:
+                flights[key] = flight
+                flight['future'].add_done_callback(
+                    lambda future: _land(flights, key, flight))
+        flight['waiters'] += 1
+        try:
+            # Shield the shared calculation from this caller's cancellation
+            results = await asyncio.shield(flight['future'])
+        except asyncio.CancelledError:
+            flight['waiters'] -= 1
+            if flight['waiters'] == 0:
+                flight['future'].cancel()
+                _land(flights, key, flight)
+            raise
+        flight['waiters'] -= 1
+        # Nested values, like the `profile` report, are copied too
+        results = copy.deepcopy(results)
+        if self._sim_params is params:
+            self._sim_results = results
+        return results
+
+    def run_adaptive(self, tol=1e-3, n_initial=33, max_evals=20000,
+                     backend='numpy'):
+        """Calculate transmittance and reflectance on a frequency grid that
+        is dense only where the response changes quickly.
+
+        The grid spans ``Model.freq_range``, but its spacing is picked by
+        ``core.adaptive_sample()``. The grid is made fine enough to resolve
+        the Fabry-Perot fringes of thick layers, and is refined further
+        wherever linear interpolation between samples would be off by more
+        than `tol`. Flat regions get few samples.
+
+        Parameters
+        ----------
+        tol : float, optional
+            The largest error allowed when linearly interpolating `T` or
+            `R` between neighbouring frequencies. Default is 1e-3.
+        n_initial : int, optional
+            The number of evenly spaced frequencies to start from. Default
+            is 33.
+        max_evals : int, optional
+            The most frequencies to calculate. Default is 20000.
+        backend : str, optional
+            Either `numpy` (the default), `numba`, or `loop`. See
+            ``Model.run()``.
+
+        Returns
+        -------
+        results : dict
+            The same dictionary as ``Model.run()``, with the unevenly
+            spaced frequencies under `frequency`.
+
+        """
+        try:
+            assert bool(self._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` before calling '
+                           '`run_adaptive()`')
+        freq = self._sim_params['freq']
+        results = armmwave.core.adaptive_sample(
+            self._sim_params, np.min(freq), np.max(freq), tol=tol,
+            n_initial=n_initial, max_evals=max_evals, backend=backend)
+        self._sim_results = results
+        return results
+
+    def run_bands(self, bands, nsample=1000, backend='numpy', cache=None):
+        """Calculate transmittance and reflectance in several named
+        frequency bands in one pass.
+
+        The bands are merged onto one frequency grid (see
+        ``core.union_grid()``), calculated together, and split up again,
+        so several bands cost one calculation rather than one each.
+        ``Model.freq_range`` is ignored.
+
+        Parameters
+        ----------
+        bands : dict
+            The bands, keyed by name. Each value is either a (low, high)
+            tuple of frequencies (in Hz), sampled at `nsample` evenly
+            spaced frequencies, or an array of frequencies.
+        nsample : int, optional
+            The number of frequencies in each (low, high) band. Default is
+            1000.
+        backend : str, optional
+            Either `numpy` (the default), `numba`, or `loop`. See
+            ``Model.run()``.
+        cache : ResultCache, optional
+            See ``Model.run()``. The calculation on the merged grid is
+            cached.
+
+        Returns
+        -------
+        results : dict
+            For each band, a dictionary with the same keys as
+            ``Model.run()``, on that band's frequencies, and `stats`: the
+            mean, standard deviation, minimum and maximum of `T`, and the
+            mean of `R`, over the band (see ``core.band_stats()``). The
+            results on the merged grid are kept for ``Model.save()``.
+
+        """
+        try:
+            assert bool(self._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` before calling '
+                           '`run_bands()`')
+        freq, index = armmwave.core.union_grid(
+            armmwave.core.band_grids(bands, nsample))
+        params = dict(self._sim_params, freq=freq)
+        results = None
+        if cache is not None:
+            key = armmwave.cache.hash_params(params)
+            results = cache.get(key)
+        if results is None:
+            if backend == 'loop':
+                results = armmwave.core.main_loop(params)
+            else:
+                results = armmwave.core.main(params, backend=backend)
+            if cache is not None:
+                cache.put(key, results)
+        self._sim_results = results
+        return armmwave.core.split_bands(results, freq, index)
+
+    def iter_run(self, chunk_size=None, max_memory=None, backend='numpy'):
+        """Calculate transmittance and reflectance in blocks of frequency,
+        yielding each block as it is finished.
+
+        Use this instead of ``Model.run()`` when the full results won't fit
+        in memory, e.g. to write them to disk as they are calculated. The
+        results are not stored on the ``Model``.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            The number of frequencies in each block.
+        max_memory : int, optional
+            A rough memory budget, in bytes, used to pick `chunk_size` if
+            that isn't given. One of `chunk_size` or `max_memory` must be
+            given.
+        backend : str, optional
+            Either `numpy` (the default) or `numba`. See ``Model.run()``.
+
+        Yields
+        ------
+        results : dict
+            The results for one block of frequencies, with the same keys
+            as ``Model.run()``.
+
+        """
+        try:
+            assert bool(self._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` before calling `iter_run()`')
+        if chunk_size is None:
+            if max_memory is None:
+                raise ValueError('Must give one of `chunk_size` or '
+                                 '`max_memory`')
+            chunk_size = armmwave.core.estimate_chunk_size(self._sim_params,
+                                                           max_memory)
+        for block, results in armmwave.core.iter_chunks(self._sim_params,
+                                                        chunk_size, backend):
+            yield results
+
     def save(self, dest):
         """Write calculation results to a file.
 
         Write the simulated transmittance and reflectance to a file at `dest`.
         The output includes a header describing the simulation parameters.
+        For an angle sweep there is one transmittance column and one
+        reflectance column per incident angle, in the order of
+        ``Model.angle_range``.
 
         Parameters
         ----------
@@ -296,7 +803,238 @@ class Model:
             'Thicknesses (m): {}'.format(self.thicks),
             '\n',
             'Frequency\t\t\tTransmittance\t\t\tReflectance',]
+        if np.ndim(ts) == 2:
+            header[-1] = 'Frequency\t\t\tTransmittance (per angle)\t\t\t'\
+                         'Reflectance (per angle)'
 
-        np.savetxt(dest, np.c_[fs, ts, rs], delimiter='\t',
-                    header='\n'.join(header))
+        np.savetxt(dest, np.c_[fs, np.transpose(ts), np.transpose(rs)],
+                   delimiter='\t', header='\n'.join(header))
         return
+
+def run_many(models, backend='numpy'):
+    """Calculate transmittance and reflectance for many models in one call.
+
+    The models are evaluated together by ``core.main_batch()``, which is
+    much faster than calling ``Model.run()`` on each one when there are many
+    models. Every model must already be set up, and they must all share the
+    same frequencies, incident angle, and polarization. They may have
+    different numbers of layers.
+
+    Parameters
+    ----------
+    models : list
+        A list of ``Model`` objects that have been set up with
+        ``Model.set_up()``.
+    backend : str, optional
+        Either `numpy` (the default) or `numba`. See ``Model.run()``.
+
+    Returns
+    -------
+    results : dict
+        A dictionary with three keys:
+         * `frequency` : numpy array of frequencies corresponding
+           to `T` and `R`
+         * `transmittance` : numpy array of transmittances (`T`) with
+           shape (number of models, number of frequencies)
+         * `reflectance` : numpy array of reflectances (`R`) with
+           shape (number of models, number of frequencies)
+
+        Each model's own results are also stored, as if ``Model.run()``
+        had been called.
+
+    """
+    for m in models:
+        try:
+            assert bool(m._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` on every model before '
+                           'calling `run_many()`')
+    results = armmwave.core.main_batch([m._sim_params for m in models],
+                                       backend=backend)
+    for i, m in enumerate(models):
+        m._sim_results = {'frequency':results['frequency']}
+        m._sim_results.update({key:val[i] for key, val in results.items()
+                               if key != 'frequency'})
+    return results
+
+def run_many_bands(models, bands, nsample=1000, backend='numpy'):
+    """Calculate transmittance and reflectance for many models in several
+    named frequency bands, in one call.
+
+    This is ``Model.run_bands()`` for many models at once: the bands are
+    merged onto one frequency grid, every model is calculated on it by
+    ``core.main_batch()``, and the results are split up again by band.
+    The models must share the same incident angle and polarization, but
+    their own frequencies are ignored.
+
+    Parameters
+    ----------
+    models : list
+        A list of ``Model`` objects that have been set up with
+        ``Model.set_up()``.
+    bands : dict
+        The bands, keyed by name. See ``Model.run_bands()``.
+    nsample : int, optional
+        The number of frequencies in each (low, high) band. Default is
+        1000.
+    backend : str, optional
+        Either `numpy` (the default) or `numba`. See ``Model.run()``.
+
+    Returns
+    -------
+    results : dict
+        For each band, a dictionary with the same keys as ``run_many()``,
+        on that band's frequencies, and `stats` (see
+        ``core.band_stats()``), each with one value per model.
+
+    """
+    for m in models:
+        try:
+            assert bool(m._sim_params)
+        except AssertionError:
+            raise KeyError('Did not find calculation-ready parameters. '
+                           'Must call `set_up()` on every model before '
+                           'calling `run_many_bands()`')
+    freq, index = armmwave.core.union_grid(
+        armmwave.core.band_grids(bands, nsample))
+    results = armmwave.core.main_batch(
+        [dict(m._sim_params, freq=freq) for m in models], backend=backend)
+    return armmwave.core.split_bands(results, freq, index)
+
+def get_executor(max_workers=None):
+    """Return the thread pool shared by ``Model.run_async()`` and
+    `run_threaded`, creating it on first use.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        The number of threads, if the pool is created by this call. Default
+        is the number of CPUs.
+
+    Returns
+    -------
+    executor : concurrent.futures.ThreadPoolExecutor
+
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers or os.cpu_count() or 1,
+                thread_name_prefix='armmwave')
+        return _executor
+
+def shutdown_executor(wait=True):
+    """Shut down the shared thread pool. The next call to `get_executor`
+    starts a new one.
+
+    Parameters
+    ----------
+    wait : bool, optional
+        Wait for the running calculations to finish. Default is True.
+
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+def run_threaded(models, executor=None, **kwargs):
+    """Calculate transmittance and reflectance for many models across
+    threads.
+
+    Unlike `run_many`, the models don't have to share their frequencies,
+    incident angle, or polarization. Each model is run with
+    ``Model.run_async()``.
+
+    Parameters
+    ----------
+    models : list
+        A list of ``Model`` objects that have been set up with
+        ``Model.set_up()``.
+    executor : concurrent.futures.Executor, optional
+        See ``Model.run_async()``.
+    **kwargs
+        Passed on to ``Model.run()``.
+
+    Returns
+    -------
+    results : list
+        The dictionary returned by ``Model.run()`` for each model, in
+        order.
+
+    """
+    futures = [m.run_async(executor=executor, **kwargs) for m in models]
+    return [future.result() for future in futures]
+
+def _flight_key(params, kwargs):
+    """Return the key that identical `Model.arun()` calls share, or None if
+    the options can't be hashed."""
+    key = (armmwave.cache.hash_params(params), tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+def _land(flights, key, flight):
+    """Forget a finished (or cancelled) calculation, unless it has already
+    been replaced by a newer one."""
+    if key is not None and flights.get(key) is flight:
+        del flights[key]
+
+async def run_many_async(models, max_concurrency=None, executor=None,
+                         **kwargs):
+    """Calculate transmittance and reflectance for many models without
+    blocking the event loop.
+
+    Each model is run with ``Model.arun()``, so identical models share a
+    calculation.
+
+    Parameters
+    ----------
+    models : list
+        A list of ``Model`` objects that have been set up with
+        ``Model.set_up()``.
+    max_concurrency : int, optional
+        The most calculations to run at once. Default is no limit beyond
+        the executor's own.
+    executor : concurrent.futures.Executor, optional
+        See ``Model.arun()``.
+    **kwargs
+        Passed on to ``Model.run()``.
+
+    Returns
+    -------
+    results : list
+        The dictionary returned by ``Model.run()`` for each model, in
+        order.
+
+    Raises
+    ------
+    ValueError
+        Raised if `max_concurrency` is less than 1.
+
+    If one calculation fails, or this call is cancelled, the calculations
+    still waiting are cancelled.
+
+    """
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError('max_concurrency must be at least 1')
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def run_one(m):
+        if limit is None:
+            return await m.arun(executor=executor, **kwargs)
+        async with limit:
+            return await m.arun(executor=executor, **kwargs)
+
+    tasks = [asyncio.ensure_future(run_one(m)) for m in models]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
@@ -19,9 +19,15 @@
 """
 
 import os
+import time
+import concurrent.futures
 import matplotlib.pyplot as plt
+import armmwave.cache as awca
+import armmwave.core as awc
 import armmwave.layer as awl
 import armmwave.model as awm
+import armmwave.stack as awst
+import armmwave.store as aws
 import numpy as np
 
 mil = 2.54e-5 #converting 1 thousandth of an inch to meters
@@ -52,7 +58,7 @@ pmr15 = awl.Layer(rind=1.304, tand=0, thick=mil*59, desc='PMR15') #59mil = 1.5mm
 ro3003 = awl.Layer(rind=1.732, tand=0, thick=mil*5, desc='RO3003') #0.001 rogers website (10GHz, 296.15K)
 ro3035 = awl.Layer(rind=1.679, tand=0, thick=mil*5, desc='RO3035') #4.3e-3 nadolski 2020 (150 GHz, 300K)
 ro3006 = awl.Layer(rind=2.249, tand=0, thick=mil*5, desc='RO3006') #9.7e-3 nadolski 2020 (150 GHz, 300K)
-ro3010 = awl.Layer(rind=sqrt(10.2), tand=0, thick=mil*5, desc='RO3010') #0.0022 #rogers website (10 GHz, 300K)
+ro3010 = awl.Layer(rind=np.sqrt(10.2), tand=0, thick=mil*5, desc='RO3010') #0.0022 #rogers website (10 GHz, 300K)
 
 "porex can be made in arbitrary thicknesses, so this is a garbage placeholder until i write a function to vary it"
 # porex = awl.Layer(rind=1.319, tand=9e-4, thick=mil*15, desc='PM23J') #note: discontinued? (too expensive for custom?)
@@ -89,44 +95,339 @@ bonding layer <--amountoflayers1
 [terminator]
 also choose an upper and lower bound for frequencies"""
 
-"arc is for choosing a single configuration"
-def arc(material1, material2, material3, amountoflayers1, amountoflayers2, amountoflayers3, freqlow, freqhigh):
-    layers = [awl.Source(),]
-    for i in range(amountoflayers3):
-        layers.append(material3)
-        layers.append(bond)
-    for j in range(amountoflayers2):
-        layers.append(material2)
-        layers.append(bond)
-    for k in range(amountoflayers1):
-        layers.append(material1)
-        layers.append(bond)
-    layers.append(substrate)
-    layers.append(awl.Terminator(vac=False))
+"""arc_layers builds the stack of layers for a single configuration.
+bondlayer/substratelayer default to the bond and substrate chosen above.
+It returns an array-backed Stack, so building and setting up the many
+configurations in a crunch doesn't walk a list of Layer objects"""
+def arc_layers(material1, material2, material3, amountoflayers1, amountoflayers2, amountoflayers3, bondlayer=None, substratelayer=None):
+    if bondlayer is None:
+        bondlayer = bond
+    if substratelayer is None:
+        substratelayer = substrate
+    layers = (awst.Stack([awl.Source()])
+              + (material3 + bondlayer) * amountoflayers3
+              + (material2 + bondlayer) * amountoflayers2
+              + (material1 + bondlayer) * amountoflayers1
+              + substratelayer + awl.Terminator(vac=False))
+    return layers
+
+"arc_model sets up (but doesn't run) the model for a single configuration"
+def arc_model(material1, material2, material3, amountoflayers1, amountoflayers2, amountoflayers3, freqlow, freqhigh, bondlayer=None, substratelayer=None, nsample=None):
+    if nsample is None:
+        nsample = steps
+    layers = arc_layers(material1, material2, material3, amountoflayers1, amountoflayers2, amountoflayers3, bondlayer, substratelayer)
     model = awm.Model()
-    model.set_freq_range(freq1=freqlow, freq2=freqhigh, nsample=steps)
+    model.set_freq_range(freq1=freqlow, freq2=freqhigh, nsample=nsample)
     model.set_up(layers)
-    return model.run()
+    return model
+
+"""runcache holds recent arc/arcsingle results so quickplot/quicksingle don't recalculate a recipe
+on every redraw. runcache.stats() shows how often it's used, runcache.clear() empties it"""
+runcache = awca.ResultCache(maxsize=256)
+
+"""arc is for choosing a single configuration. pass cache=runcache (or your own ResultCache) to reuse results.
+band=True returns the transmission averaged over freqlow-freqhigh (adaptive quadrature, tens of
+frequencies) instead of the transmission at each of the steps frequencies"""
+def arc(material1, material2, material3, amountoflayers1, amountoflayers2, amountoflayers3, freqlow, freqhigh, cache=None, band=False):
+    model = arc_model(material1, material2, material3, amountoflayers1, amountoflayers2, amountoflayers3, freqlow, freqhigh)
+    if band:
+        return model.run(cache=cache, band=(freqlow, freqhigh))
+    return model.run(cache=cache)
 
 """arc_crunch is for going through every iteration of 0 to X layers for the materials specified
-and prints out which layers are currently being simulated"""
+and prints out which layers are currently being simulated.
+all the (j, k) configurations for a given i are run together in one batch with awm.run_many"""
 def arc_crunch(mat1, mat2, mat3, layers):
     mat1_mat2_mat3 = []
     for i in range(layers+1):
+        models = []
+        for j in range(layers+1):
+            for k in range(layers+1):
+                models.append(arc_model(mat1, mat2, mat3, i, j, k, adjtransfreqlow, adjtransfreqhigh))
+        mat1_mat2_mat3.extend(awm.run_many(models)['transmittance'])
+        print(f'{i} 0-{layers} 0-{layers}')
+    return mat1_mat2_mat3
+
+"""named bands for crunching several bands at once, in GHz (before the +/- 15% adjustment).
+a single frequency is given as the same low and high"""
+crunchbands = {'30/40': (30, 40), '95': (95, 95), '150': (150, 150), '220/270': (220, 270)}
+
+"adjustbands applies the +/- 15% range to GHz bands and converts them to Hz, like adjtransfreqlow/high"
+def adjustbands(bands):
+    return {name: (low*(10**9)*.85, high*(10**9)*1.15) for name, (low, high) in bands.items()}
+
+"""arc_crunch_bands is arc_crunch for several bands at once (crunchbands by default). every configuration
+is run once on the union of the band grids with awm.run_many_bands, instead of once per band.
+returns {band name: list in the same order as arc_crunch}, so arc_stats etc. work on each band"""
+def arc_crunch_bands(mat1, mat2, mat3, layers, bands=None):
+    if bands is None:
+        bands = crunchbands
+    adjusted = adjustbands(bands)
+    mat1_mat2_mat3 = {name: [] for name in adjusted}
+    for i in range(layers+1):
+        models = []
+        for j in range(layers+1):
+            for k in range(layers+1):
+                models.append(arc_model(mat1, mat2, mat3, i, j, k, adjtransfreqlow, adjtransfreqhigh))
+        results = awm.run_many_bands(models, adjusted, nsample=steps)
+        for name in mat1_mat2_mat3:
+            mat1_mat2_mat3[name].extend(results[name]['transmittance'])
+        print(f'{i} 0-{layers} 0-{layers} ({len(adjusted)} bands)')
+    return mat1_mat2_mat3
+
+"""worker for arc_crunch_parallel: runs one chunk of (i, j, k) configurations in a single batch.
+everything is passed in explicitly so it doesn't matter how the worker process was started"""
+def _crunch_chunk(mat1, mat2, mat3, configurations, bondlayer, substratelayer, freqlow, freqhigh, nsample):
+    models = [arc_model(mat1, mat2, mat3, i, j, k, freqlow, freqhigh, bondlayer, substratelayer, nsample)
+              for i, j, k in configurations]
+    return awm.run_many(models)['transmittance']
+
+"""arc_crunch_parallel does the same crunch as arc_crunch, but splits the (i, j, k) grid into chunks
+and runs them in a pool of worker processes (max_workers defaults to every core).
+each worker runs chunksize configurations per task; the default gives every worker ~4 tasks.
+the output is in the same order as arc_crunch, so loadmydata/arc_stats/multimean work the same.
+prints progress and throughput (configurations per second) as chunks finish"""
+def arc_crunch_parallel(mat1, mat2, mat3, layers, max_workers=None, chunksize=None):
+    configurations = [(i, j, k) for i in range(layers+1) for j in range(layers+1) for k in range(layers+1)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, -(-len(configurations) // (4 * max_workers)))
+    chunks = [configurations[n:n+chunksize] for n in range(0, len(configurations), chunksize)]
+    mat1_mat2_mat3 = []
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_crunch_chunk, mat1, mat2, mat3, chunk, bond, substrate,
+                               adjtransfreqlow, adjtransfreqhigh, steps) for chunk in chunks]
+        "collect in submission order (not completion order) to keep the arc_crunch ordering"
+        for future in futures:
+            mat1_mat2_mat3.extend(future.result())
+            elapsed = time.perf_counter() - start
+            print(f'{len(mat1_mat2_mat3)}/{len(configurations)} configurations, {len(mat1_mat2_mat3)/elapsed:.1f} configs/s')
+    elapsed = time.perf_counter() - start
+    print(f'crunched {len(configurations)} configurations in {elapsed:.1f} s ({len(configurations)/elapsed:.1f} configs/s, {max_workers} workers)')
+    return mat1_mat2_mat3
+
+"""incremental crunching: every configuration is built up from the substrate side one
+(material + bond) pair at a time, multiplying the characteristic matrix of the new pair onto the
+cached product of the configuration underneath it. so (i, j, k) costs one pair multiply per frequency
+on top of (i, j, k-1) instead of a full re-run.
+the angle in each layer only depends on its own index (snell's law from the source), so a layer's
+matrix only depends on the layer and the index of the layer below it"""
+def _layer_tand(layer, freq):
+    if awl.has_halpern(layer):
+        return awc.alpha2tand(freq, layer.halperna, layer.halpernb, layer.rind)
+    return layer.tand
+
+def _crunch_signature(mat1, mat2, mat3, freq):
+    return tuple((l.rind, l.thick, l.tand, getattr(l, 'halperna', None), getattr(l, 'halpernb', None))
+                 for l in (mat1, mat2, mat3, bond, substrate)) + ((freq[0], freq[-1], freq.size),)
+
+"""arc_crunch_incremental gives the same output (and ordering) as arc_crunch.
+pass the same cache dict back in to extend a crunch: e.g. crunch 4 layers, then ask for 6
+with the same cache and only the new configurations get multiplied out.
+the cache only works for the same materials, bond, substrate and frequency band"""
+def arc_crunch_incremental(mat1, mat2, mat3, layers, cache=None):
+    freq = np.linspace(adjtransfreqlow, adjtransfreqhigh, steps)
+    source = awl.Source()
+    n0 = source.rind
+    theta0 = 0.
+    pol = 's'
+    if cache is None:
+        cache = {}
+    signature = _crunch_signature(mat1, mat2, mat3, freq)
+    if cache.setdefault('signature', signature) != signature:
+        raise ValueError('cache was made for a different recipe, bond, substrate or frequency band')
+    matrices = cache.setdefault('matrices', {})
+    products = cache.setdefault('products', {})
+
+    "the matrices are keyed by the layer's role, not the layer object, since the cache outlives the layers"
+    roles = {'mat1': mat1, 'mat2': mat2, 'mat3': mat3, 'bond': bond, 'substrate': substrate}
+    def layer_matrix(role, next_rind):
+        key = (role, next_rind)
+        if key not in matrices:
+            layer = roles[role]
+            matrices[key] = awc.char_matrix(freq, layer.rind, layer.thick, _layer_tand(layer, freq),
+                                            next_rind, n0, theta0, pol)
+        return matrices[key]
+
+    def add_pair(role, below):
+        product, first_rind = products[below]
+        pair = np.matmul(layer_matrix(role, bond.rind), layer_matrix('bond', first_rind))
+        return np.matmul(pair, product), roles[role].rind
+
+    "the substrate on its own sits above a terminator with the same index (vac=False)"
+    if () not in products:
+        products[()] = (layer_matrix('substrate', substrate.rind), substrate.rind)
+    term_rind = substrate.rind
+    term_theta = awc.snell_angle(term_rind, n0, theta0)
+
+    mat1_mat2_mat3 = []
+    for i in range(layers+1):
+        if (i,) not in products:
+            products[(i,)] = add_pair('mat1', (i-1,) if i > 1 else ()) if i > 0 else products[()]
         for j in range(layers+1):
+            if (i, j) not in products:
+                products[(i, j)] = add_pair('mat2', (i, j-1)) if j > 0 else products[(i,)]
             for k in range(layers+1):
-                mat1_mat2_mat3.append(arc(mat1, mat2, mat3, i, j, k, adjtransfreqlow, adjtransfreqhigh)['transmittance'])
-                print(f'{i} {j} {k}')
+                if (i, j, k) not in products:
+                    products[(i, j, k)] = add_pair('mat3', (i, j, k-1)) if k > 0 else products[(i, j)]
+                product, first_rind = products[(i, j, k)]
+                m_prime = np.matmul(awc.interface_matrix(n0, first_rind, theta0, pol), product)
+                t_amp = awc.product_rt(m_prime)[1]
+                mat1_mat2_mat3.append(awc.t_power(t_amp, n0, term_rind, theta0, term_theta))
     return mat1_mat2_mat3
 
-"""crunchNsave will save your crunch to file (in /data/ directory) so you don't have to crunch more than once
-note: only crunches for the frequency band you're interested in (e.g. 30/40 or 220/270) that you specify at the top"""
-def crunchNsave(mat1, mat2, mat3, layers=4):
-    np.save(os.path.join('data', f'{mat1.desc}_{mat2.desc}_{mat3.desc}_{layers}_{transfreqlow}_{transfreqhigh}_{substrate.desc}_{substrate.tand}_{round(substrate.thick,6)}'), arc_crunch(mat1, mat2, mat3, layers))
+# np.matmul is slow on lots of tiny matrices, so the search multiplies the 2x2 elements out directly
+def _matmul_2x2(a, b):
+    out = np.empty(np.broadcast(a[..., 0, 0], b[..., 0, 0]).shape + (a.shape[-2], b.shape[-1]), dtype=complex)
+    for i in range(a.shape[-2]):
+        for k in range(b.shape[-1]):
+            out[..., i, k] = a[..., i, 0] * b[..., 0, k] + a[..., i, 1] * b[..., 1, k]
+    return out
+
+"""branch-and-bound recipe search: instead of crunching every (i, j, k, ...) combination, the recipes are
+built depth-first from the substrate side like arc_crunch_incremental, so each one costs a single pair
+multiply on top of its parent. materials is a list of any number of layers, ordered from the substrate out
+(mat1, mat2, mat3 in arc_crunch order), each used 0 to maxlayers times.
+a branch is dropped when:
+-it's thicker than maxthick (meters, counting bond layers) or has more than maxtotal material layers
+-it can't beat the current topk for any total layer count it can still reach. adding layers on top can
+ only lose more power, so a stack never transmits more than the fraction of the power entering it that
+ comes out the other side, T/(1-R) of the part built so far. for lossless materials this is 1, so only
+ the thickness/layer limits prune
+returns {total number of material layers: [(mean transmission, (count of each material)), ...]} with the
+best topk recipes for each total, best first. e.g. multimean's best 7-layer recipe is results[7][0]"""
+def arc_search(materials, maxlayers=4, topk=5, maxthick=None, maxtotal=None):
+    freq = np.linspace(adjtransfreqlow, adjtransfreqhigh, steps)
+    n0 = awl.Source().rind
+    theta0 = 0.
+    pol = 's'
+    if maxtotal is None:
+        maxtotal = maxlayers * len(materials)
+    if maxthick is None:
+        maxthick = np.inf
+    matrices = {}
+
+    "keyed by role: the index of the material, 'bond' or 'substrate'"
+    roles = dict(enumerate(materials), bond=bond, substrate=substrate)
+    def layer_matrix(role, next_rind):
+        key = (role, next_rind)
+        if key not in matrices:
+            layer = roles[role]
+            matrices[key] = awc.char_matrix(freq, layer.rind, layer.thick, _layer_tand(layer, freq),
+                                            next_rind, n0, theta0, pol)
+        return matrices[key]
 
-"inverse of crunchNsave: loads your saved crunch to a variable that you can call for analysis later"
-def loadmydata(mat1, mat2, mat3, layers=4):
-    return np.load(os.path.normpath(os.path.join('data', f'{mat1.desc}_{mat2.desc}_{mat3.desc}_{layers}_{transfreqlow}_{transfreqhigh}_{substrate.desc}_{substrate.tand}_{round(substrate.thick,5)}.npy')))
+    def pair_matrix(m, next_rind):
+        key = ('pair', m, next_rind)
+        if key not in matrices:
+            matrices[key] = _matmul_2x2(layer_matrix(m, bond.rind), layer_matrix('bond', next_rind))
+        return matrices[key]
+
+    interfaces = {}
+    term_rind = substrate.rind
+    term_theta = awc.snell_angle(term_rind, n0, theta0)
+
+    def transmission(product, first_rind):
+        "T of the stack, and the fraction of the power entering it that gets through, T/(1-R)"
+        if first_rind not in interfaces:
+            interfaces[first_rind] = awc.interface_matrix(n0, first_rind, theta0, pol)
+        m_prime = _matmul_2x2(interfaces[first_rind], product[..., :1])
+        r_amp, t_amp = awc.product_rt(m_prime)
+        trans = awc.t_power(t_amp, n0, term_rind, theta0, term_theta)
+        return trans, trans / (1 - awc.r_power(r_amp))
+
+    best = {}
+    def threshold(total, m, c):
+        """the score a branch has to beat to get into the topk of some total it can still reach,
+        by adding more of material m (c layers so far) or any of the later materials"""
+        reachable = range(total, min(maxtotal, total + (maxlayers - c) + maxlayers * (len(materials) - m - 1)) + 1)
+        return min(best[t][-1][0] if len(best.get(t, [])) >= topk else -np.inf for t in reachable)
+
+    def record(score, counts):
+        total = sum(counts)
+        best.setdefault(total, []).append((score, counts))
+        best[total].sort(key=lambda entry: -entry[0])
+        del best[total][topk:]
+
+    searched = 0
+    def visit(level, counts, product, first_rind, thick):
+        "try adding each later material on top of this stack, one pair at a time"
+        nonlocal searched
+        for m in range(level, len(materials)):
+            material = materials[m]
+            new_product, new_rind, new_thick = product, first_rind, thick
+            for c in range(1, maxlayers+1):
+                new_thick = new_thick + material.thick + bond.thick
+                if new_thick > maxthick or sum(counts) + c > maxtotal:
+                    break
+                new_product = _matmul_2x2(pair_matrix(m, new_rind), new_product)
+                new_rind = material.rind
+                trans, bound = transmission(new_product, new_rind)
+                searched += 1
+                new_counts = counts[:m] + (c,) + counts[m+1:]
+                # more of this material only loses more power, so stop adding it
+                if np.mean(bound) <= threshold(sum(new_counts), m, c):
+                    break
+                record(np.mean(trans), new_counts)
+                visit(m+1, new_counts, new_product, new_rind, new_thick)
+
+    start = time.perf_counter()
+    "the substrate on its own sits above a terminator with the same index (vac=False)"
+    product = layer_matrix('substrate', substrate.rind)
+    counts = (0,) * len(materials)
+    record(np.mean(transmission(product, substrate.rind)[0]), counts)
+    visit(0, counts, product, substrate.rind, 0.)
+    elapsed = time.perf_counter() - start
+    print(f'searched {searched + 1} of {(maxlayers+1)**len(materials)} recipes in {elapsed:.1f} s')
+    return dict(sorted(best.items()))
+
+"""crunches are kept in one indexed result store (see armmwave/store.py) in data/crunches,
+looked up by the materials, layer count, band, bond and substrate instead of by filename"""
+storepath = os.path.join('data', 'crunches')
+
+"crunch_key is the store key for a crunch with the band, bond and substrate chosen above"
+def crunch_key(mat1, mat2, mat3, layers):
+    return aws.make_key(materials=[mat1.desc, mat2.desc, mat3.desc],
+                        tands=[mat1.tand, mat2.tand, mat3.tand], layers=layers,
+                        band=[transfreqlow, transfreqhigh], bond=bond.desc,
+                        substrate=substrate.desc, substrate_tand=substrate.tand,
+                        substrate_thick=substrate.thick)
+
+"""crunchNsave will save your crunch to the result store so you don't have to crunch more than once
+note: only crunches for the frequency band you're interested in (e.g. 30/40 or 220/270) that you specify at the top
+parallel=True crunches with arc_crunch_parallel (max_workers processes) instead of arc_crunch
+incremental=True crunches with arc_crunch_incremental, reusing cache if you pass one
+pass store to use a ResultStore other than the one in storepath"""
+def crunchNsave(mat1, mat2, mat3, layers=4, parallel=False, max_workers=None, incremental=False, cache=None, store=None):
+    if parallel and incremental:
+        raise ValueError('choose either parallel or incremental crunching, not both')
+    if parallel:
+        crunched = arc_crunch_parallel(mat1, mat2, mat3, layers, max_workers=max_workers)
+    elif incremental:
+        crunched = arc_crunch_incremental(mat1, mat2, mat3, layers, cache=cache)
+    else:
+        crunched = arc_crunch(mat1, mat2, mat3, layers)
+    if store is None:
+        store = aws.ResultStore(storepath)
+    store.put(crunch_key(mat1, mat2, mat3, layers), crunched, overwrite=True)
+
+"""inverse of crunchNsave: loads your saved crunch to a variable that you can call for analysis later
+the crunch is memory mapped, so it's only read from disk as you use it
+falls back to the old one-file-per-recipe .npy files in data/ for crunches saved before the store"""
+def loadmydata(mat1, mat2, mat3, layers=4, store=None):
+    if store is None:
+        store = aws.ResultStore(storepath)
+    key = crunch_key(mat1, mat2, mat3, layers)
+    if key in store:
+        return store.get(key)
+    "the old files were saved with the thickness rounded to 6 digits but loaded with 5, so try both"
+    for digits in [6, 5]:
+        filename = os.path.join('data', f'{mat1.desc}_{mat2.desc}_{mat3.desc}_{layers}_{transfreqlow}_{transfreqhigh}_{substrate.desc}_{substrate.tand}_{round(substrate.thick,digits)}.npy')
+        if os.path.exists(filename):
+            return np.load(filename, mmap_mode='r')
+    raise KeyError(f'no saved crunch for {key}')
 
 "statistics setup for analysis"
 def arc_stats(crunched_model):
@@ -135,15 +436,18 @@ def arc_stats(crunched_model):
     location = range(len(crunched_model))
     return stddev, mean, location
 
-"plotting function to include label"
+"""plotting function to include label.
+the broadband curve and the crunch band for the label are calculated together in one run_bands pass"""
 def quickplot(mat1, mat2, mat3, amount1, amount2, amount3, freqlow=startfreq*10**9, freqhigh=stopfreq*10**9, ls='-'):
-    broadband = arc(mat1, mat2, mat3, amount1, amount2, amount3, freqlow, freqhigh)['transmittance']
-    crunchrange = arc(mat1, mat2, mat3, amount1, amount2, amount3, adjtransfreqlow, adjtransfreqhigh)['transmittance']
-    label = f'{round(amount1 * mat1.thick * 39370)}mil {mat1.desc}, {round(amount2 * mat2.thick * 39370)}mil {mat2.desc}, {round(amount3 * mat3.thick * 39370)}mil {mat3.desc}, {round(np.mean(crunchrange)*100, 2)}% transmission ({round(mat1.tand,5)}, {round(mat2.tand,5)}, {round(mat3.tand,5)} loss tan)'
+    model = arc_model(mat1, mat2, mat3, amount1, amount2, amount3, freqlow, freqhigh)
+    results = model.run_bands({'broadband': (freqlow, freqhigh), 'crunch': (adjtransfreqlow, adjtransfreqhigh)}, nsample=steps, cache=runcache)
+    broadband = results['broadband']['transmittance']
+    crunchmean = results['crunch']['stats']['mean_transmittance']
+    label = f'{round(amount1 * mat1.thick * 39370)}mil {mat1.desc}, {round(amount2 * mat2.thick * 39370)}mil {mat2.desc}, {round(amount3 * mat3.thick * 39370)}mil {mat3.desc}, {round(crunchmean*100, 2)}% transmission ({round(mat1.tand,5)}, {round(mat2.tand,5)}, {round(mat3.tand,5)} loss tan)'
     return plt.plot(frequencies, broadband, label=label, linestyle=ls)
 
-"arc crunch for only single layer of material"
-def arcsingle(material, amountoflayers, freqlow, freqhigh):
+"arcsingle_model sets up (but doesn't run) the model for a single layer of material"
+def arcsingle_model(material, amountoflayers, freqlow, freqhigh):
     layers = [awl.Source(),]
     for number in range(amountoflayers):
         layers.append(material)
@@ -153,15 +457,24 @@ def arcsingle(material, amountoflayers, freqlow, freqhigh):
     model = awm.Model()
     model.set_freq_range(freq1=freqlow, freq2=freqhigh, nsample=steps)
     model.set_up(layers)
-    return model.run()
+    return model
+
+"arc crunch for only single layer of material. band=True works the same as in arc"
+def arcsingle(material, amountoflayers, freqlow, freqhigh, cache=None, band=False):
+    model = arcsingle_model(material, amountoflayers, freqlow, freqhigh)
+    if band:
+        return model.run(cache=cache, band=(freqlow, freqhigh))
+    return model.run(cache=cache)
 
 """plotting for arcsingle
 broadband is for the overall picture
-crunchrange is the specific brand we care about"""
+crunch is the specific brand we care about. both come from one run_bands pass"""
 def quicksingle(mat, amount, freqlow=startfreq*10**9, freqhigh=stopfreq*10**9, ls='-'):
-    broadband = arcsingle(mat, amount, freqlow, freqhigh)['transmittance']
-    crunchrange = arcsingle(mat, amount, adjtransfreqlow, adjtransfreqhigh)['transmittance']
-    label = f'{round(amount * mat.thick * 39370)}mil {mat.desc}, {round(mat.tand,4)} loss tan, {round(np.mean(crunchrange)*100, 2)}% transmission'
+    model = arcsingle_model(mat, amount, freqlow, freqhigh)
+    results = model.run_bands({'broadband': (freqlow, freqhigh), 'crunch': (adjtransfreqlow, adjtransfreqhigh)}, nsample=steps, cache=runcache)
+    broadband = results['broadband']['transmittance']
+    crunchmean = results['crunch']['stats']['mean_transmittance']
+    label = f'{round(amount * mat.thick * 39370)}mil {mat.desc}, {round(mat.tand,4)} loss tan, {round(crunchmean*100, 2)}% transmission'
     return plt.plot(frequencies, broadband, label=label, linestyle=ls)
 
 """for plotting the maximum mean transmission value for each combination of layers
@@ -0,0 +1,288 @@
+"""
+This module contains an optimizer for the layer thicknesses and refractive
+indices of a ``Model``, e.g. to design an anti-reflection coating.
+
+Start from a set-up ``Model`` as a template, and mark which layer
+parameters are free, and within what bounds:
+
+>>> free = {1: {'thick': (1e-4, 1e-3)}, 3: {'thick': (1e-4, 1e-3),
+...                                         'rind': (1.2, 1.6)}}
+>>> result = optimize(template, free, n_candidates=2000, seed=0)
+>>> result['transmittance'], result['model'].thicks
+
+The objective is the transmittance averaged over the template's frequencies
+(and incident angles, if it has an angle sweep). Random candidates are
+first screened in batches with ``core.main_batch()``, and the best few are
+then polished with L-BFGS-B, using the analytic derivatives from
+``core.main_gradient()``.
+"""
+
+import copy
+import numpy as np
+import scipy.optimize
+import armmwave.core
+import armmwave.model
+import armmwave.stack
+
+FREE_PARAMS = ('thick', 'rind')
+
+
+def make_variables(model, free):
+    """Flatten the free parameters into a list of variables.
+
+    Parameters
+    ----------
+    model : Model
+        The template ``Model``. It must be set up.
+    free : dict
+        The free parameters, keyed by layer position in the model (where
+        the ``Source`` is 0). Each value is a dictionary mapping a parameter
+        name, `thick` or `rind`, to its (lower, upper) bounds.
+
+    Returns
+    -------
+    variables : list
+        One (layer position, parameter name) tuple per free parameter.
+    bounds : numpy array
+        The (lower, upper) bounds of each variable, with shape
+        (number of variables, 2).
+
+    Raises
+    ------
+    ValueError
+        Raised if a free parameter isn't the thickness or index of a layer
+        between the ``Source`` and ``Terminator``, or if its bounds are out
+        of order.
+    """
+    n_layer = len(model.rinds)
+    variables = []
+    bounds = []
+    for index in sorted(free):
+        if not 0 < index < n_layer - 1:
+            raise ValueError('Layer {} is not between the Source and the '
+                             'Terminator'.format(index))
+        for name in sorted(free[index]):
+            if name not in FREE_PARAMS:
+                raise ValueError('Free parameters must be one of '
+                                 '{}'.format(FREE_PARAMS))
+            low, high = free[index][name]
+            if low > high:
+                raise ValueError('The lower bound of {} in layer {} is above '
+                                 'the upper bound'.format(name, index))
+            variables.append((index, name))
+            bounds.append((low, high))
+    return variables, np.array(bounds, dtype=float).reshape((-1, 2))
+
+
+def apply_variables(params, variables, x):
+    """Return a copy of the calculation parameters with the free parameters
+    set to `x`.
+
+    Parameters
+    ----------
+    params : dict
+        The dictionary contructed by ``Model.set_up()``.
+    variables : list
+        The variables, from `make_variables`.
+    x : array_like
+        The value of each variable.
+
+    Returns
+    -------
+    params : dict
+        The new parameters. The Snell angles and interface amplitudes that
+        ``Model.set_up()`` stores are dropped, so they are recalculated.
+        The terminating index is left alone, even when ``Model.set_up()``
+        took it from the last material (a ``Terminator`` with `vac` False),
+        so a free index on the last material only changes that layer.
+    """
+    new = {key:val for key, val in params.items()
+           if key not in ('theta', 't_amp', 'r_amp')}
+    new['rind'] = np.array(params['rind'], dtype=float)
+    new['thick'] = np.array(params['thick'], dtype=float)
+    for (index, name), val in zip(variables, x):
+        new[name][index] = val
+    # The Halpern loss tangent depends on the index of its layer
+    new['halpern_layers'] = {k:dict(v, n=new['rind'][k])
+                             for k, v in params['halpern_layers'].items()}
+    return new
+
+
+def evaluate(model, variables, xs, batch_size=256, backend='numpy'):
+    """Calculate the mean transmittance of many candidate stacks.
+
+    Parameters
+    ----------
+    model : Model
+        The template ``Model``. It must be set up.
+    variables : list
+        The variables, from `make_variables`.
+    xs : array_like
+        The candidates, with one row of variable values per candidate.
+    batch_size : int, optional
+        The number of candidates to calculate at once with
+        ``core.main_batch()``. Default is 256.
+    backend : str, optional
+        Either `numpy` (the default) or `numba`. See ``Model.run()``.
+
+    Returns
+    -------
+    scores : numpy array
+        The transmittance of each candidate, averaged over frequency (and
+        incident angle).
+    """
+    xs = np.atleast_2d(xs)
+    scores = np.empty(len(xs))
+    for start in range(0, len(xs), batch_size):
+        batch = [apply_variables(model._sim_params, variables, x)
+                 for x in xs[start:start+batch_size]]
+        results = armmwave.core.main_batch(batch, backend=backend)
+        trans = results['transmittance'].reshape((len(batch), -1))
+        scores[start:start+len(batch)] = trans.mean(axis=1)
+    return scores
+
+
+def _objective(params, variables, bounds):
+    """Build the L-BFGS-B objective, on variables scaled to [0, 1]."""
+    span = bounds[:, 1] - bounds[:, 0]
+    columns = [index - 1 for index, name in variables]
+
+    def objective(u):
+        x = bounds[:, 0] + u * span
+        results = armmwave.core.main_gradient(
+            apply_variables(params, variables, x))
+        value = np.mean(results['transmittance'])
+        grad = np.empty(len(variables))
+        for i, (column, (index, name)) in enumerate(zip(columns, variables)):
+            grad_t = results['transmittance_grad_' + name][..., column]
+            grad[i] = np.mean(grad_t)
+        return -value, -grad * span
+
+    return objective
+
+
+def optimize(model, free, n_candidates=1000, n_polish=3, seed=None,
+             batch_size=256, backend='numpy', maxiter=200):
+    """Maximize the mean transmittance of a model over its free layer
+    thicknesses and indices.
+
+    Parameters
+    ----------
+    model : Model
+        The template ``Model``. It must be set up; its frequencies,
+        incident angle(s), and polarization set the objective.
+    free : dict
+        The free parameters, keyed by layer position in the model (where
+        the ``Source`` is 0). Each value is a dictionary mapping `thick`
+        and/or `rind` to its (lower, upper) bounds. For example,
+        ``{2: {'thick': (1e-4, 1e-3)}}`` frees the thickness of the second
+        material layer.
+    n_candidates : int, optional
+        The number of random candidates to screen. Default is 1000.
+    n_polish : int, optional
+        The number of the best screened candidates to polish with L-BFGS-B.
+        Default is 3. Set it to 0 to only screen.
+    seed : int, optional
+        Seed for the random candidates.
+    batch_size : int, optional
+        See `evaluate`. Default is 256.
+    backend : str, optional
+        The backend for the screening. See `evaluate`.
+    maxiter : int, optional
+        The most L-BFGS-B iterations for each polished candidate. Default
+        is 200.
+
+    Returns
+    -------
+    result : dict
+        A dictionary with the keys:
+         * `x` : the best value of each variable
+         * `variables` : the (layer position, parameter name) of each
+           variable
+         * `transmittance` : the mean transmittance of the best stack
+         * `model` : a new ``Model``, set up with the best stack. The
+           template is left alone.
+         * `n_evaluations` : the number of stacks that were calculated
+
+    Raises
+    ------
+    KeyError
+        Raised if the template ``Model`` has not been set up.
+    ValueError
+        Raised if there are no free parameters.
+    """
+    try:
+        assert bool(model._sim_params)
+    except AssertionError:
+        raise KeyError('Did not find calculation-ready parameters. '
+                       'Must call `set_up()` on the template model.')
+    variables, bounds = make_variables(model, free)
+    if not variables:
+        raise ValueError('There are no free parameters to optimize')
+
+    rng = np.random.RandomState(seed)
+    xs = bounds[:, 0] + rng.uniform(size=(n_candidates, len(variables))) * \
+        (bounds[:, 1] - bounds[:, 0])
+    start = np.array([model._sim_params[name][index]
+                      for index, name in variables])
+    xs = np.vstack([np.clip(start, bounds[:, 0], bounds[:, 1]), xs])
+    scores = evaluate(model, variables, xs, batch_size, backend)
+    n_evaluations = len(xs)
+    best = np.argmax(scores)
+    best_x, best_score = xs[best], scores[best]
+
+    objective = _objective(model._sim_params, variables, bounds)
+    span = np.where(bounds[:, 1] > bounds[:, 0], bounds[:, 1] - bounds[:, 0],
+                    1.)
+    for i in np.argsort(scores)[::-1][:n_polish]:
+        u0 = (xs[i] - bounds[:, 0]) / span
+        fit = scipy.optimize.minimize(objective, u0, jac=True,
+                                      method='L-BFGS-B',
+                                      bounds=[(0., 1.)] * len(variables),
+                                      options={'maxiter':maxiter})
+        n_evaluations += fit.nfev
+        if -fit.fun > best_score:
+            best_x = bounds[:, 0] + fit.x * (bounds[:, 1] - bounds[:, 0])
+            best_score = -fit.fun
+
+    return {'x':best_x, 'variables':variables, 'transmittance':best_score,
+            'model':build_model(model, variables, best_x),
+            'n_evaluations':n_evaluations}
+
+
+def build_model(model, variables, x):
+    """Set up a new ``Model`` like the template, with the free parameters
+    set to `x`.
+
+    Parameters
+    ----------
+    model : Model
+        The template ``Model``. It must be set up.
+    variables : list
+        The variables, from `make_variables`.
+    x : array_like
+        The value of each variable.
+
+    Returns
+    -------
+    new_model : Model
+        The new ``Model``. Its layers are copies, so the template's layers
+        are left alone. Its ``Terminator`` is pinned to the template's
+        terminating index, as in `apply_variables`.
+    """
+    if isinstance(model.struct, armmwave.stack.Stack):
+        layers = model.struct.copy()
+    else:
+        layers = [copy.copy(l) for l in model.struct]
+    for (index, name), val in zip(variables, x):
+        setattr(layers[index], name, float(val))
+    # Otherwise a `vac` False Terminator would follow a free last index
+    layers[-1].rind = float(model.rinds[-1])
+    layers[-1].vac = True
+    new_model = armmwave.model.Model()
+    new_model.freq_range = model.freq_range
+    new_model.low_freq = model.low_freq
+    new_model.high_freq = model.high_freq
+    new_model.angle_range = model.angle_range
+    new_model.set_up(layers, theta0=model.incident_angle, pol=model.pol)
+    return new_model
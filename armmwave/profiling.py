@@ -0,0 +1,246 @@
+"""
+This module contains the ``Profiler`` class, an opt-in record of where a
+calculation spends its time and memory.
+
+The main stages of the calculation (set-up, Snell angles and interface
+amplitudes, Halpern loss tangents, wavenumbers and phases, the
+transfer-matrix recursion, and the power calculation) report to the active
+``Profiler``, if there is one. With no active ``Profiler`` the cost is a
+single lookup per stage.
+
+Profile a whole session with a ``with`` block:
+
+>>> with Profiler() as prof:
+...     model.set_up(layers)
+...     results = model.run()
+>>> print(prof)
+>>> prof.to_json('profile.json')
+
+or a single run with ``Model.run(profile=True)``, which adds the report to
+the results under the `profile` key.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+import tracemalloc
+import numpy as np
+
+# The profiler that stages report to. A context variable, so that each
+# thread (and each asyncio task) has its own.
+_active = contextvars.ContextVar('armmwave_profiler', default=None)
+
+# `tracemalloc` is process-wide, so the profilers that track memory share it:
+# the first one in starts tracing and the last one out stops it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+
+def active():
+    """Return the active ``Profiler``, or None."""
+    return _active.get()
+
+
+def stage(name):
+    """Return a context manager that times a stage of the calculation with
+    the active ``Profiler``, or does nothing if there isn't one."""
+    prof = _active.get()
+    if prof is None:
+        return contextlib.nullcontext()
+    return prof.stage(name)
+
+
+def record(name, array):
+    """Record the size of an array with the active ``Profiler``, if there
+    is one."""
+    prof = _active.get()
+    if prof is not None:
+        prof.record(name, array)
+
+
+def profiled(func):
+    """Time every call of `func` as a stage, named after its module and
+    function (e.g. `core.main`)."""
+    module = func.__module__.split('.')[-1]
+    name = '{}.{}'.format(module, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        prof = _active.get()
+        if prof is None:
+            return func(*args, **kwargs)
+        with prof.stage(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class Profiler:
+    """A record of the time, call counts, array sizes, and peak memory of
+    a calculation.
+
+    Use it as a context manager; the calculations inside the ``with`` block
+    (in the same thread) are recorded. Times are wall-clock and inclusive,
+    so a stage's time includes the stages it calls.
+
+    Parameters
+    ----------
+    memory : bool, optional
+        Track the peak memory allocated inside the ``with`` block with
+        `tracemalloc`. This slows the calculation down. Default is True.
+        `tracemalloc` sees the whole process, so the peak includes memory
+        allocated by other threads during the block, and is only an upper
+        bound when profilers in several threads overlap.
+
+    Attributes
+    ----------
+    stages : dict
+        The number of `calls` and the total `time` (in seconds) of each
+        stage, keyed by stage name.
+    arrays : dict
+        The `shape`, `dtype`, and `nbytes` of the largest array recorded
+        under each name, and the number of times it was recorded.
+    peak_memory : int or None
+        The peak memory allocated by the process inside the ``with`` block,
+        in bytes, or None if `memory` is False.
+    total_time : float
+        The wall time of the ``with`` block, in seconds.
+    """
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = {}
+        self.arrays = {}
+        self.peak_memory = None
+        self.total_time = 0.
+        self._token = None
+        self._start = None
+
+    def __repr__(self):
+        return 'Profiler(memory={})'.format(self.memory)
+
+    def __enter__(self):
+        global _tracing_users, _started_tracing
+        if self.memory:
+            with _tracing_lock:
+                if _tracing_users == 0:
+                    if tracemalloc.is_tracing():
+                        tracemalloc.reset_peak()
+                    else:
+                        tracemalloc.start()
+                        _started_tracing = True
+                # Otherwise the peak belongs to the profilers already
+                # running, and isn't reset
+                _tracing_users += 1
+                self._base_memory = tracemalloc.get_traced_memory()[0]
+        self._token = _active.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _tracing_users, _started_tracing
+        self.total_time += time.perf_counter() - self._start
+        _active.reset(self._token)
+        if self.memory:
+            with _tracing_lock:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peak_memory = max(peak - self._base_memory,
+                                       self.peak_memory or 0)
+                _tracing_users -= 1
+                if _tracing_users == 0 and _started_tracing:
+                    tracemalloc.stop()
+                    _started_tracing = False
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a stage of the calculation.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage. Repeated stages add up.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self.stages.setdefault(name, {'calls':0, 'time':0.})
+            entry['calls'] += 1
+            entry['time'] += elapsed
+
+    def record(self, name, array):
+        """Record the size of an array.
+
+        Parameters
+        ----------
+        name : str
+            The name of the array, e.g. `delta`.
+        array : array_like
+            The array. Only the largest one recorded under each name is
+            kept.
+        """
+        array = np.asarray(array)
+        entry = self.arrays.get(name)
+        if entry is None or array.nbytes > entry['nbytes']:
+            self.arrays[name] = {'shape':list(array.shape),
+                                 'dtype':str(array.dtype),
+                                 'nbytes':int(array.nbytes),
+                                 'count':entry['count'] if entry else 0}
+        self.arrays[name]['count'] += 1
+
+    def report(self):
+        """Return the record as a dictionary of plain Python types.
+
+        Returns
+        -------
+        report : dict
+            A dictionary with the keys `total_time`, `peak_memory`,
+            `stages`, and `arrays`. Each stage also has its `mean_time` and
+            its `fraction` of the total time.
+        """
+        stages = {}
+        for name, entry in sorted(self.stages.items(),
+                                  key=lambda item: -item[1]['time']):
+            stages[name] = dict(entry, mean_time=entry['time']/entry['calls'],
+                                fraction=(entry['time']/self.total_time
+                                          if self.total_time else 0.))
+        return {'total_time':self.total_time, 'peak_memory':self.peak_memory,
+                'stages':stages,
+                'arrays':{name:dict(entry)
+                          for name, entry in self.arrays.items()}}
+
+    def to_json(self, path=None):
+        """Write the report as JSON.
+
+        Parameters
+        ----------
+        path : str, optional
+            A file to write the report to.
+
+        Returns
+        -------
+        text : str
+            The report, as a JSON string.
+        """
+        text = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def __str__(self):
+        report = self.report()
+        lines = ['{:<32}{:>8}{:>12}{:>8}'.format('Stage', 'Calls',
+                                                 'Time (s)', '%')]
+        for name, entry in report['stages'].items():
+            lines.append('{:<32}{:>8}{:>12.4g}{:>8.1f}'.format(
+                name, entry['calls'], entry['time'], 100*entry['fraction']))
+        lines.append('Total time: {:.4g} s'.format(report['total_time']))
+        if report['peak_memory'] is not None:
+            lines.append('Peak memory: {:.4g} MB'.format(
+                report['peak_memory'] / 1e6))
+        return '\n'.join(lines)
@@ -0,0 +1,256 @@
+"""
+This module contains the ``Stack`` class, a compact, array-backed
+alternative to a list of ``Layer`` objects.
+
+A ``Stack`` keeps the properties of all its layers in one NumPy structured
+array, so stacks can be joined and repeated without creating any ``Layer``
+objects, and ``Model.set_up()`` can read the indices, loss tangents, and
+thicknesses straight from the array. Build one from layers and combine
+stacks with `+` and `*`:
+
+>>> coating = (Stack([ro3006, bond]) * 3) + (Stack([zitex, bond]) * 2)
+>>> stack = Stack([Source()]) + coating + alumina + Terminator(vac=False)
+>>> model.set_up(stack)
+
+Indexing a ``Stack`` returns a ``LayerView``, which has the same
+attributes as a ``Layer`` but reads and writes the array.
+"""
+
+import numpy as np
+import armmwave.layer
+
+# The kinds of layer in a stack
+SOURCE = 0
+LAYER = 1
+TERMINATOR = 2
+
+STACK_DTYPE = np.dtype([('kind', np.int8), ('rind', float), ('thick', float),
+                        ('tand', float), ('halperna', float),
+                        ('halpernb', float), ('vac', bool)])
+
+
+def _layer_kind(layer):
+    """Return the kind of a ``Layer`` or ``LayerView``."""
+    if isinstance(layer, LayerView):
+        return layer.kind
+    if isinstance(layer, armmwave.layer.Source):
+        return SOURCE
+    if isinstance(layer, armmwave.layer.Terminator):
+        return TERMINATOR
+    return LAYER
+
+
+def _halpern(val):
+    """Store a missing Halpern coefficient as NaN."""
+    return np.nan if val is None else val
+
+
+class Stack:
+    """An ordered collection of layers, stored as a structured array.
+
+    Parameters
+    ----------
+    layers : iterable, optional
+        ``Layer`` objects (including ``Source`` and ``Terminator``) or
+        ``LayerView`` objects, ordered from source to terminator. Default
+        is an empty stack.
+
+    Attributes
+    ----------
+    data : numpy structured array
+        One record per layer, with the fields `kind` (`SOURCE`, `LAYER`,
+        or `TERMINATOR`), `rind`, `thick`, `tand`, `halperna`, `halpernb`
+        (NaN if the layer has no Halpern coefficients), and `vac` (for a
+        ``Terminator``).
+    descs : tuple
+        The description of each layer.
+    """
+    __slots__ = ('data', 'descs')
+
+    def __init__(self, layers=()):
+        layers = list(layers)
+        self.data = np.array(
+            [(_layer_kind(l), l.rind, l.thick, l.tand,
+              _halpern(getattr(l, 'halperna', None)),
+              _halpern(getattr(l, 'halpernb', None)),
+              getattr(l, 'vac', False)) for l in layers], dtype=STACK_DTYPE)
+        self.descs = tuple(l.desc for l in layers)
+
+    @classmethod
+    def from_arrays(cls, data, descs):
+        """Make a ``Stack`` from a structured array and descriptions,
+        without copying them."""
+        stack = cls.__new__(cls)
+        stack.data = data
+        stack.descs = tuple(descs)
+        return stack
+
+    def __repr__(self):
+        return 'Stack([{}])'.format(', '.join(self.descs))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Stack.from_arrays(self.data[index], self.descs[index])
+        index = range(len(self))[index]
+        return LayerView(self, index)
+
+    def __iter__(self):
+        return (LayerView(self, i) for i in range(len(self)))
+
+    def __add__(self, other):
+        if not isinstance(other, Stack):
+            if not hasattr(other, 'rind'):
+                return NotImplemented
+            other = Stack([other])
+        return Stack.from_arrays(np.concatenate((self.data, other.data)),
+                                 self.descs + other.descs)
+
+    def __radd__(self, other):
+        if not hasattr(other, 'rind'):
+            return NotImplemented
+        return Stack([other]) + self
+
+    def __mul__(self, count):
+        if not isinstance(count, (int, np.integer)):
+            return NotImplemented
+        count = max(int(count), 0)
+        return Stack.from_arrays(np.tile(self.data, count),
+                                 self.descs * count)
+
+    __rmul__ = __mul__
+
+    @property
+    def rind(self):
+        """The refractive index of each layer."""
+        return self.data['rind']
+
+    @property
+    def thick(self):
+        """The thickness (in meters) of each layer."""
+        return self.data['thick']
+
+    @property
+    def tand(self):
+        """The loss tangent of each layer."""
+        return self.data['tand']
+
+    def copy(self):
+        """Return a copy of the ``Stack`` that doesn't share its array."""
+        return Stack.from_arrays(self.data.copy(), self.descs)
+
+    def to_layers(self):
+        """Return the stack as a list of new ``Layer`` objects."""
+        return [view.to_layer() for view in self]
+
+    def model_arrays(self):
+        """Return the arrays that ``Model.set_up()`` needs.
+
+        A ``Terminator`` with `vac` False and an index of 1 takes the index
+        of the layer before it, as in ``Model.set_up()``.
+
+        Returns
+        -------
+        rinds, tands, thicks : numpy arrays
+            The index, loss tangent, and thickness of each layer.
+        halpern_layers : dict
+            The Halpern coefficients, keyed by layer position, of each
+            ``Layer`` that has them.
+        """
+        rinds = self.data['rind'].copy()
+        last = self.data[-1]
+        if last['kind'] == TERMINATOR and rinds[-1] == 1. and \
+                not last['vac'] and len(rinds) > 1:
+            rinds[-1] = rinds[-2]
+        halpern = [i for i, view in enumerate(self)
+                   if view.kind == LAYER and armmwave.layer.has_halpern(view)]
+        halpern_layers = {int(i):{'a':float(self.data['halperna'][i]),
+                                  'b':float(self.data['halpernb'][i]),
+                                  'n':float(rinds[i])} for i in halpern}
+        return (rinds, self.data['tand'].copy(), self.data['thick'].copy(),
+                halpern_layers)
+
+
+class LayerView:
+    """A single layer of a ``Stack``.
+
+    Has the same attributes as a ``Layer``, but they are read from and
+    written to the ``Stack``'s array, so changing a ``LayerView`` changes
+    the ``Stack``.
+    """
+    __slots__ = ('_stack', '_index')
+
+    def __init__(self, stack, index):
+        self._stack = stack
+        self._index = index
+
+    def __repr__(self):
+        return '{} (Stack layer)'.format(self.desc)
+
+    def _get(self, field):
+        return self._stack.data[field][self._index].item()
+
+    def _set(self, field, val):
+        self._stack.data[field][self._index] = val
+
+    kind = property(lambda self: self._get('kind'))
+    rind = property(lambda self: self._get('rind'),
+                    lambda self, val: self._set('rind', val))
+    thick = property(lambda self: self._get('thick'),
+                     lambda self, val: self._set('thick', val))
+    tand = property(lambda self: self._get('tand'),
+                    lambda self, val: self._set('tand', val))
+    vac = property(lambda self: self._get('vac'),
+                   lambda self, val: self._set('vac', val))
+
+    @property
+    def halperna(self):
+        val = self._get('halperna')
+        return None if np.isnan(val) else val
+
+    @halperna.setter
+    def halperna(self, val):
+        self._set('halperna', _halpern(val))
+
+    @property
+    def halpernb(self):
+        val = self._get('halpernb')
+        return None if np.isnan(val) else val
+
+    @halpernb.setter
+    def halpernb(self, val):
+        self._set('halpernb', _halpern(val))
+
+    @property
+    def desc(self):
+        return self._stack.descs[self._index]
+
+    def get_rind(self):
+        """Return the layer refractive index."""
+        return self.rind
+
+    def get_thick(self):
+        """Return the layer thickness."""
+        return self.thick
+
+    def get_tand(self):
+        """Return the layer loss tangent."""
+        return self.tand
+
+    def get_desc(self):
+        """Return the layer description."""
+        return self.desc
+
+    def to_layer(self):
+        """Return a new ``Layer`` (or ``Source``, or ``Terminator``) with
+        the properties of this layer."""
+        if self.kind == SOURCE:
+            return armmwave.layer.Source(rind=self.rind, tand=self.tand)
+        if self.kind == TERMINATOR:
+            return armmwave.layer.Terminator(vac=self.vac, rind=self.rind,
+                                             tand=self.tand)
+        return armmwave.layer.Layer(rind=self.rind, thick=self.thick,
+                                    tand=self.tand, halperna=self.halperna,
+                                    halpernb=self.halpernb, desc=self.desc)
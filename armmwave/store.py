@@ -0,0 +1,250 @@
+"""
+This module contains the ``ResultStore`` class, a single on-disk store for
+calculation results (for example, the output of a multilayer crunch).
+
+A store is a directory holding two files:
+ * `results.dat` : the raw array data, with each result appended to the end
+ * `index.json` : one entry per result, giving its key, and the offset,
+   shape, and dtype of its data in `results.dat`
+
+Results are looked up by a structured key---a dictionary of descriptive
+fields, such as the materials, layer counts, and frequency band---and are
+read back lazily with `numpy.memmap`, so only the parts of a result that are
+actually used are read from disk.
+
+Several processes can add to the same store: writes are serialized with a
+lock on `store.lock` (on platforms with `fcntl`), and each write merges in
+the results the other processes have added.
+"""
+
+import contextlib
+import json
+import os
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+INDEX_FILE = 'index.json'
+DATA_FILE = 'results.dat'
+LOCK_FILE = 'store.lock'
+
+
+def make_key(**fields):
+    """Build a store key from keyword fields.
+
+    Floats are rounded to 12 significant figures and tuples become lists,
+    so that keys built from slightly different arithmetic (e.g. a thickness
+    in mils converted to meters) still match.
+
+    Parameters
+    ----------
+    **fields
+        The fields of the key. Values must be strings, numbers, booleans,
+        None, or lists/tuples of those.
+
+    Returns
+    -------
+    key : dict
+        The normalized key.
+    """
+    return {name:_normalize(val) for name, val in fields.items()}
+
+
+def _normalize(val):
+    """Normalize a single key value; see `make_key`."""
+    if isinstance(val, (list, tuple, np.ndarray)):
+        return [_normalize(v) for v in val]
+    if isinstance(val, (bool, np.bool_)):
+        return bool(val)
+    if isinstance(val, (int, np.integer)):
+        return int(val)
+    if isinstance(val, (float, np.floating)):
+        return float('{:.12g}'.format(val))
+    return val
+
+
+def _key_string(key):
+    """Return a canonical string for a normalized key."""
+    return json.dumps(key, sort_keys=True)
+
+
+class ResultStore:
+    """An indexed, append-only store of result arrays.
+
+    Data is never removed from `results.dat`: replacing a result leaves the
+    old data in place, unindexed, and the file is not compacted. Rebuild the
+    store (by copying the current results into a new one) to reclaim the
+    space.
+
+    Without `fcntl` (e.g. on Windows) there is no lock, and only one
+    ``ResultStore`` at a time should write to a directory.
+
+    Parameters
+    ----------
+    path : str
+        The directory holding the store. It is created if it doesn't exist.
+
+    Attributes
+    ----------
+    path : str
+        The directory holding the store.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._index = {}
+        self.reload()
+
+    def __repr__(self):
+        return 'ResultStore({!r}, {} results)'.format(self.path, len(self))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        key_string = _key_string(make_key(**key))
+        if key_string not in self._index:
+            self.reload()
+        return key_string in self._index
+
+    def reload(self):
+        """Re-read the index from disk, picking up results added by other
+        ``ResultStore`` objects on the same directory."""
+        index = {}
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                for entry in json.load(f):
+                    index[_key_string(entry['key'])] = entry
+        self._index = index
+
+    def keys(self):
+        """Return the keys of every result in the store."""
+        return [entry['key'] for entry in self._index.values()]
+
+    def find(self, **fields):
+        """Return the keys of every result whose key contains `fields`.
+
+        Parameters
+        ----------
+        **fields
+            The fields to match, e.g. ``find(layers=4)``.
+
+        Returns
+        -------
+        keys : list
+            The matching keys.
+        """
+        fields = make_key(**fields)
+        return [key for key in self.keys()
+                if all(key.get(name) == val for name, val in fields.items())]
+
+    def put(self, key, data, overwrite=False):
+        """Append a result to the store.
+
+        Parameters
+        ----------
+        key : dict
+            The key to store the result under. It is normalized with
+            `make_key`.
+        data : array_like
+            The result.
+        overwrite : bool, optional
+            Replace an existing result with the same key. The old data is
+            left in `results.dat` but is no longer indexed. Default is
+            False.
+
+        Raises
+        ------
+        KeyError
+            Raised if a result with the same key exists and `overwrite` is
+            False.
+        """
+        key = make_key(**key)
+        key_string = _key_string(key)
+        data = np.ascontiguousarray(data)
+        with self._lock():
+            # Another store on this directory may have written since
+            self.reload()
+            if key_string in self._index and not overwrite:
+                raise KeyError('A result with key {} is already in the store. '
+                               'Use `overwrite=True` to replace it.'.format(key))
+            data_path = os.path.join(self.path, DATA_FILE)
+            with open(data_path, 'ab') as f:
+                offset = f.tell()
+                f.write(data.tobytes())
+            self._index[key_string] = {'key':key, 'offset':offset,
+                                       'shape':list(data.shape),
+                                       'dtype':data.dtype.str}
+            self._write_index()
+
+    def get(self, key):
+        """Return a result, memory-mapped read-only from disk.
+
+        Parameters
+        ----------
+        key : dict
+            The key the result was stored under.
+
+        Returns
+        -------
+        data : numpy.memmap
+            The result. Its data is read from disk as it is accessed.
+
+        Raises
+        ------
+        KeyError
+            Raised if there is no result with that key.
+        """
+        key = make_key(**key)
+        key_string = _key_string(key)
+        if key_string not in self._index:
+            self.reload()
+        try:
+            entry = self._index[key_string]
+        except KeyError:
+            raise KeyError('No result with key {} in the store'.format(key))
+        shape = tuple(entry['shape'])
+        if 0 in shape:
+            return np.empty(shape, dtype=entry['dtype'])
+        return np.memmap(os.path.join(self.path, DATA_FILE), mode='r',
+                         dtype=entry['dtype'], offset=entry['offset'],
+                         shape=shape)
+
+    def import_npy(self, filename, key, overwrite=False):
+        """Copy a result saved with `numpy.save` into the store.
+
+        Parameters
+        ----------
+        filename : str
+            The path to the `.npy` file.
+        key : dict
+            The key to store the result under.
+        overwrite : bool, optional
+            See `put`.
+        """
+        self.put(key, np.load(filename, mmap_mode='r'), overwrite=overwrite)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Hold the store's write lock, if the platform has `fcntl`."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_index(self):
+        """Write the index to disk, replacing the old one in one step."""
+        index_path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(self._index.values()), f, indent=1)
+        os.replace(tmp_path, index_path)
@@ -0,0 +1,165 @@
+"""
+Benchmarks for the transfer-matrix engine in `armmwave.core`, and for the
+`Model` and `multilayer` code that drives it.
+
+The classes follow the airspeed velocity (asv) conventions: `params` and
+`param_names` define the benchmark matrix, `setup` is run (untimed) before
+each timing, and raising `NotImplementedError` from `setup` skips a
+combination. Run them with `asv run`, or without asv via
+
+    python benchmarks/run.py
+"""
+
+import concurrent.futures
+import numpy as np
+from armmwave import core
+from armmwave import layer
+from armmwave import model
+
+# Skip combinations whose (n_freq, n_layer) arrays won't comfortably fit in
+# memory on a laptop
+MAX_ELEMENTS = 5e6
+
+
+def make_layers(n_layer, loss):
+    """Build a random coating of `n_layer` material layers on a substrate.
+
+    Parameters
+    ----------
+    n_layer : int
+        The number of material layers, including the substrate.
+    loss : str
+        'constant' for fixed loss tangents, or 'halpern' to give every
+        material layer Halpern coefficients.
+
+    Returns
+    -------
+    layers : list
+        The layers, from ``Source`` to ``Terminator``.
+    """
+    rng = np.random.RandomState(0)
+    layers = [layer.Source()]
+    for i in range(n_layer - 1):
+        kwargs = {'rind':rng.uniform(1.2, 2.5), 'thick':rng.uniform(1e-4, 1e-3),
+                  'tand':rng.uniform(0, 1e-3)}
+        if loss == 'halpern':
+            kwargs['halperna'] = rng.uniform(1e-3, 1e-1)
+            kwargs['halpernb'] = rng.uniform(0.5, 2.)
+        layers.append(layer.Layer(**kwargs))
+    layers.append(layer.Layer(rind=3.1, thick=1.27e-2, tand=9e-5))
+    layers.append(layer.Terminator(vac=False))
+    return layers
+
+
+def make_model(n_layer, n_freq, loss, pol):
+    """Build and set up a ``Model`` for the benchmarks."""
+    test_m = model.Model()
+    test_m.set_freq_range(10e9, 500e9, nsample=n_freq)
+    test_m.set_up(make_layers(n_layer, loss), pol=pol)
+    return test_m
+
+
+class TimeMain:
+    """Time `core.main` over layer count, frequency count, loss model, and
+    polarization."""
+    params = ([3, 30, 200], [10, 2000, 100000], ['constant', 'halpern'],
+              ['s', 'p'])
+    param_names = ['n_layer', 'n_freq', 'loss', 'pol']
+
+    def setup(self, n_layer, n_freq, loss, pol):
+        if n_layer * n_freq > MAX_ELEMENTS:
+            raise NotImplementedError('Too large')
+        self.sim_params = make_model(n_layer, n_freq, loss, pol)._sim_params
+
+    def time_main(self, n_layer, n_freq, loss, pol):
+        core.main(self.sim_params)
+
+    def peakmem_main(self, n_layer, n_freq, loss, pol):
+        core.main(self.sim_params)
+
+
+class TimeRtAmp:
+    """Time a single-frequency `core.rt_amp` call."""
+    params = ([3, 30, 200], ['s', 'p'])
+    param_names = ['n_layer', 'pol']
+
+    def setup(self, n_layer, pol):
+        params = make_model(n_layer, 1, 'constant', pol)._sim_params
+        self.rind = params['rind']
+        self.theta = core.refract(self.rind, 0.)
+        ks = core.wavenumber(params['freq'][0], self.rind, params['tand'])
+        self.delta = core.prop_wavenumber(ks, params['thick'], self.theta)
+        self.pol = pol
+
+    def time_rt_amp(self, n_layer, pol):
+        core.rt_amp(self.rind, self.delta, self.theta, self.pol)
+
+
+class TimeRefract:
+    """Time `core.refract` (memoized) and `core.snell_angle` (not) at normal
+    and oblique incidence."""
+    params = ([3, 30, 200], [0., 0.5])
+    param_names = ['n_layer', 'theta0']
+
+    def setup(self, n_layer, theta0):
+        self.rind = np.array([l.rind for l in make_layers(n_layer, 'constant')])
+
+    def time_refract(self, n_layer, theta0):
+        core.refract(self.rind, theta0)
+
+    def time_snell_angle(self, n_layer, theta0):
+        core.snell_angle(self.rind, self.rind[0], theta0)
+
+
+class TimeSetUp:
+    """Time `Model.set_up`."""
+    params = ([3, 30, 200], ['constant', 'halpern'])
+    param_names = ['n_layer', 'loss']
+
+    def setup(self, n_layer, loss):
+        self.layers = make_layers(n_layer, loss)
+        self.freq = np.linspace(10e9, 500e9, 2000)
+
+    def time_set_up(self, n_layer, loss):
+        test_m = model.Model()
+        test_m.freq_range = self.freq
+        test_m.set_up(self.layers)
+
+
+class TimeRunThreaded:
+    """Time `model.run_threaded` on 16 models, against the number of
+    threads."""
+    params = ([1, 4], ['numpy', 'numba'])
+    param_names = ['n_thread', 'backend']
+
+    def setup(self, n_thread, backend):
+        self.models = [make_model(30, 2000, 'constant', 's')
+                       for i in range(16)]
+        self.executor = concurrent.futures.ThreadPoolExecutor(n_thread)
+        # Compile the Numba kernel outside the timing
+        self.models[0].run(backend=backend)
+
+    def teardown(self, n_thread, backend):
+        self.executor.shutdown()
+
+    def time_run_threaded(self, n_thread, backend):
+        model.run_threaded(self.models, executor=self.executor,
+                           backend=backend)
+
+
+class TimeArc:
+    """Time `multilayer.arc` for a three-material coating."""
+    params = ([1, 2, 4],)
+    param_names = ['n_each']
+
+    def setup(self, n_each):
+        try:
+            from armmwave import multilayer
+        except ImportError:
+            raise NotImplementedError('multilayer needs matplotlib')
+        self.multilayer = multilayer
+
+    def time_arc(self, n_each):
+        ml = self.multilayer
+        ml.arc(ml.ro3006, ml.ro3035, ml.zitex, n_each, n_each, n_each,
+               ml.adjtransfreqlow, ml.adjtransfreqhigh)
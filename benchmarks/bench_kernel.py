@@ -0,0 +1,85 @@
+"""
+Micro-benchmarks for the characteristic-matrix chain in `armmwave.core`.
+
+Compares the per-frequency `rt_amp` (which builds every 2x2 matrix with
+`make_2x2` and multiplies them with `np.dot`), a broadcast `np.matmul`
+chain of `layer_matrix` matrices, and the element-wise `chain_2x2` kernel
+used by `rt_amp_vec`.
+
+The classes follow the airspeed velocity (asv) conventions, but the file
+can also be run directly to print a table of timings and speedups:
+
+    python benchmarks/bench_kernel.py
+"""
+
+import timeit
+import numpy as np
+from armmwave import core
+
+
+def _make_inputs(n_layer, n_freq):
+    """Build the inputs to the matrix chain for a random lossy stack."""
+    rng = np.random.RandomState(0)
+    rind = np.concatenate(([1.], rng.uniform(1.2, 3.4, n_layer), [1.]))
+    tand = np.concatenate(([0.], rng.uniform(0, 1e-3, n_layer), [0.]))
+    thick = np.concatenate(([np.inf], rng.uniform(1e-4, 1e-3, n_layer),
+                            [np.inf]))
+    freq = np.linspace(10e9, 500e9, n_freq)
+    theta = core.refract(rind, 0.)
+    ks = core.wavenumber(freq[:, np.newaxis], rind, tand)
+    delta = core.prop_wavenumber(ks, thick, theta)
+    t_amp, r_amp = core.make_rt_interfaces(rind, theta, 's')
+    return rind, theta, delta, t_amp, r_amp
+
+
+def _matmul_chain(delta, t_amp, r_amp):
+    """The broadcast `np.matmul` chain, for comparison."""
+    m_prime = np.broadcast_to(np.eye(2, dtype=complex),
+                              delta.shape[:-1] + (2, 2))
+    for i in range(1, delta.shape[-1]-1):
+        m_prime = np.matmul(m_prime,
+                            core.layer_matrix(delta[..., i], t_amp[i],
+                                              r_amp[i]))
+    return m_prime
+
+
+class TimeMatrixChain:
+    """Time the matrix chain over layer and frequency counts."""
+    params = ([3, 30, 200], [10, 2000])
+    param_names = ['n_layer', 'n_freq']
+
+    def setup(self, n_layer, n_freq):
+        (self.rind, self.theta, self.delta,
+         self.t_amp, self.r_amp) = _make_inputs(n_layer, n_freq)
+
+    def time_rt_amp(self, n_layer, n_freq):
+        """The original per-frequency calculation."""
+        for delta in self.delta:
+            core.rt_amp(self.rind, delta, self.theta, 's')
+
+    def time_matmul_chain(self, n_layer, n_freq):
+        _matmul_chain(self.delta, self.t_amp, self.r_amp)
+
+    def time_rt_amp_vec(self, n_layer, n_freq):
+        core.rt_amp_vec(self.delta, self.t_amp, self.r_amp)
+
+
+if __name__ == '__main__':
+    bench = TimeMatrixChain()
+    methods = ['time_rt_amp', 'time_matmul_chain', 'time_rt_amp_vec']
+    print('{:>8} {:>8} {:>14} {:>14} {:>14} {:>9}'.format(
+        'n_layer', 'n_freq', 'rt_amp (s)', 'matmul (s)', 'rt_amp_vec (s)',
+        'speedup'))
+    for n_layer in TimeMatrixChain.params[0]:
+        for n_freq in TimeMatrixChain.params[1]:
+            bench.setup(n_layer, n_freq)
+            times = []
+            for name in methods:
+                func = getattr(bench, name)
+                number = 1 if name == 'time_rt_amp' else 10
+                best = min(timeit.repeat(lambda: func(n_layer, n_freq),
+                                         number=number, repeat=3))
+                times.append(best / number)
+            print('{:>8} {:>8} {:>14.3e} {:>14.3e} {:>14.3e} {:>8.0f}x'.format(
+                n_layer, n_freq, times[0], times[1], times[2],
+                times[0] / times[2]))
@@ -0,0 +1,177 @@
+"""
+A small standalone runner for the benchmarks in this directory, for when
+asv isn't installed or a full asv run is more than you need.
+
+It finds every ``Time*`` class in the ``bench_*.py`` modules, runs each
+``time_*`` method over the class's parameter grid, and saves the timings
+(with the numpy/python/platform versions and git commit) as JSON:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --filter TimeMain --quick
+    python benchmarks/run.py --compare old.json
+
+With ``--compare``, benchmarks that got slower than the old results by more
+than ``--threshold`` are listed, and the exit status is 1.
+"""
+
+import argparse
+import datetime
+import glob
+import importlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def git_commit():
+    """Return the current git commit hash, or None outside a git checkout."""
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def metadata():
+    """Describe the environment the benchmarks were run in."""
+    try:
+        from importlib.metadata import version
+        armmwave_version = version('armmwave')
+    except Exception:
+        armmwave_version = None
+    return {'armmwave':armmwave_version, 'numpy':np.__version__,
+            'python':platform.python_version(),
+            'platform':platform.platform(),
+            'timestamp':datetime.datetime.now().isoformat(),
+            'commit':git_commit()}
+
+
+def find_benchmarks():
+    """Yield (name, class) for every benchmark class in bench_*.py."""
+    sys.path.insert(0, HERE)
+    for path in sorted(glob.glob(os.path.join(HERE, 'bench_*.py'))):
+        module = importlib.import_module(os.path.basename(path)[:-3])
+        for name in sorted(vars(module)):
+            obj = getattr(module, name)
+            if name.startswith('Time') and isinstance(obj, type):
+                yield '{}.{}'.format(module.__name__, name), obj
+
+
+def time_benchmark(bench, method, args, repeat, quick):
+    """Time one benchmark method, returning the best and median seconds
+    per call, or None if the combination is skipped."""
+    try:
+        bench.setup(*args)
+    except NotImplementedError:
+        return None
+    func = getattr(bench, method)
+    timer = timeit.Timer(lambda: func(*args))
+    try:
+        # autorange picks enough calls per repeat to take at least 0.2 s
+        number = 1 if quick else timer.autorange()[0]
+        times = [t / number
+                 for t in timer.repeat(repeat=repeat, number=number)]
+    finally:
+        if hasattr(bench, 'teardown'):
+            bench.teardown(*args)
+    return {'best':min(times), 'median':float(np.median(times)),
+            'number':number, 'repeat':repeat}
+
+
+def run(pattern=None, quick=False):
+    """Run all the benchmarks whose name contains `pattern`.
+
+    Parameters
+    ----------
+    pattern : str, optional
+        Only run benchmarks whose full name (e.g.
+        'bench_core.TimeMain.time_main') contains this string.
+    quick : bool, optional
+        Time each benchmark once, with no repeats. Default is False.
+
+    Returns
+    -------
+    results : dict
+        Timings keyed by benchmark name and then by parameter string.
+    """
+    repeat = 1 if quick else 5
+    results = {}
+    for cls_name, cls in find_benchmarks():
+        params = getattr(cls, 'params', ())
+        if params and not isinstance(params[0], (list, tuple)):
+            params = (params,)
+        for method in sorted(m for m in vars(cls) if m.startswith('time_')):
+            name = '{}.{}'.format(cls_name, method)
+            if pattern is not None and pattern not in name:
+                continue
+            bench = cls()
+            results[name] = {}
+            for args in itertools.product(*params):
+                timing = time_benchmark(bench, method, args, repeat, quick)
+                key = ', '.join(str(a) for a in args)
+                results[name][key] = timing
+                if timing is None:
+                    print('{} ({}): skipped'.format(name, key))
+                else:
+                    print('{} ({}): {:.3e} s'.format(name, key,
+                                                     timing['best']))
+    return results
+
+
+def compare(new, old, threshold):
+    """List benchmarks that are more than `threshold` times slower in `new`
+    than in `old`."""
+    slower = []
+    for name, timings in new.items():
+        for key, timing in timings.items():
+            prev = old.get(name, {}).get(key)
+            if timing is None or prev is None:
+                continue
+            ratio = timing['best'] / prev['best']
+            if ratio > threshold:
+                slower.append((name, key, prev['best'], timing['best'], ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='where to save the results')
+    parser.add_argument('--filter', default=None,
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--quick', action='store_true',
+                        help='time each benchmark once')
+    parser.add_argument('--compare', default=None,
+                        help='a previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.quick)
+    with open(args.output, 'w') as f:
+        json.dump({'metadata':metadata(), 'results':results}, f, indent=2)
+    print('Saved results to {}'.format(args.output))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)['results']
+        slower = compare(results, old, args.threshold)
+        for name, key, t_old, t_new, ratio in slower:
+            print('SLOWER {} ({}): {:.3e} s -> {:.3e} s ({:.2f}x)'.format(
+                name, key, t_old, t_new, ratio))
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,7 +19,8 @@ setup(
     platforms=['Linux', 'MacOS X'],
     url='https://github.com/anadolski/armmwave',
     install_requires=install_reqs,
-    python_requires='>=3.5',
+    extras_require={'jit': ['numba']},
+    python_requires='>=3.9',
     package_dir={'armmwave': 'armmwave'},
     packages=['armmwave'],
     tests_require=['pytest'],
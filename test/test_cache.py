@@ -0,0 +1,116 @@
+"""
+Contains tests for the cache.py module.
+"""
+
+import os
+import pytest
+import numpy as np
+import numpy.testing as npt
+from armmwave import cache
+from armmwave import layer
+from armmwave import model
+
+def _params(**kwargs):
+    params = {'rind':np.array([1., 1.5, 1.]), 'thick':np.array([1., 1e-3, 1.]),
+              'tand':np.array([0., 1e-3, 0.]),
+              'freq':np.linspace(10e9, 100e9, 5), 'theta0':0., 'pol':'s',
+              'halpern_layers':{}}
+    params.update(kwargs)
+    return params
+
+def _results(value):
+    return {'frequency':np.arange(3.), 'transmittance':np.full(3, value),
+            'reflectance':np.full(3, 1 - value)}
+
+def test_hash_params():
+    """Check that the hash changes with every calculation parameter, and
+    only with those."""
+    key = cache.hash_params(_params())
+    assert key == cache.hash_params(_params())
+    assert key == cache.hash_params(_params(rind=[1, 1.5, 1],
+                                            theta=np.zeros(3)))
+    for change in [{'rind':np.array([1., 1.6, 1.])},
+                   {'thick':np.array([1., 2e-3, 1.])},
+                   {'tand':np.array([0., 2e-3, 0.])},
+                   {'freq':np.linspace(10e9, 100e9, 6)},
+                   {'theta0':0.1}, {'pol':'p'},
+                   {'halpern_layers':{1:{'a':1e-2, 'b':1., 'n':1.5}}}]:
+        assert cache.hash_params(_params(**change)) != key
+
+def test_lru_eviction():
+    """Check that the least recently used result is evicted first."""
+    results = cache.ResultCache(maxsize=2)
+    results.put('a', _results(0.1))
+    results.put('b', _results(0.2))
+    assert results.get('a') is not None
+    results.put('c', _results(0.3))
+    assert 'b' not in results
+    npt.assert_equal(results.get('a')['transmittance'], 0.1)
+    npt.assert_equal(results.get('c')['transmittance'], 0.3)
+    assert results.get('b') is None
+    stats = results.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (3, 1, 1)
+    assert stats['size'] == 2
+    pytest.raises(ValueError, cache.ResultCache, maxsize=0)
+
+def test_get_returns_copy():
+    """Check that changing returned results doesn't change the cache."""
+    results = cache.ResultCache()
+    results.put('a', _results(0.1))
+    results.get('a')['transmittance'][:] = 0.
+    npt.assert_equal(results.get('a')['transmittance'], 0.1)
+
+def test_disk_tier(tmp_path):
+    """Check that results are found on disk after they leave memory, and
+    that the disk tier stays under its size cap."""
+    results = cache.ResultCache(maxsize=1, path=str(tmp_path))
+    results.put('a', _results(0.1))
+    results.put('b', _results(0.2))
+    npt.assert_equal(results.get('a')['transmittance'], 0.1)
+    assert results.stats()['disk_hits'] == 1
+
+    file_size = os.path.getsize(os.path.join(str(tmp_path), 'a.npz'))
+    capped = cache.ResultCache(maxsize=1, path=str(tmp_path / 'capped'),
+                               max_disk_bytes=2.5 * file_size)
+    for key in 'abcd':
+        capped.put(key, _results(0.5))
+    assert len(os.listdir(str(tmp_path / 'capped'))) == 2
+    results.clear()
+    assert os.listdir(str(tmp_path)) == ['capped']
+    assert results.get('a') is None
+
+def test_disk_tier_oversize(tmp_path):
+    """Check that a result too big for the disk tier stays in memory and
+    doesn't push the other results off disk."""
+    probe = cache.ResultCache(maxsize=1, path=str(tmp_path / 'probe'))
+    probe.put('a', _results(0.1))
+    file_size = os.path.getsize(str(tmp_path / 'probe' / 'a.npz'))
+    path = tmp_path / 'capped'
+    capped = cache.ResultCache(maxsize=1, path=str(path),
+                               max_disk_bytes=1.5 * file_size)
+    capped.put('a', _results(0.1))
+    big = dict(_results(0.2), transmittance=np.zeros(1000))
+    capped.put('big', big)
+    assert os.listdir(str(path)) == ['a.npz']
+    npt.assert_equal(capped.get('big')['transmittance'], 0.)
+    capped.put('b', _results(0.3))
+    assert os.listdir(str(path)) == ['b.npz']
+    npt.assert_equal(capped.get('b')['transmittance'], 0.3)
+
+def test_run_cache():
+    """Check that `Model.run` reuses cached results for identical models."""
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Terminator()]
+    results = cache.ResultCache()
+    test_m = model.Model()
+    test_m.set_up(layers)
+    expected = test_m.run(cache=results)
+    assert results.stats()['misses'] == 1
+    other_m = model.Model()
+    other_m.set_up(layers)
+    npt.assert_equal(other_m.run(cache=results)['transmittance'],
+                     expected['transmittance'])
+    assert results.stats()['hits'] == 1
+    other_m.set_up(layers, pol='p')
+    other_m.run(cache=results)
+    assert results.stats()['misses'] == 2
@@ -2,6 +2,7 @@
 Contains tests for the core.py module.
 """
 
+import warnings
 import pytest
 import numpy as np
 import numpy.testing as npt
@@ -46,6 +47,24 @@ def test_make_rt_amp_matrix(test_n, test_theta, test_pol, expected_r, expected_t
     npt.assert_allclose(t, expected_t)
     npt.assert_allclose(r, expected_r)
 
+@pytest.mark.parametrize('test_pol', ['s', 'p'])
+def test_make_rt_interfaces(test_pol):
+    """
+    Check that the compact interface amplitudes match the superdiagonal of
+    the r- and t-amplitude matrices.
+    """
+    n = np.array([1., 1.5, 3.1, 1.])
+    theta = core.refract(n, 0.4)
+    t_mat, r_mat = core.make_rt_amp_matrix(n, theta, test_pol)
+    t, r = core.make_rt_interfaces(n, theta, test_pol)
+    assert t.shape == r.shape == (3,)
+    npt.assert_allclose(t, np.diagonal(t_mat, 1))
+    npt.assert_allclose(r, np.diagonal(r_mat, 1))
+    t_both, r_both = core.make_rt_interfaces(n, theta, 'u')
+    assert t_both.shape == r_both.shape == (2, 3)
+    npt.assert_allclose(t_both[['s', 'p'].index(test_pol)], t)
+    npt.assert_allclose(r_both[['s', 'p'].index(test_pol)], r)
+
 @pytest.mark.parametrize('test_n, test_tmat, test_rmat, test_delta, expected',
     [(np.array([1., 1., 1.]),
       np.array([[0., 1., 0.], [0., 0., 1.], [0., 0., 0.]]),
@@ -206,12 +225,497 @@ def test_refract(test_n, test_theta0, expected):
     """
     npt.assert_allclose(core.refract(test_n, test_theta0), expected)
 
-@pytest.mark.skip(reason='no way of currently testing this')
+def test_refract_angle_array():
+    """Check that an array of incident angles gives one row of angles each."""
+    n = np.array([1., 1.5, 1.])
+    theta0 = np.array([0., 0.5235987755982988])
+    expected = np.array([[0., 0., 0.],
+                         [0.5235987755982988, 0.33983690945412187,
+                          0.5235987755982988]])
+    npt.assert_allclose(core.refract(n, theta0), expected)
+
+def test_snell_geometry_cache():
+    """Check that the Snell angles are memoized, read-only, and come with
+    their cosines."""
+    core.clear_snell_cache()
+    n = np.array([1., 1.5, 1.])
+    theta, cos_theta = core.snell_geometry(n, np.array([0., 0.3]))
+    again = core.snell_geometry([1., 1.5, 1.], [0., 0.3])
+    assert again[0] is theta
+    assert core._snell_geometry.cache_info().hits == 1
+    npt.assert_allclose(cos_theta, np.cos(theta))
+    with pytest.raises(ValueError):
+        theta[0, 0] = 1.
+    assert core.snell_geometry(n, 0.3)[0].shape == (3,)
+    core.clear_snell_cache()
+    assert core._snell_geometry.cache_info().currsize == 0
+
+def test_layer_phase():
+    """Check that the phase matches `prop_wavenumber` in the material
+    layers, is zero at the boundaries, and raises no warnings at zero
+    frequency."""
+    k = np.array([[1e8, 15e-6, 2e-6, 1e8], [0., 0., 0., 0.]])
+    d = np.array([np.inf, 100, 50, np.inf])
+    cos_theta = np.cos(np.array([0.5, 0.3, 0.2, 0.5]))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        delta = core.layer_phase(k, d, cos_theta)
+    npt.assert_allclose(delta[:, 1:-1],
+                        core.prop_wavenumber(k, d, np.arccos(cos_theta))[:, 1:-1])
+    npt.assert_equal(delta[:, [0, -1]], 0.)
+
+def test_refract_critical_angle():
+    """
+    Check that past the critical angle we get a complex angle (an
+    evanescent wave) rather than a NaN, and that frustrated total internal
+    reflection conserves energy.
+    """
+    n = np.array([1.5, 1., 1.5])
+    theta = core.refract(n, 0.9)
+    assert np.iscomplexobj(theta)
+    assert not np.any(np.isnan(theta))
+    params = {'rind':n, 'tand':np.zeros(3),
+              'thick':np.array([np.inf, 1e-3, np.inf]),
+              'freq':np.array([1e11]), 'theta0':0.9, 'pol':'s',
+              'halpern_layers':{}}
+    results = core.main(params)
+    assert 0. < results['transmittance'][0] < 1.
+    npt.assert_allclose(results['transmittance'] + results['reflectance'], 1.)
+
 def test_replace_tand():
-    """This will function will be incorporated into the integration tests."""
-    pass
+    """Check that `replace_tand` returns a new array, and leaves its input
+    alone so it can be shared between threads."""
+    tand = np.array([0., 1e-3, 0.])
+    halps = {2: {'a':3e-2, 'b':1.5, 'n':1.5}}
+    result = core.replace_tand(100e9, tand, halps)
+    npt.assert_equal(tand, [0., 1e-3, 0.])
+    assert result[2] == core.alpha2tand(100e9, 3e-2, 1.5, 1.5)
+    assert result[1] == 1e-3
+
+def test_halpern_tand():
+    """
+    Check that `halpern_tand` matches `replace_tand` at every frequency,
+    without modifying its input.
+    """
+    freq = np.linspace(10e9, 500e9, 11)
+    tand = np.array([0., 1e-3, 0., 5e-3, 0.])
+    halps = {2: {'a':3e-2, 'b':1.5, 'n':1.5}, 3: {'a':1e-2, 'b':2., 'n':2.2}}
+    tand_array = core.halpern_tand(freq, tand, halps)
+    assert tand_array.shape == (11, 5)
+    npt.assert_equal(tand, [0., 1e-3, 0., 5e-3, 0.])
+    for f, row in zip(freq, tand_array):
+        npt.assert_allclose(row, core.replace_tand(f, tand.copy(), halps),
+                            rtol=1e-14)
+    npt.assert_equal(core.halpern_tand(freq, tand, {}),
+                     np.broadcast_to(tand, (11, 5)))
+
+def _main_per_frequency(params):
+    """Evaluate the model one frequency at a time with `rt_amp`."""
+    rind = params['rind']
+    tand = np.array(params['tand'], dtype=float)
+    theta = core.refract(rind, params['theta0'])
+    ts = []
+    rs = []
+    for f in params['freq']:
+        tand = core.replace_tand(f, tand, params['halpern_layers'])
+        ks = core.wavenumber(f, rind, tand)
+        delta = core.prop_wavenumber(ks, params['thick'], theta)
+        r_amp, t_amp = core.rt_amp(rind, delta, theta, params['pol'])
+        ts.append(core.t_power(t_amp, rind[0], rind[-1], theta[0], theta[-1]))
+        rs.append(core.r_power(r_amp))
+    return np.asarray(ts), np.asarray(rs)
+
+def _example_params(pol, theta0=0.3, halpern=True):
+    """A lossy four-layer stack on a thick substrate."""
+    halps = {}
+    if halpern:
+        halps = {2: {'a':3e-2, 'b':1.5, 'n':1.5}}
+    return {'rind':np.array([1., 1.3, 1.5, 2.2, 3.1, 1.]),
+            'tand':np.array([0., 1e-3, 0., 5e-3, 9e-5, 0.]),
+            'thick':np.array([np.inf, 3e-4, 1e-4, 2e-4, 5e-3, np.inf]),
+            'freq':np.linspace(10e9, 500e9, 57),
+            'theta0':theta0, 'pol':pol, 'halpern_layers':halps}
+
+@pytest.mark.parametrize('test_halpern', [True, False])
+@pytest.mark.parametrize('test_pol', ['s', 'p'])
+def test_main(test_pol, test_halpern):
+    """
+    Check that the vectorized calculation matches a frequency-by-frequency
+    evaluation with `rt_amp`, and that the input loss tangents are left
+    alone.
+    """
+    params = _example_params(test_pol, halpern=test_halpern)
+    tand_in = params['tand'].copy()
+    expected_t, expected_r = _main_per_frequency(params)
+    results = core.main(params)
+    npt.assert_equal(results['frequency'], params['freq'])
+    npt.assert_allclose(results['transmittance'], expected_t, rtol=1e-12)
+    npt.assert_allclose(results['reflectance'], expected_r, rtol=1e-10,
+                        atol=1e-15)
+    npt.assert_equal(params['tand'], tand_in)
+
+def test_main_unpolarized():
+    """
+    Check that calculating both polarizations at once matches separate 's'
+    and 'p' calculations, and that T and R are their average.
+    """
+    results = core.main(_example_params('u'))
+    for pol in ['s', 'p']:
+        expected = core.main(_example_params(pol))
+        npt.assert_allclose(results['transmittance_' + pol],
+                            expected['transmittance'], rtol=1e-12)
+        npt.assert_allclose(results['reflectance_' + pol],
+                            expected['reflectance'], rtol=1e-12)
+    npt.assert_allclose(results['transmittance'],
+                        0.5 * (results['transmittance_s'] +
+                               results['transmittance_p']))
+    npt.assert_allclose(results['reflectance'],
+                        0.5 * (results['reflectance_s'] +
+                               results['reflectance_p']))
+
+def test_pad_stack():
+    """Check that padding layers go in just before the terminator."""
+    params = _example_params('s')
+    rind, thick, tand = core.pad_stack(params, 8)
+    npt.assert_equal(rind, [1., 1.3, 1.5, 2.2, 3.1, 3.1, 3.1, 1.])
+    npt.assert_equal(thick[5:7], [0., 0.])
+    npt.assert_equal(tand[5:7], [0., 0.])
+    pytest.raises(ValueError, core.pad_stack, params, 5)
+
+@pytest.mark.parametrize('test_pol', ['s', 'p'])
+def test_main_batch(test_pol):
+    """
+    Check that evaluating models of different depths together gives the
+    same answer as evaluating them one at a time.
+    """
+    deep = _example_params(test_pol)
+    shallow = _example_params(test_pol, halpern=False)
+    for key in ['rind', 'tand', 'thick']:
+        shallow[key] = np.delete(shallow[key], [1, 2])
+    results = core.main_batch([deep, shallow, deep])
+    assert results['transmittance'].shape == (3, deep['freq'].size)
+    for i, params in enumerate([deep, shallow, deep]):
+        expected = core.main(params)
+        npt.assert_allclose(results['transmittance'][i],
+                            expected['transmittance'], rtol=1e-12)
+        npt.assert_allclose(results['reflectance'][i],
+                            expected['reflectance'], rtol=1e-10, atol=1e-15)
+
+@pytest.mark.parametrize('test_theta0', [0.3, np.array([0., 0.3, 0.6])])
+@pytest.mark.parametrize('test_pol', ['s', 'u'])
+def test_main_chunked(test_pol, test_theta0):
+    """
+    Check that calculating the frequencies in blocks gives the same answer
+    as calculating them all at once.
+    """
+    params = _example_params(test_pol, theta0=test_theta0)
+    expected = core.main(params)
+    for chunk_size in [1, 10, 57, 100]:
+        results = core.main_chunked(params, chunk_size=chunk_size)
+        assert results.keys() == expected.keys()
+        for key in expected:
+            npt.assert_allclose(results[key], expected[key], rtol=1e-12)
+    results = core.main_chunked(params, max_memory=20000)
+    npt.assert_allclose(results['transmittance'], expected['transmittance'],
+                        rtol=1e-12)
+
+def test_estimate_chunk_size():
+    """Check that the chunk size scales with the memory budget and the
+    amount of work per frequency."""
+    params = _example_params('s')
+    n_freq = core.estimate_chunk_size(params, 1e6)
+    assert n_freq >= 1
+    assert core.estimate_chunk_size(params, 2e6) >= 2 * n_freq - 1
+    assert core.estimate_chunk_size(dict(params, pol='u'), 1e6) < n_freq
+    pytest.raises(ValueError, core.estimate_chunk_size, params, 10)
+    pytest.raises(ValueError, list, core.iter_chunks(params, 0))
+
+@pytest.mark.parametrize('test_pol', ['s', 'p'])
+def test_interface_derivatives(test_pol):
+    """Check the interface derivatives against finite differences."""
+    rind = np.array([1., 1.3, 2.2, 3.1, 1.5])
+    theta = core.refract(rind, 0.4)
+    t_amp, r_amp = core.make_rt_interfaces(rind, theta, test_pol)
+    dt_a, dr_a, dt_b, dr_b = core.interface_derivatives(rind, theta, test_pol)
+    h = 1e-7
+    for j in range(1, len(rind)-1):
+        shifted = rind.copy()
+        shifted[j] += h
+        t_new, r_new = core.make_rt_interfaces(
+            shifted, core.refract(shifted, 0.4), test_pol)
+        # Layer j is after interface j-1 and before interface j
+        npt.assert_allclose((t_new - t_amp)[j-1:j+1] / h,
+                            [dt_b[j-1], dt_a[j]], atol=1e-6)
+        npt.assert_allclose((r_new - r_amp)[j-1:j+1] / h,
+                            [dr_b[j-1], dr_a[j]], atol=1e-6)
+
+def test_alpha2tand_deriv():
+    """Check the Halpern loss-tangent derivative against finite
+    differences."""
+    freq = np.linspace(10e9, 500e9, 7)
+    h = 1e-6
+    expected = (core.alpha2tand(freq, 3e-2, 1.5, 1.5 + h) -
+                core.alpha2tand(freq, 3e-2, 1.5, 1.5 - h)) / (2 * h)
+    npt.assert_allclose(core.alpha2tand_deriv(freq, 3e-2, 1.5, 1.5),
+                        expected, rtol=1e-6)
+
+def _shifted(params, name, j, h):
+    """Copy `params`, moving parameter `name` of layer `j` by `h`."""
+    params = dict(params)
+    params[name] = np.array(params[name], dtype=float)
+    params[name][j] += h
+    if name == 'rind':
+        params['halpern_layers'] = {
+            k:dict(v, n=params['rind'][k])
+            for k, v in params['halpern_layers'].items()}
+    return params
+
+@pytest.mark.parametrize('test_theta0', [0.3, np.array([0., 0.6])])
+@pytest.mark.parametrize('test_pol', ['s', 'p', 'u'])
+def test_main_gradient(test_pol, test_theta0):
+    """
+    Check the analytic derivatives of T and R against central finite
+    differences, including through a Halpern layer.
+    """
+    params = _example_params(test_pol, theta0=test_theta0)
+    results = core.main_gradient(params)
+    expected = core.main(params)
+    for key in expected:
+        npt.assert_allclose(results[key], expected[key], rtol=1e-10,
+                            atol=1e-14)
+    n_mat = len(params['rind']) - 2
+    for name, h in [('thick', 1e-9), ('rind', 1e-6), ('tand', 1e-6)]:
+        for key in ['transmittance', 'reflectance']:
+            grad = results['{}_grad_{}'.format(key, name)]
+            assert grad.shape == expected[key].shape + (n_mat,)
+        for j in range(1, n_mat+1):
+            upper = core.main(_shifted(params, name, j, h))
+            lower = core.main(_shifted(params, name, j, -h))
+            for key in ['transmittance', 'reflectance']:
+                grad = results['{}_grad_{}'.format(key, name)]
+                if name == 'tand' and j in params['halpern_layers']:
+                    npt.assert_equal(grad[..., j-1], 0.)
+                    continue
+                fd = (upper[key] - lower[key]) / (2 * h)
+                npt.assert_allclose(grad[..., j-1], fd, rtol=1e-5,
+                                    atol=1e-6 * np.abs(fd).max())
+
+def test_main_chunked_gradient():
+    """Check that the derivatives can be calculated in blocks."""
+    params = _example_params('s')
+    expected = core.main_gradient(params)
+    results = core.main_chunked(params, chunk_size=10, gradient=True)
+    assert results.keys() == expected.keys()
+    for key in expected:
+        npt.assert_allclose(results[key], expected[key], rtol=1e-12)
+
+def test_main_batch_mismatch():
+    """Check that models must share frequencies, angle, and polarization."""
+    params = _example_params('s')
+    pytest.raises(ValueError, core.main_batch, [])
+    pytest.raises(ValueError, core.main_batch,
+                  [params, _example_params('p')])
+    pytest.raises(ValueError, core.main_batch,
+                  [params, _example_params('s', theta0=0.)])
+    other = _example_params('s')
+    other['freq'] = other['freq'][:-1]
+    pytest.raises(ValueError, core.main_batch, [params, other])
+
+def _dense_average(params, low, high, weight=None):
+    """The band average from a dense grid and the trapezoid rule."""
+    freq = np.linspace(low, high, 200001)
+    results = core.main(dict(params, freq=freq))
+    w = np.ones_like(freq) if weight is None else weight(freq)
+    return {key:np.trapezoid(val * w, freq, axis=-1) / np.trapezoid(w, freq)
+            for key, val in results.items() if key != 'frequency'}
+
+@pytest.mark.parametrize('test_pol, test_theta0', [
+    ('s', 0.3), ('u', np.array([0., 0.4]))])
+def test_band_average(test_pol, test_theta0):
+    """
+    Check that the adaptive band average matches a dense grid, with far
+    fewer frequencies, with and without a spectral weight.
+    """
+    params = _example_params(test_pol, theta0=test_theta0)
+    expected = _dense_average(params, 25.5e9, 46e9)
+    results = core.band_average(params, 46e9, 25.5e9, tol=1e-7)
+    assert results['n_evaluations'] < 500
+    assert results['error'] < 1e-7
+    npt.assert_equal(results['band'], [25.5e9, 46e9])
+    for key in expected:
+        npt.assert_allclose(results[key], expected[key], atol=1e-7)
+
+    weight = lambda f: np.exp(-((f - 36e9) / 3e9)**2)
+    expected = _dense_average(params, 25.5e9, 46e9, weight)
+    results = core.band_average(params, 25.5e9, 46e9, weight=weight)
+    npt.assert_allclose(results['transmittance'], expected['transmittance'],
+                        atol=1e-5)
+    freq = np.linspace(25e9, 47e9, 1000)
+    tabulated = core.band_average(params, 25.5e9, 46e9,
+                                  weight=(freq, weight(freq)))
+    npt.assert_allclose(tabulated['transmittance'],
+                        expected['transmittance'], atol=1e-5)
+
+def test_band_average_limits():
+    """Check the evaluation cap, the loop backend, and the bad inputs."""
+    params = _example_params('s')
+    with pytest.warns(RuntimeWarning):
+        results = core.band_average(params, 10e9, 500e9, tol=1e-12,
+                                    max_evals=100)
+    assert results['n_evaluations'] <= 100
+    npt.assert_allclose(
+        core.band_average(params, 30e9, 40e9, backend='loop')['reflectance'],
+        core.band_average(params, 30e9, 40e9)['reflectance'], rtol=1e-10)
+    pytest.raises(ValueError, core.band_average, params, 30e9, 30e9)
+    pytest.raises(ValueError, core.band_average, params, 30e9, 40e9,
+                  weight=np.zeros_like)
+
+def test_fringe_spacing():
+    """Check that only layers between reflecting interfaces set the fringe
+    spacing."""
+    params = _example_params('s', theta0=0.)
+    optical_path = np.sum(params['rind'][1:-1] * params['thick'][1:-1])
+    npt.assert_allclose(core.fringe_spacing(params, max_phase=2*np.pi),
+                        3e8 / (2 * optical_path))
+    # Match the substrate to the terminator, and it drops out
+    matched = dict(params, rind=np.array([1., 1.3, 1.5, 2.2, 3.1, 3.1]))
+    optical_path = np.sum(matched['rind'][1:-2] * matched['thick'][1:-2])
+    npt.assert_allclose(core.fringe_spacing(matched, max_phase=2*np.pi),
+                        3e8 / (2 * optical_path))
+    uniform = dict(params, rind=np.full(6, 1.5))
+    assert core.fringe_spacing(uniform) == np.inf
+
+@pytest.mark.parametrize('test_pol, test_theta0', [
+    ('s', 0.3), ('u', np.array([0., 0.4]))])
+def test_adaptive_sample(test_pol, test_theta0):
+    """
+    Check that linear interpolation of the adaptive grid is within the
+    tolerance of a dense grid, and that the grid is exact where it samples.
+    """
+    params = _example_params(test_pol, theta0=test_theta0)
+    dense = core.main(dict(params, freq=np.linspace(10e9, 500e9, 100001)))
+    results = core.adaptive_sample(params, 500e9, 10e9, tol=1e-3)
+    freq = results['frequency']
+    assert freq[0] == 10e9 and freq[-1] == 500e9
+    assert np.all(np.diff(freq) > 0)
+    assert len(freq) < 20000
+    exact = core.main(dict(params, freq=freq))
+    for key in dense:
+        if key == 'frequency':
+            continue
+        npt.assert_allclose(results[key], exact[key], rtol=1e-12)
+        interp = np.apply_along_axis(
+            lambda val: np.interp(dense['frequency'], freq, val), -1,
+            results[key])
+        assert np.max(np.abs(interp - dense[key])) < 1.5e-3
+
+def test_adaptive_sample_limits():
+    """Check the evaluation cap and the bad inputs."""
+    params = _example_params('s')
+    with pytest.warns(RuntimeWarning):
+        results = core.adaptive_sample(params, 10e9, 500e9, tol=1e-8,
+                                       max_evals=2000)
+    assert len(results['frequency']) <= 2000
+    pytest.raises(ValueError, core.adaptive_sample, params, 10e9, 10e9)
+    pytest.raises(ValueError, core.adaptive_sample, params, 10e9, 500e9,
+                  n_initial=1)
+    pytest.raises(ValueError, core.adaptive_sample, params, 10e9, 500e9,
+                  max_evals=10)
+
+def test_union_grid():
+    """Check that overlapping bands share frequencies, and split back up
+    into their own grids and stats."""
+    grids = core.band_grids({'low':(10e9, 20e9), 'high':(15e9, 25e9),
+                             'spot':(20e9, 20e9),
+                             'list':[22e9, 12e9]}, nsample=11)
+    npt.assert_equal(grids['spot'], [20e9])
+    npt.assert_equal(grids['list'], [22e9, 12e9])
+    freq, index = core.union_grid(grids)
+    assert len(freq) == len(np.unique(np.concatenate(list(grids.values()))))
+    for name, grid in grids.items():
+        npt.assert_equal(freq[index[name]], grid)
+
+    params = _example_params('s', theta0=np.array([0., 0.4]))
+    results = core.split_bands(core.main(dict(params, freq=freq)), freq,
+                               index)
+    for name, grid in grids.items():
+        expected = core.main(dict(params, freq=grid))
+        npt.assert_equal(results[name]['frequency'], grid)
+        npt.assert_allclose(results[name]['transmittance'],
+                            expected['transmittance'], rtol=1e-12)
+        npt.assert_allclose(results[name]['stats']['mean_transmittance'],
+                            expected['transmittance'].mean(axis=-1),
+                            rtol=1e-12)
+        assert results[name]['stats']['std_transmittance'].shape == (2,)
+
+@pytest.mark.parametrize('test_pol', ['s', 'p'])
+def test_char_matrix(test_pol):
+    """
+    Check that building a model one layer at a time from the terminator
+    side gives the same answer as `main`.
+    """
+    params = _example_params(test_pol)
+    rind = params['rind']
+    freq = params['freq']
+    tand = list(params['tand'])
+    for k, v in params['halpern_layers'].items():
+        tand[k] = core.alpha2tand(freq, v['a'], v['b'], v['n'])
+    product = np.eye(2, dtype=complex)
+    for i in range(len(rind)-2, 0, -1):
+        product = np.matmul(core.char_matrix(freq, rind[i], params['thick'][i],
+                                             tand[i], rind[i+1], rind[0],
+                                             params['theta0'], test_pol),
+                            product)
+    product = np.matmul(core.interface_matrix(rind[0], rind[1],
+                                              params['theta0'], test_pol),
+                        product)
+    t = core.product_rt(product)[1]
+    theta_f = core.snell_angle(rind[-1], rind[0], params['theta0'])
+    npt.assert_allclose(core.t_power(t, rind[0], rind[-1], params['theta0'],
+                                     theta_f),
+                        core.main(params)['transmittance'], rtol=1e-12)
+
+def test_snell_angle():
+    """Check that Snell angles taken straight from the source match `refract`."""
+    n = np.array([1., 1.5, 2.5, 1.2])
+    npt.assert_allclose(core.snell_angle(n, n[0], 0.5), core.refract(n, 0.5))
+
+@pytest.mark.parametrize('test_pol', ['s', 'p'])
+def test_rt_amp_vec(test_pol):
+    """Check the batched amplitudes against `rt_amp`."""
+    n = np.array([1., 1.5, 2., 1.])
+    theta = core.refract(n, 0.2)
+    delta = np.array([[np.inf, 0.1, 2.5, np.inf],
+                      [np.inf, 1.2 + 0.01j, 0.3, np.inf]])
+    t_mat, r_mat = core.make_rt_amp_matrix(n, theta, test_pol)
+    r, t = core.rt_amp_vec(delta, np.diagonal(t_mat, 1), np.diagonal(r_mat, 1))
+    assert r.shape == t.shape == (2,)
+    for i in range(2):
+        expected_r, expected_t = core.rt_amp(n, delta[i], theta, test_pol)
+        npt.assert_allclose(r[i], expected_r)
+        npt.assert_allclose(t[i], expected_t)
 
-@pytest.mark.skip(reason='no way of currently testing this')
-def test_main():
-    """This will function will be incorporated into the integration tests."""
-    pass
+def test_chain_2x2():
+    """
+    Check that the element-wise matrix chain matches multiplying out the
+    characteristic matrices from `layer_matrix`.
+    """
+    rng = np.random.RandomState(0)
+    delta = rng.uniform(0, 10, (5, 4)) + 1j * rng.uniform(0, 0.1, (5, 4))
+    t_amp = rng.uniform(0.5, 1.5, 4)
+    r_amp = rng.uniform(-0.5, 0.5, 4)
+    expected = np.eye(2, dtype=complex)
+    for i in range(4):
+        expected = np.matmul(expected,
+                             core.layer_matrix(delta[:, i], t_amp[i], r_amp[i]))
+    m = core.chain_2x2(np.exp(-1j * delta), 1 / t_amp, r_amp / t_amp)
+    npt.assert_allclose(np.stack(m, axis=-1).reshape(5, 2, 2), expected)
+
+def test_layer_matrix():
+    """Check the single-layer characteristic matrix against `make_m_matrix`."""
+    n = np.array([1., 1.5, 1.])
+    delta = np.array([0., 0.7 + 0.1j, 0.])
+    t_mat, r_mat = core.make_rt_amp_matrix(n, np.zeros(3), 's')
+    expected = core.make_m_matrix(n, t_mat, r_mat, delta)[1]
+    npt.assert_allclose(core.layer_matrix(delta[1], t_mat[1, 2], r_mat[1, 2]),
+                        expected)
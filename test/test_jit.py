@@ -0,0 +1,63 @@
+"""
+Contains tests for the jit.py module, the optional Numba backend.
+"""
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+from armmwave import core
+from armmwave import jit
+from armmwave import layer
+from armmwave import model
+
+def _lossy_model(pol='s'):
+    """A lossy two-layer coating on a substrate, swept in angle."""
+    layers = [layer.Source(),
+              layer.Layer(rind=1.3, thick=3e-4, tand=1e-3),
+              layer.Layer(rind=2.2, thick=2e-4, halperna=3e-2, halpernb=1.5),
+              layer.Layer(rind=3.1, thick=5e-3),
+              layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(10e9, 500e9, nsample=101)
+    test_m.set_angle_range(0., 1., nsample=3)
+    test_m.set_up(layers, pol=pol)
+    return test_m
+
+@pytest.mark.parametrize('test_pol', ['s', 'p', 'u'])
+def test_rt_amp_vec(test_pol):
+    """Check the compiled kernel against the NumPy engine."""
+    pytest.importorskip('numba')
+    test_m = _lossy_model(test_pol)
+    expected = test_m.run(backend='numpy')
+    results = test_m.run(backend='numba')
+    for key in expected:
+        npt.assert_allclose(results[key], expected[key], rtol=1e-10,
+                            atol=1e-15)
+
+def test_rt_amp_vec_without_broadcast():
+    """Check that 1-D interface amplitudes are accepted."""
+    pytest.importorskip('numba')
+    n = np.array([1., 1.5, 2., 1.])
+    theta = core.refract(n, 0.2)
+    delta = np.array([[np.inf, 0.1, 2.5, np.inf],
+                      [np.inf, 1.2 + 0.01j, 0.3, np.inf]])
+    t_amp, r_amp = core.make_rt_interfaces(n, theta, 's')
+    expected = core.rt_amp_vec(delta, t_amp, r_amp)
+    results = jit.rt_amp_vec(delta, t_amp, r_amp)
+    for res, exp in zip(results, expected):
+        assert res.shape == (2,)
+        npt.assert_allclose(res, exp)
+
+def test_fallback_without_numba(monkeypatch):
+    """
+    Check that asking for the numba backend without Numba warns and falls
+    back to the NumPy engine.
+    """
+    monkeypatch.setattr(jit, 'numba', None)
+    test_m = _lossy_model()
+    expected = test_m.run(backend='numpy')
+    with pytest.warns(RuntimeWarning):
+        results = test_m.run(backend='numba')
+    npt.assert_allclose(results['transmittance'], expected['transmittance'])
+    pytest.raises(ImportError, jit.rt_amp_vec, np.zeros((1, 3)),
+                  np.ones(2), np.zeros(2))
@@ -55,3 +55,12 @@ def test_default_repr(test_l, expected):
 def test_not_a_void():
     """Check that we don't mistake a regular layer for The Void."""
     assert not (layer.Source() == layer._Void())
+
+def test_has_halpern():
+    """Check which layers use a Halpern loss tangent."""
+    assert layer.has_halpern(layer.Layer(halperna=1e-2, halpernb=1.))
+    assert layer.has_halpern(layer.Layer(halperna=1, halpernb=2))
+    assert not layer.has_halpern(layer.Layer(halperna=1e-2))
+    assert not layer.has_halpern(layer.Layer(halperna=np.nan, halpernb=1.))
+    assert not layer.has_halpern(layer.Layer())
+    assert not layer.has_halpern(layer.Source())
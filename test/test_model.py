@@ -4,12 +4,18 @@ integration test. The `run` method forces us to check whether all the
 bits and pieces fit together. This is particularly important for the
 two functions in `armm.core` that are difficult to test on their own.
 """
+import asyncio
+import concurrent.futures
 import os
+import threading
+import warnings
 import pytest
 import numpy as np
 import numpy.testing as npt
 from armmwave import model
 from armmwave import layer
+from armmwave import core
+from armmwave import cache
 
 TEST_DIR_LOC = 'test'
 OUTPUT_LOC = os.path.join('{}'.format(TEST_DIR_LOC), 'pytest_armm_output')
@@ -47,14 +53,49 @@ def test_check_freq_bounds(f1, f2, expected_low, expected_high):
     assert test_m.low_freq == expected_low
     assert test_m.high_freq == expected_high
 
-def test_set_angle_range():
-    """
-    Check that we can properly set the angle sweep.
+@pytest.mark.parametrize('a1, a2, nsample, expected', [
+    (0., 0., 0, 'error_condition'),
+    (0., 2., 3, 'error_condition'),
+    (-0.1, 0., 3, 'error_condition'),
+    (0.5, 0., 3, np.array([0.5, 0.25, 0.])),
+    (0.2, 0.2, 50, np.array([0.2])),
+    (0., np.pi/2, 3, np.array([0., np.pi/4, np.pi/2])),
+    ])
+def test_set_angle_range(a1, a2, nsample, expected):
+    """Check that we can properly set the angle sweep"""
+    test_m = model.Model()
+    if isinstance(expected, str):
+        pytest.raises(ValueError, test_m.set_angle_range, a1, a2, nsample)
+        return
+    test_m.set_angle_range(a1, a2, nsample)
+    npt.assert_allclose(test_m.angle_range, expected)
 
-    This test should raise a NotImplementedError for now.
+def test_run_angle_range():
+    """
+    Check that an angle sweep matches one model per angle, and that grazing
+    incidence is handled without warnings.
     """
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=3.1, thick=5e-3), layer.Terminator()]
     test_m = model.Model()
-    pytest.raises(NotImplementedError, test_m.set_angle_range, 0, 0)
+    test_m.set_freq_range(10e9, 300e9, nsample=50)
+    test_m.set_angle_range(0., np.pi/2, nsample=7)
+    test_m.set_up(layers, pol='p')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        results = test_m.run()
+    assert results['transmittance'].shape == (7, 50)
+    for i, angle in enumerate(test_m.angle_range[:-1]):
+        single_m = model.Model()
+        single_m.set_freq_range(10e9, 300e9, nsample=50)
+        single_m.set_up(layers, theta0=angle, pol='p')
+        expected = single_m.run()
+        npt.assert_allclose(results['transmittance'][i],
+                            expected['transmittance'], rtol=1e-12)
+        npt.assert_allclose(results['reflectance'][i],
+                            expected['reflectance'], rtol=1e-10, atol=1e-15)
+    npt.assert_allclose(results['transmittance'][-1], 0., atol=1e-12)
+    npt.assert_allclose(results['reflectance'][-1], 1.)
 
 @pytest.mark.parametrize('test_layers, expected_rind', [
     ([layer.Source(), layer.Layer(rind=999), layer.Terminator(vac=True)], [1., 999., 1.]),
@@ -76,6 +117,20 @@ def test_set_up_basic(test_layers, expected_rind):
     assert test_m.pol == 's'
     assert test_m.incident_angle == 0.
 
+def test_set_up_shared_terminator():
+    """
+    Check that a `Terminator` with `vac=False` takes the index of the layer
+    before it in each model, without being changed, so it can be shared.
+    """
+    term = layer.Terminator(vac=False)
+    first_m = model.Model()
+    first_m.set_up([layer.Source(), layer.Layer(rind=2.), term])
+    second_m = model.Model()
+    second_m.set_up([layer.Source(), layer.Layer(rind=3.), term])
+    assert first_m.rinds[-1] == 2.
+    assert second_m.rinds[-1] == 3.
+    assert term.rind == 1.
+
 def test_set_up_lt3_layers():
     """
     Ensure that we raise an IndexError in the event we try to build a
@@ -119,6 +174,24 @@ def test_set_up_halpern_layer():
     assert list(test_m.halpern_layers.keys()) == [2]
     assert test_m.halpern_layers[2] == {'a' : 999., 'b' : 111., 'n' : 1.}
 
+def test_set_up_interfaces():
+    """
+    Check that `set_up` stores one reflection and transmission amplitude per
+    interface alongside the other simulation parameters.
+    """
+    layers = [layer.Source(), layer.Layer(rind=1.5),
+              layer.Layer(rind=2., halperna=1e-2, halpernb=1.),
+              layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_up(layers, theta0=0.2, pol='p')
+    params = test_m._sim_params
+    assert params['t_amp'].shape == (3,)
+    assert params['r_amp'].shape == (3,)
+    npt.assert_allclose(params['theta'][0], 0.2)
+    npt.assert_allclose(params['r_amp'][1],
+                        core.r_interface(1.5, 2., params['theta'][1],
+                                         params['theta'][2], 'p'))
+
 def test_reset_model():
     """
     Check that we can create a basic model, then return all of the model's
@@ -171,6 +244,123 @@ def test_run_halpern():
     npt.assert_allclose(results['transmittance'], np.ones(results['transmittance'].size))
     npt.assert_allclose(results['reflectance'], np.zeros(results['reflectance'].size))
 
+def test_run_halpern_rerun():
+    """
+    Check that running a model with Halpern layers leaves its loss
+    tangents alone, so running it again gives the same answer.
+    """
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=2., thick=5e-4, halperna=1e-2, halpernb=1.),
+              layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_up(layers)
+    tand = test_m._sim_params['tand'].copy()
+    first = test_m.run()
+    npt.assert_equal(test_m._sim_params['tand'], tand)
+    second = test_m.run()
+    npt.assert_equal(first['transmittance'], second['transmittance'])
+
+@pytest.mark.parametrize('test_pol', ['s', 'u'])
+def test_run_loop_backend(test_pol):
+    """
+    Check that the frequency-by-frequency reference calculation agrees with
+    the default backend.
+    """
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=3.1, thick=5e-3, halperna=1e-2, halpernb=1.),
+              layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(10e9, 300e9, nsample=30)
+    test_m.set_angle_range(0., 0.5, nsample=2)
+    test_m.set_up(layers, pol=test_pol)
+    expected = test_m.run()
+    results = test_m.run(backend='loop')
+    assert sorted(results.keys()) == sorted(expected.keys())
+    for key in expected:
+        npt.assert_allclose(results[key], expected[key], rtol=1e-10,
+                            atol=1e-15)
+
+def test_run_chunked():
+    """
+    Check that running in blocks of frequency, or block by block with
+    `iter_run`, matches a single run.
+    """
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=2., thick=5e-4, halperna=1e-2, halpernb=1.),
+              layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(10e9, 500e9, nsample=101)
+    test_m.set_up(layers)
+    expected = test_m.run()['transmittance']
+    results = test_m.run(chunk_size=17)
+    npt.assert_allclose(results['transmittance'], expected, rtol=1e-12)
+    npt.assert_equal(results['frequency'], test_m.freq_range)
+    blocks = list(test_m.iter_run(chunk_size=17))
+    assert len(blocks) == 6
+    npt.assert_allclose(np.concatenate([b['transmittance'] for b in blocks]),
+                        expected, rtol=1e-12)
+    pytest.raises(ValueError, next, test_m.iter_run())
+
+def test_run_gradient():
+    """Check that `run` can return the layer derivatives."""
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=2., thick=5e-4), layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(10e9, 500e9, nsample=11)
+    test_m.set_up(layers)
+    expected = test_m.run()['transmittance']
+    results = test_m.run(gradient=True)
+    npt.assert_allclose(results['transmittance'], expected, rtol=1e-12)
+    for key in ['transmittance', 'reflectance']:
+        for name in ['thick', 'rind', 'tand']:
+            assert results['{}_grad_{}'.format(key, name)].shape == (11, 2)
+    # Loss only takes power away
+    assert np.all(results['transmittance_grad_tand'] <= 0.)
+
+def test_run_band():
+    """Check that `run` can return band averages, and caches them."""
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=2., thick=5e-4), layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(30e9, 40e9, nsample=20001)
+    test_m.set_up(layers)
+    dense = test_m.run()
+    results = test_m.run(band=(30e9, 40e9))
+    assert 'frequency' not in results
+    npt.assert_allclose(results['transmittance'],
+                        np.mean(dense['transmittance']), atol=1e-5)
+    assert test_m._sim_results is dense
+    results_cache = cache.ResultCache()
+    for i in range(2):
+        cached = test_m.run(band=(30e9, 40e9), cache=results_cache)
+        npt.assert_equal(cached['transmittance'], results['transmittance'])
+    assert results_cache.stats()['hits'] == 1
+    profiled = test_m.run(band=(30e9, 40e9), profile=True)
+    assert 'core.band_average' in profiled['profile']['stages']
+    pytest.raises(ValueError, test_m.run, band=(30e9, 40e9), gradient=True)
+
+def test_run_adaptive():
+    """Check that `run_adaptive` spans the frequency range, and that its
+    results can be saved."""
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=3., thick=1e-2), layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(30e9, 300e9, nsample=10)
+    test_m.set_up(layers)
+    results = test_m.run_adaptive(tol=1e-3)
+    assert results['frequency'][0] == 30e9
+    assert results['frequency'][-1] == 300e9
+    assert len(results['frequency']) > 10
+    assert test_m._sim_results is results
+    pytest.raises(KeyError, model.Model().run_adaptive)
+
+def test_run_bad_backend():
+    """Check that we raise a ValueError for an unknown backend."""
+    layers = [layer.Source(), layer.Layer(), layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_up(layers)
+    pytest.raises(ValueError, test_m.run, backend='fortran')
+
 def test_save():
     """
     Check that we can save the output of a model to a file
@@ -189,3 +379,283 @@ def test_save():
     npt.assert_allclose(dat[1], expected_ts)
     npt.assert_allclose(dat[2], expected_rs)
     os.remove(OUTPUT_LOC)
+
+def test_run_many():
+    """
+    Check that we can run several models of different depths at once, and
+    that each model gets its own results.
+    """
+    models = []
+    for n in [1, 3]:
+        layers = [layer.Source()]
+        layers += [layer.Layer(rind=1.5, thick=1e-3)] * n
+        layers += [layer.Layer(rind=3.1, thick=2e-3), layer.Terminator()]
+        test_m = model.Model()
+        test_m.set_freq_range(10e9, 300e9, nsample=100)
+        test_m.set_up(layers)
+        models.append(test_m)
+    results = model.run_many(models)
+    assert results['transmittance'].shape == (2, 100)
+    for i, test_m in enumerate(models):
+        npt.assert_allclose(test_m._sim_results['transmittance'],
+                            results['transmittance'][i])
+        npt.assert_allclose(test_m.run()['transmittance'],
+                            results['transmittance'][i], rtol=1e-12)
+
+def test_run_bands():
+    """Check that several bands in one pass match a run on each band."""
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-3, tand=1e-3),
+              layer.Layer(rind=3.1, thick=2e-3), layer.Terminator()]
+    bands = {'broad':(10e9, 300e9), 'narrow':(25.5e9, 46e9)}
+    test_m = model.Model()
+    test_m.set_up(layers, pol='u')
+    results_cache = cache.ResultCache()
+    results = test_m.run_bands(bands, nsample=101, cache=results_cache)
+    assert len(test_m._sim_results['frequency']) <= 202
+    for name, (low, high) in bands.items():
+        test_m.set_freq_range(low, high, nsample=101)
+        test_m.set_up(layers, pol='u')
+        expected = test_m.run()
+        for key in expected:
+            npt.assert_allclose(results[name][key], expected[key],
+                                rtol=1e-12)
+        npt.assert_allclose(results[name]['stats']['mean_transmittance'],
+                            np.mean(expected['transmittance']))
+    test_m.run_bands(bands, nsample=101, cache=results_cache)
+    assert results_cache.stats()['hits'] == 1
+    pytest.raises(KeyError, model.Model().run_bands, bands)
+
+def test_run_many_bands():
+    """Check that many models in several bands match `run_bands`."""
+    models = []
+    for n in [1, 3]:
+        layers = [layer.Source()]
+        layers += [layer.Layer(rind=1.5, thick=1e-3)] * n
+        layers += [layer.Layer(rind=3.1, thick=2e-3), layer.Terminator()]
+        test_m = model.Model()
+        test_m.set_up(layers)
+        models.append(test_m)
+    bands = {'a':(30e9, 40e9), 'b':np.array([95e9, 150e9])}
+    results = model.run_many_bands(models, bands, nsample=50)
+    assert results['a']['transmittance'].shape == (2, 50)
+    assert results['b']['stats']['mean_transmittance'].shape == (2,)
+    for i, test_m in enumerate(models):
+        expected = test_m.run_bands(bands, nsample=50)
+        for name in bands:
+            npt.assert_allclose(results[name]['transmittance'][i],
+                                expected[name]['transmittance'], rtol=1e-12)
+    pytest.raises(KeyError, model.run_many_bands, [model.Model()], bands)
+
+def test_run_many_without_set_up():
+    """
+    Check that we raise a KeyError if any model hasn't been set up.
+    """
+    layers = [layer.Source(), layer.Layer(), layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_up(layers)
+    pytest.raises(KeyError, model.run_many, [test_m, model.Model()])
+
+def test_run_many_unpolarized():
+    """
+    Check that each model gets both polarizations when running several
+    unpolarized models at once.
+    """
+    models = []
+    for n in [1, 2]:
+        layers = [layer.Source()]
+        layers += [layer.Layer(rind=1.5, thick=1e-3)] * n
+        layers += [layer.Terminator()]
+        test_m = model.Model()
+        test_m.set_freq_range(10e9, 300e9, nsample=20)
+        test_m.set_up(layers, theta0=0.5, pol='u')
+        models.append(test_m)
+    results = model.run_many(models)
+    assert results['transmittance_p'].shape == (2, 20)
+    for i, test_m in enumerate(models):
+        for key in ['transmittance', 'transmittance_s', 'reflectance_p']:
+            npt.assert_allclose(test_m._sim_results[key], results[key][i])
+
+def _threaded_models():
+    """Models with different frequencies, angles, and polarizations, that
+    share their layer objects."""
+    mat_a = layer.Layer(rind=1.5, thick=1e-3, halperna=1e-2, halpernb=1.)
+    mat_b = layer.Layer(rind=3.1, thick=2e-3, tand=1e-4)
+    term = layer.Terminator(vac=False)
+    models = []
+    for i in range(8):
+        layers = [layer.Source()] + [mat_a, mat_b][:1 + i % 2] + [term]
+        test_m = model.Model()
+        test_m.set_freq_range(10e9, 300e9, nsample=500 + 10 * i)
+        test_m.set_up(layers, theta0=0.05 * i, pol='spu'[i % 3])
+        models.append(test_m)
+    return models
+
+class _GatedExecutor(concurrent.futures.ThreadPoolExecutor):
+    """A thread pool that counts its calculations, and holds them until
+    `gate` is set."""
+    def __init__(self):
+        super().__init__(4)
+        self.gate = threading.Event()
+        self.calls = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.calls += 1
+        def gated():
+            self.gate.wait(10)
+            return fn(*args, **kwargs)
+        return super().submit(gated)
+
+def test_run_async():
+    """Check that `run_async` returns the results of `run` and stores them
+    on the model, and that setting the model up again neither changes them
+    nor leaves them stored."""
+    test_m = _threaded_models()[0]
+    expected = test_m.run()
+    test_m._sim_results = None
+    results = test_m.run_async().result()
+    npt.assert_equal(results['transmittance'], expected['transmittance'])
+    assert test_m._sim_results is results
+
+    test_m._sim_results = None
+    executor = _GatedExecutor()
+    future = test_m.run_async(executor=executor)
+    test_m.set_up(test_m.struct, pol='p')
+    executor.gate.set()
+    results = future.result()
+    executor.shutdown()
+    npt.assert_equal(results['transmittance'], expected['transmittance'])
+    assert test_m._sim_results is None
+    pytest.raises(KeyError, model.Model().run_async)
+
+def test_run_threaded():
+    """Check that many models run across threads match running them one at
+    a time, with the shared pool and with a given executor."""
+    models = _threaded_models()
+    expected = [m.run() for m in models]
+    for executor in [None, concurrent.futures.ThreadPoolExecutor(4)]:
+        results = model.run_threaded(models * 4, executor=executor)
+        for result, exp in zip(results, expected * 4):
+            for key in exp:
+                npt.assert_equal(result[key], exp[key])
+    model.shutdown_executor()
+    model.shutdown_executor()
+    assert model.get_executor() is model.get_executor()
+    model.shutdown_executor()
+
+def test_arun():
+    """Check that `arun` returns the results of `run`, and that identical
+    calls share one calculation but get their own results."""
+    models = _threaded_models()[:2]
+    expected = models[0].run()
+    twin = model.Model()
+    twin.set_freq_range(10e9, 300e9, nsample=500)
+    twin.set_up(models[0].struct, pol='s')
+    executor = _GatedExecutor()
+
+    async def go():
+        tasks = [asyncio.ensure_future(m.arun(executor=executor))
+                 for m in [models[0], twin, models[1]]]
+        await asyncio.sleep(0)
+        executor.gate.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(go())
+    assert executor.calls == 2
+    npt.assert_equal(results[0]['transmittance'], expected['transmittance'])
+    npt.assert_equal(results[1]['transmittance'], expected['transmittance'])
+    assert results[0]['transmittance'] is not results[1]['transmittance']
+    assert twin._sim_results is results[1]
+    asyncio.run(models[0].arun(executor=executor))
+    assert executor.calls == 3
+    executor.shutdown()
+    with pytest.raises(KeyError):
+        asyncio.run(model.Model().arun())
+
+def test_arun_nested_and_stale():
+    """Check that coalesced calls don't share nested results, and that
+    results are dropped if the model is set up again during the call."""
+    test_m, other = _threaded_models()[:2]
+    executor = _GatedExecutor()
+
+    async def go():
+        tasks = [asyncio.ensure_future(test_m.arun(executor=executor,
+                                                   profile=True))
+                 for _ in range(2)]
+        tasks.append(asyncio.ensure_future(other.arun(executor=executor)))
+        await asyncio.sleep(0)
+        other.set_up(other.struct, pol='p')
+        executor.gate.set()
+        return await asyncio.gather(*tasks)
+
+    first, second, stale = asyncio.run(go())
+    executor.shutdown()
+    assert executor.calls == 2
+    assert first['profile'] == second['profile']
+    assert first['profile'] is not second['profile']
+    assert first['profile']['stages'] is not second['profile']['stages']
+    assert 'transmittance' in stale
+    assert other._sim_results is None
+
+def test_arun_cancel():
+    """Check that cancelling one caller leaves a shared calculation running,
+    and cancelling every caller cancels it."""
+    test_m = _threaded_models()[0]
+    executor = _GatedExecutor()
+
+    async def go():
+        first = asyncio.ensure_future(test_m.arun(executor=executor))
+        second = asyncio.ensure_future(test_m.arun(executor=executor))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        executor.gate.set()
+        results = await second
+        assert first.cancelled()
+
+        executor.gate.clear()
+        # Fill the pool, so the next calculation hasn't started
+        blockers = [asyncio.ensure_future(m.arun(executor=executor))
+                    for m in _threaded_models()[1:5]]
+        last = asyncio.ensure_future(test_m.arun(executor=executor))
+        await asyncio.sleep(0)
+        last.cancel()
+        await asyncio.sleep(0)
+        assert not model._in_flight[asyncio.get_running_loop()].get(
+            model._flight_key(test_m._sim_params, {}))
+        executor.gate.set()
+        await asyncio.gather(*blockers)
+        return results
+
+    results = asyncio.run(go())
+    assert 'transmittance' in results
+    assert executor.calls == 6
+    executor.shutdown()
+
+def test_run_many_async():
+    """Check that `run_many_async` matches `run`, and keeps to its
+    concurrency limit."""
+    models = _threaded_models()
+    expected = [m.run() for m in models]
+    running = []
+    peak = []
+
+    class Counting(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            running.append(None)
+            peak.append(len(running))
+            future = super().submit(fn, *args, **kwargs)
+            future.add_done_callback(lambda f: running.pop())
+            return future
+
+    executor = Counting(8)
+    results = asyncio.run(model.run_many_async(models, max_concurrency=2,
+                                               executor=executor))
+    executor.shutdown()
+    assert max(peak) <= 2
+    for result, exp in zip(results, expected):
+        npt.assert_equal(result['transmittance'], exp['transmittance'])
+    results = asyncio.run(model.run_many_async(models))
+    npt.assert_equal(results[-1]['reflectance'], expected[-1]['reflectance'])
+    model.shutdown_executor()
+    with pytest.raises(ValueError):
+        asyncio.run(model.run_many_async(models, max_concurrency=0))
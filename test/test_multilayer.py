@@ -0,0 +1,76 @@
+"""
+Contains tests for the crunching and searching functions in the
+multilayer.py script.
+"""
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+from armmwave import layer
+
+matplotlib = pytest.importorskip('matplotlib')
+matplotlib.use('Agg')
+from armmwave import multilayer
+
+def _lossy_materials():
+    mil = multilayer.mil
+    return [layer.Layer(rind=2.0, tand=3e-2, thick=20*mil, desc='A'),
+            layer.Layer(rind=1.6, tand=5e-2, thick=10*mil, desc='B'),
+            layer.Layer(rind=1.3, tand=1e-2, thick=15*mil, desc='C')]
+
+@pytest.mark.parametrize('topk', [1, 2])
+def test_arc_search_matches_crunch(topk):
+    """Check that the pruned search finds the same best recipes for every
+    total layer count as crunching every configuration."""
+    maxlayers = 4
+    materials = _lossy_materials()
+    crunched = multilayer.arc_crunch_incremental(*materials, maxlayers)
+    expected = {}
+    for n, trans in enumerate(crunched):
+        counts = np.unravel_index(n, (maxlayers+1,) * 3)
+        expected.setdefault(sum(counts), []).append(
+            (np.mean(trans), tuple(int(c) for c in counts)))
+    results = multilayer.arc_search(materials, maxlayers=maxlayers, topk=topk)
+    assert sorted(results) == sorted(expected)
+    for total, recipes in expected.items():
+        recipes.sort(key=lambda entry: -entry[0])
+        assert [c for _, c in results[total]] == [c for _, c in recipes[:topk]]
+        npt.assert_allclose([s for s, _ in results[total]],
+                            [s for s, _ in recipes[:topk]])
+
+def test_arc_search_limits():
+    """Check that no recipe breaks the thickness or layer limits."""
+    materials = _lossy_materials()
+    maxthick = 60 * multilayer.mil
+    results = multilayer.arc_search(materials, maxlayers=4, topk=3,
+                                    maxthick=maxthick, maxtotal=5)
+    assert max(results) <= 5
+    for recipes in results.values():
+        for _, counts in recipes:
+            thick = sum(c * (m.thick + multilayer.bond.thick)
+                        for c, m in zip(counts, materials))
+            assert thick <= maxthick
+
+def test_arc_crunch_parallel():
+    """Check that crunching in worker processes gives the same results, in
+    the same order, as `arc_crunch`."""
+    materials = _lossy_materials()
+    expected = multilayer.arc_crunch(*materials, 1)
+    results = multilayer.arc_crunch_parallel(*materials, 1, max_workers=2,
+                                             chunksize=3)
+    assert len(results) == len(expected)
+    for result, exp in zip(results, expected):
+        npt.assert_allclose(result, exp)
+
+def test_arc_crunch_incremental_cache():
+    """Check that a cache passed back in with new (but equal) layer objects
+    extends the crunch correctly, and that it doesn't hold on to the layers
+    by identity."""
+    cache = {}
+    multilayer.arc_crunch_incremental(*_lossy_materials(), 1, cache=cache)
+    assert all(isinstance(key[0], str) for key in cache['matrices'])
+    results = multilayer.arc_crunch_incremental(*_lossy_materials(), 2,
+                                                cache=cache)
+    expected = multilayer.arc_crunch(*_lossy_materials(), 2)
+    for result, exp in zip(results, expected):
+        npt.assert_allclose(result, exp)
@@ -0,0 +1,90 @@
+"""
+Contains tests for the optimize.py module.
+"""
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+from armmwave import layer
+from armmwave import model
+from armmwave import optimize
+from armmwave import stack
+
+def _template():
+    """A single AR layer on a thick substrate, around 150 GHz."""
+    layers = [layer.Source(), layer.Layer(rind=1.4, thick=5e-4),
+              layer.Layer(rind=3.1, thick=5e-3, tand=1e-4),
+              layer.Terminator(vac=False)]
+    test_m = model.Model()
+    test_m.set_freq_range(140e9, 160e9, nsample=21)
+    test_m.set_up(layers)
+    return test_m
+
+def test_make_variables():
+    """Check that free parameters are flattened in order, and checked."""
+    test_m = _template()
+    variables, bounds = optimize.make_variables(
+        test_m, {2: {'thick':(1e-3, 1e-2)}, 1: {'thick':(1e-4, 1e-3),
+                                              'rind':(1.1, 2.5)}})
+    assert variables == [(1, 'rind'), (1, 'thick'), (2, 'thick')]
+    npt.assert_equal(bounds, [[1.1, 2.5], [1e-4, 1e-3], [1e-3, 1e-2]])
+    pytest.raises(ValueError, optimize.make_variables, test_m,
+                  {0: {'thick':(1e-4, 1e-3)}})
+    pytest.raises(ValueError, optimize.make_variables, test_m,
+                  {1: {'tand':(0., 1e-3)}})
+    pytest.raises(ValueError, optimize.make_variables, test_m,
+                  {1: {'thick':(1e-3, 1e-4)}})
+
+def test_evaluate():
+    """Check that batched screening matches running each model."""
+    test_m = _template()
+    variables, bounds = optimize.make_variables(
+        test_m, {1: {'thick':(1e-4, 1e-3), 'rind':(1.1, 2.5)}})
+    xs = np.array([[1.5, 2e-4], [1.8, 3e-4], [2.2, 9e-4]])
+    scores = optimize.evaluate(test_m, variables, xs, batch_size=2)
+    for x, score in zip(xs, scores):
+        new_m = optimize.build_model(test_m, variables, x)
+        npt.assert_allclose(score, np.mean(new_m.run()['transmittance']),
+                            rtol=1e-12)
+    # The template is left alone
+    assert test_m.rinds[1] == 1.4 and test_m.thicks[1] == 5e-4
+
+@pytest.mark.parametrize('use_stack', [False, True])
+def test_free_last_index(use_stack):
+    """Check that a free index on the last material doesn't move a
+    `vac` False terminator, with a list or a `Stack` template."""
+    test_m = _template()
+    if use_stack:
+        test_m.set_up(stack.Stack(test_m.struct))
+    variables, bounds = optimize.make_variables(test_m,
+                                                {2: {'rind':(2.5, 3.5)}})
+    xs = np.array([[2.6], [3.4]])
+    scores = optimize.evaluate(test_m, variables, xs)
+    for x, score in zip(xs, scores):
+        new_m = optimize.build_model(test_m, variables, x)
+        assert new_m.rinds[-1] == 3.1 and new_m.rinds[-2] == x[0]
+        npt.assert_allclose(score, np.mean(new_m.run()['transmittance']),
+                            rtol=1e-12)
+    assert test_m.struct[-1].rind == 1. and not test_m.struct[-1].vac
+
+def test_optimize_quarter_wave():
+    """
+    Check that the optimizer finds the quarter-wave coating: an index of
+    sqrt(n_substrate) and a thickness of a quarter wavelength in the layer.
+    """
+    test_m = _template()
+    result = optimize.optimize(test_m, {1: {'thick':(1e-4, 1e-3),
+                                            'rind':(1.1, 2.5)}},
+                               n_candidates=500, seed=0)
+    rind, thick = result['x']
+    npt.assert_allclose(rind, np.sqrt(3.1), rtol=1e-3)
+    npt.assert_allclose(thick, 3e8 / 150e9 / (4 * np.sqrt(3.1)), rtol=1e-2)
+    assert result['transmittance'] > 0.99
+    npt.assert_allclose(np.mean(result['model'].run()['transmittance']),
+                        result['transmittance'], rtol=1e-12)
+
+def test_optimize_errors():
+    """Check that the template must be set up, and something must be
+    free."""
+    pytest.raises(KeyError, optimize.optimize, model.Model(), {})
+    pytest.raises(ValueError, optimize.optimize, _template(), {})
@@ -0,0 +1,110 @@
+"""
+Contains tests for the profiling.py module.
+"""
+
+import json
+import threading
+import tracemalloc
+import numpy as np
+from armmwave import core
+from armmwave import layer
+from armmwave import model
+from armmwave import profiling
+
+def _model(pol='s'):
+    layers = [layer.Source(),
+              layer.Layer(rind=1.5, thick=1e-4, halperna=1e-2, halpernb=1.),
+              layer.Layer(rind=3.1, thick=1e-3, tand=1e-4),
+              layer.Terminator()]
+    test_m = model.Model()
+    test_m.set_freq_range(freq1=30e9, freq2=300e9, nsample=100)
+    test_m.set_up(layers, pol=pol)
+    return test_m
+
+def test_inactive():
+    """Check that nothing is recorded without an active `Profiler`."""
+    assert profiling.active() is None
+    with profiling.stage('nothing'):
+        pass
+    profiling.record('nothing', np.zeros(3))
+
+def test_profiler_stages(tmp_path):
+    """Check that the stages, arrays, and memory of a run are recorded."""
+    test_m = _model()
+    with profiling.Profiler() as prof:
+        assert profiling.active() is prof
+        test_m.set_up(test_m.struct)
+        test_m.run()
+    assert profiling.active() is None
+    report = prof.report()
+    for name in ['model.Model.set_up', 'model.Model.run', 'core.main',
+                 'core.halpern_tand', 'core.layer_phase', 'core.rt_amp_vec',
+                 'core.chain_2x2']:
+        assert report['stages'][name]['calls'] == 1
+    assert report['stages']['core.main']['time'] <= report['total_time']
+    assert report['arrays']['delta']['shape'] == [100, 4]
+    assert report['arrays']['delta']['dtype'] == 'complex128'
+    assert report['peak_memory'] > 0
+    assert 'core.main' in str(prof)
+
+    path = str(tmp_path / 'profile.json')
+    text = prof.to_json(path)
+    with open(path) as f:
+        assert json.load(f) == json.loads(text)
+
+def test_profiler_loop():
+    """Check that the reference loop reports one call per frequency."""
+    test_m = _model()
+    with profiling.Profiler(memory=False) as prof:
+        test_m.run(backend='loop')
+    assert prof.peak_memory is None
+    assert prof.stages['core.rt_amp']['calls'] == 100
+    assert prof.stages['core.rt_amp.chain']['calls'] == 100
+
+def test_run_profile():
+    """Check that `Model.run(profile=True)` adds the report to the
+    results, and doesn't change them."""
+    test_m = _model(pol='u')
+    expected = test_m.run()
+    results = test_m.run(profile=True)
+    np.testing.assert_equal(results['transmittance'], expected['transmittance'])
+    assert results['profile']['stages']['core.main']['calls'] == 1
+    assert 'profile' not in test_m.run()
+    json.dumps(results['profile'])
+
+def test_overlapping_profilers():
+    """Check that profilers in different threads share `tracemalloc`
+    without stopping it under each other."""
+    first_in = threading.Event()
+    first_out = threading.Event()
+    profs = {}
+
+    def first():
+        with profiling.Profiler() as prof:
+            first_in.set()
+            _model().run()
+        profs['first'] = prof
+        first_out.set()
+
+    def second():
+        first_in.wait(10)
+        with profiling.Profiler() as prof:
+            first_out.wait(10)
+            profs['tracing'] = tracemalloc.is_tracing()
+            np.ones(100000)
+        profs['second'] = prof
+
+    threads = [threading.Thread(target=f) for f in [first, second]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert profs['tracing']
+    assert profs['first'].peak_memory > 0
+    assert profs['second'].peak_memory > 400000
+    assert not tracemalloc.is_tracing()
+
+def test_profiled_decorator():
+    """Check that decorated functions keep their names and docstrings."""
+    assert core.main.__name__ == 'main'
+    assert 'transmittance/reflectance' in core.main.__doc__
@@ -0,0 +1,107 @@
+"""
+Contains tests for the stack.py module.
+"""
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+from armmwave import layer
+from armmwave import model
+from armmwave import stack
+
+def _layers():
+    return [layer.Source(),
+            layer.Layer(rind=2.2, thick=2e-4, tand=1e-3, desc='A'),
+            layer.Layer(rind=1.5, thick=5e-5, halperna=1e-2, halpernb=1.,
+                        desc='B'),
+            layer.Layer(rind=3.1, thick=1e-3, tand=2e-4, desc='C'),
+            layer.Terminator(vac=False)]
+
+def test_from_layers():
+    """Check that a `Stack` holds the properties of its layers."""
+    layers = _layers()
+    test_s = stack.Stack(layers)
+    assert len(test_s) == 5
+    npt.assert_equal(test_s.rind, [l.rind for l in layers])
+    npt.assert_equal(test_s.thick, [l.thick for l in layers])
+    npt.assert_equal(test_s.data['kind'], [stack.SOURCE, stack.LAYER,
+                                           stack.LAYER, stack.LAYER,
+                                           stack.TERMINATOR])
+    assert test_s[2].halperna == 1e-2
+    assert test_s[1].halperna is None
+    assert test_s[-1].desc == 'Terminator layer'
+    assert [view.desc for view in test_s[1:4]] == ['A', 'B', 'C']
+
+def test_add_mul():
+    """Check that stacks and layers combine with `+` and `*`."""
+    source, mat_a, mat_b, mat_c, term = _layers()
+    test_s = stack.Stack([source]) + (mat_a + mat_b) * 2 + mat_c + term
+    assert isinstance(mat_a + mat_b, stack.Stack)
+    assert [view.desc for view in test_s] == ['Source layer', 'A', 'B', 'A',
+                                              'B', 'C', 'Terminator layer']
+    assert len((mat_a + mat_b) * 0) == 0
+    assert len(3 * stack.Stack([mat_a])) == 3
+    with pytest.raises(TypeError):
+        stack.Stack([mat_a]) + 1.
+
+def test_view_writes():
+    """Check that changing a `LayerView` changes its `Stack`, but not
+    copies of it."""
+    test_s = stack.Stack(_layers())
+    copied = test_s.copy()
+    test_s[1].thick = 3e-4
+    test_s[2].halperna = None
+    assert test_s.thick[1] == 3e-4
+    assert np.isnan(test_s.data['halperna'][2])
+    assert copied[1].thick == 2e-4
+    new_layer = copied[2].to_layer()
+    assert isinstance(new_layer, layer.Layer)
+    assert (new_layer.rind, new_layer.halpernb) == (1.5, 1.)
+    assert isinstance(copied[-1].to_layer(), layer.Terminator)
+
+def test_model_arrays():
+    """Check the terminator index rule and the Halpern layers."""
+    rinds, tands, thicks, halpern_layers = stack.Stack(_layers()).model_arrays()
+    assert rinds[-1] == 3.1
+    assert halpern_layers == {2:{'a':1e-2, 'b':1., 'n':1.5}}
+    vac = stack.Stack(_layers()[:-1] + [layer.Terminator(vac=True)])
+    assert vac.model_arrays()[0][-1] == 1.
+
+@pytest.mark.parametrize('pol', ['s', 'p', 'u'])
+def test_set_up_matches_list(pol):
+    """Check that a `Stack` gives the same model as a list of layers."""
+    list_m = model.Model()
+    list_m.set_freq_range(freq1=30e9, freq2=300e9, nsample=50)
+    list_m.set_up(_layers(), theta0=0.2, pol=pol)
+    stack_m = model.Model()
+    stack_m.set_freq_range(freq1=30e9, freq2=300e9, nsample=50)
+    stack_m.set_up(stack.Stack(_layers()), theta0=0.2, pol=pol)
+    npt.assert_equal(stack_m.rinds, list_m.rinds)
+    assert stack_m.halpern_layers == list_m.halpern_layers
+    expected = list_m.run()
+    results = stack_m.run()
+    for key in expected:
+        npt.assert_allclose(results[key], expected[key])
+
+def test_integer_halpern():
+    """Check that integer Halpern coefficients make a Halpern layer with a
+    list of layers or a `Stack`."""
+    layers = [layer.Source(), layer.Layer(rind=1.5, thick=1e-4, halperna=1,
+                                          halpernb=1), layer.Terminator()]
+    list_m = model.Model()
+    list_m.set_up(layers)
+    stack_m = model.Model()
+    stack_m.set_up(stack.Stack(layers))
+    assert list_m.halpern_layers == stack_m.halpern_layers == \
+        {1:{'a':1., 'b':1., 'n':1.5}}
+
+def test_set_up_errors():
+    """Check that a `Stack` must run from a `Source` to a `Terminator`."""
+    layers = _layers()
+    test_m = model.Model()
+    with pytest.raises(IndexError):
+        test_m.set_up(stack.Stack(layers[:2]))
+    with pytest.raises(TypeError):
+        test_m.set_up(stack.Stack(layers[1:]))
+    with pytest.raises(TypeError):
+        test_m.set_up(stack.Stack(layers[:-1]))
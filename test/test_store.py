@@ -0,0 +1,90 @@
+"""
+Contains tests for the store.py module.
+"""
+
+import threading
+import pytest
+import numpy as np
+import numpy.testing as npt
+from armmwave import store
+
+def test_make_key():
+    """Check that keys are normalized so near-identical floats match."""
+    key = store.make_key(materials=('RO3006', 'Zitex'), layers=np.int64(4),
+                         thick=15 * 2.54e-5, lossless=True)
+    assert key == {'materials':['RO3006', 'Zitex'], 'layers':4,
+                   'thick':0.000381, 'lossless':True}
+    assert store.make_key(thick=0.1 + 0.2) == store.make_key(thick=0.3)
+
+def test_put_get(tmp_path):
+    """Check that results round-trip, and survive reopening the store."""
+    results = store.ResultStore(str(tmp_path))
+    data1 = np.random.RandomState(0).rand(125, 200)
+    data2 = np.arange(10, dtype=np.int32)
+    results.put({'layers':4, 'band':[30, 40]}, data1)
+    results.put({'layers':3, 'band':[30, 40]}, data2)
+    assert len(results) == 2
+    assert {'band':[30, 40], 'layers':4} in results
+    assert {'band':[30, 40], 'layers':5} not in results
+
+    reopened = store.ResultStore(str(tmp_path))
+    loaded = reopened.get({'layers':4, 'band':(30, 40)})
+    assert isinstance(loaded, np.memmap)
+    npt.assert_equal(loaded, data1)
+    npt.assert_equal(reopened.get({'layers':3, 'band':[30, 40]}), data2)
+    assert reopened.get({'layers':3, 'band':[30, 40]}).dtype == np.int32
+    pytest.raises(KeyError, reopened.get, {'layers':5})
+
+def test_put_overwrite(tmp_path):
+    """Check that results are only replaced on request."""
+    results = store.ResultStore(str(tmp_path))
+    results.put({'layers':4}, np.zeros(3))
+    pytest.raises(KeyError, results.put, {'layers':4}, np.ones(3))
+    results.put({'layers':4}, np.ones(3), overwrite=True)
+    assert len(results) == 1
+    npt.assert_equal(results.get({'layers':4}), np.ones(3))
+
+def test_two_writers(tmp_path):
+    """Check that two stores on the same directory keep each other's
+    results."""
+    first = store.ResultStore(str(tmp_path))
+    second = store.ResultStore(str(tmp_path))
+    first.put({'layers':3}, np.zeros(3))
+    second.put({'layers':4}, np.ones(4))
+    pytest.raises(KeyError, second.put, {'layers':3}, np.ones(3))
+    npt.assert_equal(first.get({'layers':4}), np.ones(4))
+    assert len(store.ResultStore(str(tmp_path))) == 2
+
+    def write(n):
+        writer = store.ResultStore(str(tmp_path))
+        for layers in range(10):
+            writer.put({'layers':layers, 'writer':n}, np.full(5, n))
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = store.ResultStore(str(tmp_path))
+    assert len(results) == 42
+    for n in range(4):
+        npt.assert_equal(results.get({'layers':9, 'writer':n}), np.full(5, n))
+
+def test_find(tmp_path):
+    """Check that results can be found by part of their key."""
+    results = store.ResultStore(str(tmp_path))
+    for layers in [3, 4]:
+        for band in [[30, 40], [220, 270]]:
+            results.put({'layers':layers, 'band':band}, np.zeros(2))
+    assert len(results.find(layers=4)) == 2
+    assert results.find(layers=4, band=(220, 270)) == [{'layers':4,
+                                                        'band':[220, 270]}]
+    assert results.find(layers=5) == []
+
+def test_import_npy(tmp_path):
+    """Check that old .npy results can be copied into the store."""
+    data = np.linspace(0., 1., 12).reshape((3, 4))
+    filename = str(tmp_path / 'old.npy')
+    np.save(filename, data)
+    results = store.ResultStore(str(tmp_path / 'store'))
+    results.import_npy(filename, {'layers':4})
+    npt.assert_equal(results.get({'layers':4}), data)